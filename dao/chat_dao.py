@@ -1,48 +1,16 @@
+import asyncio
 from typing import Dict, Any, List
 
-from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import NotFoundError
 
-from dao.init import get_es_client
+from dao.init import get_es_client, get_async_es_client
+from dao.schema import uuid_ids_known
 from models.chat import CHAT_INDEX, CHAT_MESSAGE_INDEX
 
 
-def _ensure_indices(client: Elasticsearch) -> None:
-    """ensure Chat related indices exist"""
-    if not client.indices.exists(index=CHAT_INDEX):
-        client.indices.create(
-            index=CHAT_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "kb_uuid": {"type": "keyword"},
-                    "title": {"type": "text"},
-                    "user_uuid": {"type": "keyword"},
-                    "create_at": {"type": "long"},
-                    "update_at": {"type": "long"},
-                }
-            },
-        )
-
-    if not client.indices.exists(index=CHAT_MESSAGE_INDEX):
-        client.indices.create(
-            index=CHAT_MESSAGE_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "chat_uuid": {"type": "keyword"},
-                    "role": {"type": "keyword"},
-                    "content": {"type": "text"},
-                    "create_at": {"type": "long"},
-                }
-            },
-        )
-
-
-def create_chat(doc: Dict[str, Any]) -> None:
-    client = get_es_client()
-    _ensure_indices(client)
-    client.index(
+async def create_chat(doc: Dict[str, Any]) -> None:
+    client = get_async_es_client()
+    await client.index(
         index=CHAT_INDEX,
         id=doc["uuid"],
         document=doc,
@@ -50,38 +18,37 @@ def create_chat(doc: Dict[str, Any]) -> None:
     )
 
 
-def update_chat(uuid: str, fields: Dict[str, Any]) -> None:
-    client = get_es_client()
-    _ensure_indices(client)
+async def update_chat(uuid: str, fields: Dict[str, Any]) -> None:
+    client = get_async_es_client()
     try:
-        client.update(index=CHAT_INDEX, id=uuid, doc=fields, doc_as_upsert=False)
+        await client.update(index=CHAT_INDEX, id=uuid, doc=fields, doc_as_upsert=False)
     except Exception:
         return
 
 
-def get_chat(uuid: str) -> Dict[str, Any] | None:
-    client = get_es_client()
-    _ensure_indices(client)
+async def get_chat(uuid: str) -> Dict[str, Any] | None:
+    client = get_async_es_client()
     try:
-        res = client.get(index=CHAT_INDEX, id=uuid)
+        res = await client.get(index=CHAT_INDEX, id=uuid)
         return res.get("_source")
     except NotFoundError:
         pass
     except Exception:
         return None
 
+    if await asyncio.to_thread(uuid_ids_known, get_es_client(), CHAT_INDEX):
+        return None
     # fallback for older documents without deterministic IDs
-    res = client.search(index=CHAT_INDEX, query={"term": {"uuid": uuid}})
+    res = await client.search(index=CHAT_INDEX, query={"term": {"uuid": uuid}})
     hits = res.get("hits", {}).get("hits", [])
     if not hits:
         return None
     return hits[0]["_source"]
 
 
-def list_chats(user_uuid: str, page: int, size: int) -> Dict[str, Any]:
-    client = get_es_client()
-    _ensure_indices(client)
-    res = client.search(
+async def list_chats(user_uuid: str, page: int, size: int) -> Dict[str, Any]:
+    client = get_async_es_client()
+    res = await client.search(
         index=CHAT_INDEX,
         from_=(page - 1) * size,
         size=size,
@@ -93,30 +60,27 @@ def list_chats(user_uuid: str, page: int, size: int) -> Dict[str, Any]:
     return {"total": total, "list": items}
 
 
-def delete_chat(uuid: str) -> None:
-    client = get_es_client()
-    _ensure_indices(client)
+async def delete_chat(uuid: str) -> None:
+    client = get_async_es_client()
     try:
-        client.delete(index=CHAT_INDEX, id=uuid)
+        await client.delete(index=CHAT_INDEX, id=uuid)
     except Exception:
         pass
     # delete messages
-    client.delete_by_query(
+    await client.delete_by_query(
         index=CHAT_MESSAGE_INDEX,
         body={"query": {"term": {"chat_uuid": uuid}}},
     )
 
 
-def append_message(doc: Dict[str, Any]) -> None:
-    client = get_es_client()
-    _ensure_indices(client)
-    client.index(index=CHAT_MESSAGE_INDEX, document=doc, refresh="wait_for")
+async def append_message(doc: Dict[str, Any]) -> None:
+    client = get_async_es_client()
+    await client.index(index=CHAT_MESSAGE_INDEX, document=doc, refresh="wait_for")
 
 
-def list_messages(chat_uuid: str, limit: int = 50) -> List[Dict[str, Any]]:
-    client = get_es_client()
-    _ensure_indices(client)
-    res = client.search(
+async def list_messages(chat_uuid: str, limit: int = 50) -> List[Dict[str, Any]]:
+    client = get_async_es_client()
+    res = await client.search(
         index=CHAT_MESSAGE_INDEX,
         size=limit,
         sort=[{"create_at": {"order": "asc"}}],
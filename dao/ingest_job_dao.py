@@ -0,0 +1,68 @@
+from typing import Dict, Any, List, Optional
+
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+from dao.init import get_es_client
+from dao.kb_dao import iter_hits
+from models.ingest import INGEST_JOB_INDEX
+
+
+def create_job(doc: Dict[str, Any]) -> None:
+    client = get_es_client()
+    client.index(index=INGEST_JOB_INDEX, id=doc["uuid"], document=doc, refresh="wait_for")
+
+
+def get_job(uuid: str) -> Optional[Dict[str, Any]]:
+    client = get_es_client()
+    try:
+        return client.get(index=INGEST_JOB_INDEX, id=uuid).get("_source")
+    except NotFoundError:
+        return None
+
+
+def update_job(uuid: str, fields: Dict[str, Any]) -> None:
+    client = get_es_client()
+    client.update(index=INGEST_JOB_INDEX, id=uuid, doc=fields)
+
+
+def claim_job(uuid: str, fields: Dict[str, Any], statuses: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    move a job in one of statuses to fields (e.g. status=running) and count the attempt,
+    unless another process changed it first (optimistic concurrency on _seq_no).
+    returns the claimed job
+    """
+    client = get_es_client()
+    try:
+        hit = client.get(index=INGEST_JOB_INDEX, id=uuid)
+    except NotFoundError:
+        return None
+    source = hit["_source"]
+    if source.get("status") not in statuses:
+        return None
+    fields = {**fields, "attempts": source.get("attempts", 0) + 1}
+    try:
+        client.update(
+            index=INGEST_JOB_INDEX,
+            id=uuid,
+            doc=fields,
+            if_seq_no=hit["_seq_no"],
+            if_primary_term=hit["_primary_term"],
+        )
+    except ConflictError:
+        return None
+    return {**source, **fields}
+
+
+def list_resumable_jobs(stale_before: int) -> List[Dict[str, Any]]:
+    """queued/running jobs whose owner stopped updating them (crashed or restarted), oldest first"""
+    client = get_es_client()
+    query = {
+        "bool": {
+            "filter": [
+                {"terms": {"status": ["queued", "running"]}},
+                {"range": {"update_at": {"lt": stale_before}}},
+            ]
+        }
+    }
+    jobs = [hit["_source"] for hit in iter_hits(client, INGEST_JOB_INDEX, query)]
+    return sorted(jobs, key=lambda job: job.get("create_at", 0))
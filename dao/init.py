@@ -1,4 +1,4 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 from typing import Optional
 from define import ELASTICSEARCH_URL
 import os
@@ -7,6 +7,7 @@ ELASTIC_USERNAME = os.getenv("ELASTIC_USERNAME", "elastic")
 ELASTIC_PASSWORD = os.getenv("ELASTIC_PASSWORD", "")
 
 _es_client: Optional[Elasticsearch] = None
+_async_es_client: Optional[AsyncElasticsearch] = None
 
 
 def get_es_client() -> Elasticsearch:
@@ -20,3 +21,23 @@ def get_es_client() -> Elasticsearch:
             port=9200,
         )
     return _es_client
+
+
+def get_async_es_client() -> AsyncElasticsearch:
+    """get AsyncElasticsearch client for the request path (singleton pattern)"""
+    global _async_es_client
+    if _async_es_client is None:
+        _async_es_client = AsyncElasticsearch(
+            hosts=[ELASTICSEARCH_URL],
+            http_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
+            scheme="http",
+            port=9200,
+        )
+    return _async_es_client
+
+
+async def close_async_es_client() -> None:
+    global _async_es_client
+    if _async_es_client is not None:
+        await _async_es_client.close()
+        _async_es_client = None
@@ -1,65 +1,103 @@
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch.helpers import streaming_bulk, scan, async_streaming_bulk
+
+from dao.init import get_es_client, get_async_es_client
+from dao.schema import get_cluster_version, supports_knn, reset_cluster_version, uuid_ids_known
+from dao.vector_index import LocalVectorIndex
+from define import (
+    ES_BULK_CHUNK_SIZE,
+    ES_BULK_MAX_BYTES,
+    ES_SCAN_PAGE_SIZE,
+    VECTOR_SEARCH_BACKEND,
+    LOCAL_VECTOR_INDEX_ENABLED,
+    LOCAL_VECTOR_INDEX_MAX_MB,
+    LOCAL_VECTOR_INDEX_MAX_VECTORS,
+)
+from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX, EMBEDDING_DIMS
+
+# point in time + _shard_doc tiebreaker needs 7.12+, older clusters use scroll
+PIT_MIN_VERSION = (7, 12)
+
+# per-chunk metadata stored next to each vector (token count, doc title, position in the doc)
+CHUNK_META_FIELDS = ["tokens", "doc_title", "position"]
+# _source fields needed to score a kb in process
+LOCAL_SCORING_FIELDS = ["uuid", "kb_uuid", "doc_uuid", "chunk", "embedding"] + CHUNK_META_FIELDS
+
+_vector_backend: Optional["VectorSearchBackend"] = None
+
+# in-process vectors of hot kbs, kept in sync by the write functions below
+_local_index: Optional[LocalVectorIndex] = None
+if LOCAL_VECTOR_INDEX_ENABLED:
+    _local_index = LocalVectorIndex(
+        dims=EMBEDDING_DIMS,
+        max_bytes=LOCAL_VECTOR_INDEX_MAX_MB * 1024 * 1024,
+        max_vectors=LOCAL_VECTOR_INDEX_MAX_VECTORS,
+    )
 
-from elasticsearch import Elasticsearch
 
-from dao.init import get_es_client
-from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX
+def get_local_vector_index() -> Optional[LocalVectorIndex]:
+    return _local_index
 
 
-def _ensure_indices(client: Elasticsearch) -> None:
-    """
-    make sure kb index is created.
-    use loose mapping, suitable for beginner scenarios.
-    """
-    # kb index
-    if not client.indices.exists(index=KB_INDEX):
-        client.indices.create(
-            index=KB_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                    "description": {"type": "text"},
-                    "create_at": {"type": "long"},
-                    "update_at": {"type": "long"},
-                }
-            },
-        )
+# ==== by id ====
+# documents are indexed with _id == uuid, so reads are realtime GETs and writes
+# single requests. documents written before that keep ES generated ids until
+# `python -m dao.migrations rekey-ids` has run, the search fallbacks cover them.
+# once the index is marked as re-keyed (uuid_ids_known) a missing id is a missing document.
 
-    # doc index
-    if not client.indices.exists(index=KB_DOC_INDEX):
-        client.indices.create(
-            index=KB_DOC_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "kb_uuid": {"type": "keyword"},
-                    "title": {"type": "text"},
-                    "content": {"type": "text"},
-                    "create_at": {"type": "long"},
-                    "update_at": {"type": "long"},
-                }
-            },
-        )
 
-    # vector index (store embeddings for server-side similarity)
-    if not client.indices.exists(index=KB_DOC_EMBED_INDEX):
-        client.indices.create(
-            index=KB_DOC_EMBED_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "kb_uuid": {"type": "keyword"},
-                    "doc_uuid": {"type": "keyword"},
-                    "chunk": {"type": "text"},
-                    "embedding": {
-                        "type": "dense_vector",
-                        "dims": 1536,
-                    },
-                    "create_at": {"type": "long"},
-                }
-            },
-        )
+def _get_hit(client: Elasticsearch, index: str, uuid: str) -> Optional[Dict[str, Any]]:
+    try:
+        return client.get(index=index, id=uuid)
+    except NotFoundError:
+        pass
+    if uuid_ids_known(client, index):
+        return None
+    # fallback for older documents without deterministic IDs
+    res = client.search(index=index, query={"term": {"uuid": uuid}})
+    hits = res.get("hits", {}).get("hits", [])
+    return hits[0] if hits else None
+
+
+async def _aget_hit(client: AsyncElasticsearch, index: str, uuid: str) -> Optional[Dict[str, Any]]:
+    try:
+        return await client.get(index=index, id=uuid)
+    except NotFoundError:
+        pass
+    if await asyncio.to_thread(uuid_ids_known, get_es_client(), index):
+        return None
+    res = await client.search(index=index, query={"term": {"uuid": uuid}})
+    hits = res.get("hits", {}).get("hits", [])
+    return hits[0] if hits else None
+
+
+def _update_by_uuid(client: Elasticsearch, index: str, uuid: str, **kwargs) -> None:
+    try:
+        client.update(index=index, id=uuid, **kwargs)
+        return
+    except NotFoundError:
+        pass
+    hit = _get_hit(client, index, uuid)
+    if hit is not None:
+        client.update(index=index, id=hit["_id"], **kwargs)
+
+
+def _delete_by_uuid(client: Elasticsearch, index: str, uuid: str) -> None:
+    try:
+        client.delete(index=index, id=uuid)
+        return
+    except NotFoundError:
+        pass
+    if uuid_ids_known(client, index):
+        return
+    res = client.search(index=index, query={"term": {"uuid": uuid}})
+    for hit in res.get("hits", {}).get("hits", []):
+        client.delete(index=index, id=hit["_id"])
 
 
 # ==== kb ====
@@ -67,49 +105,95 @@ def _ensure_indices(client: Elasticsearch) -> None:
 
 def create_kb(doc: Dict[str, Any]) -> None:
     client = get_es_client()
-    _ensure_indices(client)
-    client.index(index=KB_INDEX, document=doc)
+    client.index(index=KB_INDEX, id=doc["uuid"], document=doc)
 
 
 def update_kb(uuid: str, fields: Dict[str, Any], owner_uuid: Optional[str] = None) -> None:
     client = get_es_client()
-    _ensure_indices(client)
-    # get _id and then update
-    query: Dict[str, Any] = {"term": {"uuid": uuid}}
-    if owner_uuid:
-        query = {
-            "bool": {
-                "filter": [
-                    {"term": {"uuid": uuid}},
-                    {"term": {"owner_uuid.keyword": owner_uuid}},
-                ]
-            }
-        }
-    res = client.search(index=KB_INDEX, query=query)
-    hits = res.get("hits", {}).get("hits", [])
-    if not hits:
+    if not owner_uuid:
+        _update_by_uuid(client, KB_INDEX, uuid, doc=fields)
         return
-    kb_id = hits[0]["_id"]
-    client.update(index=KB_INDEX, id=kb_id, doc=fields)
+    # owner check and update in one request, kbs of other owners are left untouched
+    _update_by_uuid(
+        client,
+        KB_INDEX,
+        uuid,
+        body={
+            "script": {
+                "source": (
+                    "if (ctx._source.owner_uuid != params.owner_uuid) { ctx.op = 'noop' } "
+                    "else { ctx._source.putAll(params.fields) }"
+                ),
+                "params": {"owner_uuid": owner_uuid, "fields": fields},
+            }
+        },
+    )
 
 
 def delete_kb(uuid: str) -> None:
     client = get_es_client()
-    _ensure_indices(client)
     # delete kb itself
-    res = client.search(index=KB_INDEX, query={"term": {"uuid": uuid}})
-    hits = res.get("hits", {}).get("hits", [])
-    for hit in hits:
-        client.delete(index=KB_INDEX, id=hit["_id"])
+    _delete_by_uuid(client, KB_INDEX, uuid)
 
     # cascade delete doc and vector
     client.delete_by_query(index=KB_DOC_INDEX, body={"query": {"term": {"kb_uuid": uuid}}})
     client.delete_by_query(index=KB_DOC_EMBED_INDEX, body={"query": {"term": {"kb_uuid": uuid}}})
+    if _local_index is not None:
+        _local_index.delete_kb(uuid)
+
+
+# ==== kb generations ====
+# content writes (docs, vectors) bump a counter on the kb doc, cached search results
+# and QA answers keyed by an older generation are never served again. the counter is
+# in ES, so every worker sees it on the kb GET each search does for the owner check.
+# QA write-backs do not bump it, otherwise every answer would flush both caches.
+# bulk writers take invalidate=False when the caller bumps once per group or job: every
+# bump is a scripted update of the one kb doc, concurrent imports would fight over it.
+# a failed bump is only logged, the write stands and cached results expire by their TTL.
+
+_BUMP_SCRIPT = (
+    "ctx._source.generation = (ctx._source.generation == null ? 0 : ctx._source.generation) + 1; "
+    "ctx._source.generation_at = params.now"
+)
+
+
+def _bump_body() -> Dict[str, Any]:
+    return {"script": {"source": _BUMP_SCRIPT, "params": {"now": int(time.time() * 1000)}}}
+
+
+def bump_kb_generation(kb_uuid: str) -> None:
+    client = get_es_client()
+    try:
+        _update_by_uuid(client, KB_INDEX, kb_uuid, body=_bump_body(), retry_on_conflict=5)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] kb {kb_uuid} generation bump failed: {exc}")
+
+
+async def abump_kb_generation(kb_uuid: str) -> None:
+    """async bump_kb_generation"""
+    client = get_async_es_client()
+    try:
+        try:
+            await client.update(index=KB_INDEX, id=kb_uuid, body=_bump_body(), retry_on_conflict=5)
+            return
+        except NotFoundError:
+            pass
+        hit = await _aget_hit(client, KB_INDEX, kb_uuid)
+        if hit is not None:
+            await client.update(index=KB_INDEX, id=hit["_id"], body=_bump_body(), retry_on_conflict=5)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] kb {kb_uuid} generation bump failed: {exc}")
+
+
+def kb_generation(kb: Dict[str, Any]) -> Tuple[str, int]:
+    """(generation, ms of its last bump) of a kb doc. the bump time is part of the
+    generation, so a counter that starts over can not match older cached results"""
+    written_at = kb.get("generation_at") or 0
+    return f"{kb.get('generation') or 0}.{written_at}", written_at
 
 
 def list_kb(page: int, size: int, owner_uuid: str) -> Dict[str, Any]:
     client = get_es_client()
-    _ensure_indices(client)
     res = client.search(
         index=KB_INDEX,
         from_=(page - 1) * size,
@@ -122,24 +206,23 @@ def list_kb(page: int, size: int, owner_uuid: str) -> Dict[str, Any]:
     return {"total": total, "list": items}
 
 
+def _owned_source(hit: Optional[Dict[str, Any]], owner_uuid: Optional[str]) -> Optional[Dict[str, Any]]:
+    if hit is None:
+        return None
+    source = hit["_source"]
+    if owner_uuid and source.get("owner_uuid") != owner_uuid:
+        return None
+    return source
+
+
 def get_kb(uuid: str, owner_uuid: Optional[str] = None) -> Optional[Dict[str, Any]]:
     client = get_es_client()
-    _ensure_indices(client)
-    query: Dict[str, Any] = {"term": {"uuid": uuid}}
-    if owner_uuid:
-        query = {
-            "bool": {
-                "filter": [
-                    {"term": {"uuid": uuid}},
-                    {"term": {"owner_uuid.keyword": owner_uuid}},
-                ]
-            }
-        }
-    res = client.search(index=KB_INDEX, query=query)
-    hits = res.get("hits", {}).get("hits", [])
-    if not hits:
-        return None
-    return hits[0]["_source"]
+    return _owned_source(_get_hit(client, KB_INDEX, uuid), owner_uuid)
+
+
+async def aget_kb(uuid: str, owner_uuid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    client = get_async_es_client()
+    return _owned_source(await _aget_hit(client, KB_INDEX, uuid), owner_uuid)
 
 
 # ==== doc ====
@@ -147,40 +230,61 @@ def get_kb(uuid: str, owner_uuid: Optional[str] = None) -> Optional[Dict[str, An
 
 def create_doc(doc: Dict[str, Any]) -> None:
     client = get_es_client()
-    _ensure_indices(client)
-    client.index(index=KB_DOC_INDEX, document=doc)
+    client.index(index=KB_DOC_INDEX, id=doc["uuid"], document=doc)
+    bump_kb_generation(doc["kb_uuid"])
+
 
+async def acreate_doc(doc: Dict[str, Any], invalidate: bool = True) -> None:
+    """- invalidate: bump the kb generation, False for QA write-backs"""
+    client = get_async_es_client()
+    await client.index(index=KB_DOC_INDEX, id=doc["uuid"], document=doc)
+    if invalidate:
+        await abump_kb_generation(doc["kb_uuid"])
 
-def update_doc(uuid: str, fields: Dict[str, Any]) -> None:
+
+def update_doc(uuid: str, fields: Dict[str, Any], kb_uuid: str) -> None:
     client = get_es_client()
-    _ensure_indices(client)
-    res = client.search(index=KB_DOC_INDEX, query={"term": {"uuid": uuid}})
-    hits = res.get("hits", {}).get("hits", [])
-    if not hits:
-        return
-    doc_id = hits[0]["_id"]
-    client.update(index=KB_DOC_INDEX, id=doc_id, doc=fields)
+    _update_by_uuid(client, KB_DOC_INDEX, uuid, doc=fields)
+    bump_kb_generation(kb_uuid)
 
 
-def delete_doc(uuid: str) -> None:
+def delete_doc(uuid: str, kb_uuid: str) -> None:
     client = get_es_client()
-    _ensure_indices(client)
     # delete doc
-    res = client.search(index=KB_DOC_INDEX, query={"term": {"uuid": uuid}})
-    hits = res.get("hits", {}).get("hits", [])
-    for hit in hits:
-        client.delete(index=KB_DOC_INDEX, id=hit["_id"])
+    _delete_by_uuid(client, KB_DOC_INDEX, uuid)
 
     # delete corresponding vector
     client.delete_by_query(
         index=KB_DOC_EMBED_INDEX,
         body={"query": {"term": {"doc_uuid": uuid}}},
     )
+    if _local_index is not None:
+        _local_index.delete_doc(uuid)
+    bump_kb_generation(kb_uuid)
+
+
+def delete_docs_by_uuid(kb_uuid: str, doc_uuids: List[str], invalidate: bool = True) -> None:
+    """delete many docs of a kb and their vectors, without refresh. see bulk_create_docs for invalidate"""
+    client = get_es_client()
+    for start in range(0, len(doc_uuids), 1000):
+        part = doc_uuids[start:start + 1000]
+        client.delete_by_query(
+            index=KB_DOC_INDEX,
+            body={"query": {"bool": {"filter": [{"term": {"kb_uuid": kb_uuid}}, {"terms": {"uuid": part}}]}}},
+        )
+        client.delete_by_query(
+            index=KB_DOC_EMBED_INDEX,
+            body={"query": {"bool": {"filter": [{"term": {"kb_uuid": kb_uuid}}, {"terms": {"doc_uuid": part}}]}}},
+        )
+    if _local_index is not None:
+        for doc_uuid in doc_uuids:
+            _local_index.delete_doc(doc_uuid, kb_uuid)
+    if invalidate:
+        bump_kb_generation(kb_uuid)
 
 
 def list_docs(kb_uuid: str, page: int, size: int) -> Dict[str, Any]:
     client = get_es_client()
-    _ensure_indices(client)
     res = client.search(
         index=KB_DOC_INDEX,
         from_=(page - 1) * size,
@@ -193,14 +297,26 @@ def list_docs(kb_uuid: str, page: int, size: int) -> Dict[str, Any]:
     return {"total": total, "list": items}
 
 
+def iter_docs(
+    kb_uuid: str,
+    source_includes: Optional[List[str]] = None,
+    page_size: int = ES_SCAN_PAGE_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """stream every doc of a kb in bounded pages, see iter_doc_embeddings"""
+    client = get_es_client()
+    yield from _iter_all(client, KB_DOC_INDEX, {"term": {"kb_uuid": kb_uuid}}, source_includes, page_size)
+
+
 def get_doc(uuid: str) -> Optional[Dict[str, Any]]:
     client = get_es_client()
-    _ensure_indices(client)
-    res = client.search(index=KB_DOC_INDEX, query={"term": {"uuid": uuid}})
-    hits = res.get("hits", {}).get("hits", [])
-    if not hits:
-        return None
-    return hits[0]["_source"]
+    hit = _get_hit(client, KB_DOC_INDEX, uuid)
+    return hit["_source"] if hit is not None else None
+
+
+async def aget_doc(uuid: str) -> Optional[Dict[str, Any]]:
+    client = get_async_es_client()
+    hit = await _aget_hit(client, KB_DOC_INDEX, uuid)
+    return hit["_source"] if hit is not None else None
 
 
 # ==== vector ====
@@ -214,39 +330,498 @@ def upsert_doc_embeddings(
     - delete the existing vector corresponding to doc_uuid
     - then batch write new ones
     """
-    client = get_es_client()
-    _ensure_indices(client)
-    # delete old
-    client.delete_by_query(
-        index=KB_DOC_EMBED_INDEX,
-        body={"query": {"term": {"doc_uuid": doc_uuid}}},
+    errors = bulk_upsert_doc_embeddings(kb_uuid, {doc_uuid: chunks_with_embeddings})
+    if errors:
+        raise RuntimeError(f"failed to write {len(errors)} embeddings: {errors[0]['error']}")
+
+
+async def aupsert_doc_embeddings(
+    kb_uuid: str, doc_uuid: str, chunks_with_embeddings: List[Dict[str, Any]], invalidate: bool = True
+) -> None:
+    """async upsert_doc_embeddings, see acreate_doc for invalidate"""
+    errors = await abulk_upsert_doc_embeddings(kb_uuid, {doc_uuid: chunks_with_embeddings}, invalidate=invalidate)
+    if errors:
+        raise RuntimeError(f"failed to write {len(errors)} embeddings: {errors[0]['error']}")
+
+
+# ==== bulk ====
+
+
+def bulk_write(
+    client: Elasticsearch,
+    actions: List[Dict[str, Any]],
+    chunk_size: int = ES_BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = ES_BULK_MAX_BYTES,
+) -> List[Dict[str, Any]]:
+    """
+    send actions through the _bulk API, split by action count and request size.
+    returns one error entry per failed action (in action order), never raises for item failures.
+    """
+    errors: List[Dict[str, Any]] = []
+    results = streaming_bulk(
+        client,
+        actions,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+        raise_on_exception=False,
     )
-    # 写入新的
-    for item in chunks_with_embeddings:
-        body = {
-            "uuid": item["uuid"],
-            "kb_uuid": kb_uuid,
-            "doc_uuid": doc_uuid,
-            "chunk": item["chunk"],
-            "embedding": item["embedding"],
-            "create_at": item["create_at"],
-        }
-        client.index(index=KB_DOC_EMBED_INDEX, document=body)
+    # streaming_bulk yields one result per action, in the same order
+    for action, (ok, result) in zip(actions, results):
+        if not ok:
+            errors.append(_bulk_error(action, result))
+    return errors
+
+
+async def abulk_write(
+    client: AsyncElasticsearch,
+    actions: List[Dict[str, Any]],
+    chunk_size: int = ES_BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = ES_BULK_MAX_BYTES,
+) -> List[Dict[str, Any]]:
+    """async bulk_write"""
+    errors: List[Dict[str, Any]] = []
+    position = 0
+    async for ok, result in async_streaming_bulk(
+        client,
+        actions,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+        raise_on_exception=False,
+    ):
+        if not ok:
+            errors.append(_bulk_error(actions[position], result))
+        position += 1
+    return errors
+
+
+def _bulk_error(action: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    info = next(iter(result.values()), {})
+    source = action.get("_source") or {}
+    return {
+        "uuid": source.get("uuid", action.get("_id")),
+        "doc_uuid": source.get("doc_uuid"),
+        "status": info.get("status"),
+        "error": info.get("error") or info.get("exception"),
+    }
 
 
-def list_doc_embeddings(kb_uuid: str) -> List[Dict[str, Any]]:
+def bulk_create_docs(
+    docs: List[Dict[str, Any]],
+    chunk_size: int = ES_BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = ES_BULK_MAX_BYTES,
+    invalidate: bool = True,
+) -> List[Dict[str, Any]]:
     """
-    get all doc vectors under a kb (simple implementation: fetch all at once, suitable for small data量）。
+    index many docs with _bulk requests (no refresh, call refresh_kb_indices when done).
+    - invalidate: bump the kb generation, False when the caller bumps once for many writes
+    returns the per-doc errors.
     """
     client = get_es_client()
-    _ensure_indices(client)
-    res = client.search(
-        index=KB_DOC_EMBED_INDEX,
-        size=1000,
-        query={"term": {"kb_uuid": kb_uuid}},
+    actions = [{"_index": KB_DOC_INDEX, "_id": doc["uuid"], "_source": doc} for doc in docs]
+    errors = bulk_write(client, actions, chunk_size, max_chunk_bytes)
+    if invalidate:
+        for kb_uuid in {doc["kb_uuid"] for doc in docs}:
+            bump_kb_generation(kb_uuid)
+    return errors
+
+
+def bulk_upsert_doc_embeddings(
+    kb_uuid: str,
+    chunks_by_doc: Dict[str, List[Dict[str, Any]]],
+    replace_existing: bool = True,
+    chunk_size: int = ES_BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = ES_BULK_MAX_BYTES,
+    invalidate: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    write vectors of many docs with _bulk requests.
+    - replace_existing: delete the old vectors of these docs first (skip it for new docs)
+    - invalidate: see bulk_create_docs
+    returns the per-chunk errors.
+    """
+    client = get_es_client()
+    doc_uuids = list(chunks_by_doc.keys())
+    if replace_existing and doc_uuids:
+        for start in range(0, len(doc_uuids), 1000):
+            client.delete_by_query(
+                index=KB_DOC_EMBED_INDEX,
+                body={"query": {"terms": {"doc_uuid": doc_uuids[start:start + 1000]}}},
+            )
+    errors = bulk_write(client, _embedding_actions(kb_uuid, chunks_by_doc), chunk_size, max_chunk_bytes)
+    _sync_local_index(kb_uuid, chunks_by_doc, errors)
+    if invalidate:
+        bump_kb_generation(kb_uuid)
+    return errors
+
+
+async def abulk_upsert_doc_embeddings(
+    kb_uuid: str,
+    chunks_by_doc: Dict[str, List[Dict[str, Any]]],
+    replace_existing: bool = True,
+    chunk_size: int = ES_BULK_CHUNK_SIZE,
+    max_chunk_bytes: int = ES_BULK_MAX_BYTES,
+    invalidate: bool = True,
+) -> List[Dict[str, Any]]:
+    """async bulk_upsert_doc_embeddings, see acreate_doc for invalidate"""
+    client = get_async_es_client()
+    doc_uuids = list(chunks_by_doc.keys())
+    if replace_existing and doc_uuids:
+        for start in range(0, len(doc_uuids), 1000):
+            await client.delete_by_query(
+                index=KB_DOC_EMBED_INDEX,
+                body={"query": {"terms": {"doc_uuid": doc_uuids[start:start + 1000]}}},
+            )
+    errors = await abulk_write(client, _embedding_actions(kb_uuid, chunks_by_doc), chunk_size, max_chunk_bytes)
+    _sync_local_index(kb_uuid, chunks_by_doc, errors)
+    if invalidate:
+        await abump_kb_generation(kb_uuid)
+    return errors
+
+
+def get_source_doc_hashes(kb_uuid: str, source: str) -> Dict[str, Dict[str, Any]]:
+    """doc uuid -> {uuid, section, content_hash, create_at} of the docs imported from source"""
+    client = get_es_client()
+    query = {"bool": {"filter": [{"term": {"kb_uuid": kb_uuid}}, {"term": {"source": source}}]}}
+    fields = ["uuid", "section", "content_hash", "create_at"]
+    return {doc["uuid"]: doc for doc in _iter_all(client, KB_DOC_INDEX, query, fields, ES_SCAN_PAGE_SIZE)}
+
+
+def get_doc_embedding_ids(doc_uuids: List[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """doc uuid -> {vector uuid -> {doc_title, position}} of its vectors"""
+    client = get_es_client()
+    ids: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    fields = ["uuid", "doc_uuid", "doc_title", "position"]
+    for start in range(0, len(doc_uuids), 1000):
+        query = {"terms": {"doc_uuid": doc_uuids[start:start + 1000]}}
+        for item in _iter_all(client, KB_DOC_EMBED_INDEX, query, fields, ES_SCAN_PAGE_SIZE):
+            ids.setdefault(item["doc_uuid"], {})[item["uuid"]] = {
+                "doc_title": item.get("doc_title"),
+                "position": item.get("position"),
+            }
+    return ids
+
+
+def write_doc_embedding_changes(
+    kb_uuid: str,
+    chunks_by_doc: Dict[str, List[Dict[str, Any]]],
+    stale_by_doc: Dict[str, List[str]],
+    meta_by_doc: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None,
+    invalidate: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    add the new vectors of changed docs and drop their stale ones, the unchanged vectors stay.
+    stale vectors of a doc are only dropped when all of its new vectors were written.
+    - meta_by_doc: doc uuid -> {vector uuid -> chunk metadata} for kept vectors whose
+      doc title or position changed
+    - invalidate: see bulk_create_docs
+    returns the per-chunk errors.
+    """
+    client = get_es_client()
+    errors = bulk_write(client, _embedding_actions(kb_uuid, chunks_by_doc))
+    failed = {error["doc_uuid"] for error in errors}
+    deletes = [
+        {"_op_type": "delete", "_index": KB_DOC_EMBED_INDEX, "_id": chunk_uuid}
+        for doc_uuid, chunk_uuids in stale_by_doc.items()
+        if doc_uuid not in failed
+        for chunk_uuid in chunk_uuids
+    ]
+    if deletes:
+        for error in bulk_write(client, deletes):
+            if error["status"] != 404:
+                print(f"[WARN] failed to delete stale vector {error['uuid']}: {error['error']}")
+    updates = [
+        {"_op_type": "update", "_index": KB_DOC_EMBED_INDEX, "_id": chunk_uuid, "doc": meta}
+        for doc_uuid, metas in (meta_by_doc or {}).items()
+        if doc_uuid not in failed
+        for chunk_uuid, meta in metas.items()
+    ]
+    if updates:
+        for error in bulk_write(client, updates):
+            print(f"[WARN] failed to update vector metadata {error['uuid']}: {error['error']}")
+    if _local_index is not None:
+        # docs changed partially, the kb is loaded again on its next search
+        _local_index.delete_kb(kb_uuid)
+    if invalidate:
+        bump_kb_generation(kb_uuid)
+    return errors
+
+
+def _embedding_actions(kb_uuid: str, chunks_by_doc: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    actions: List[Dict[str, Any]] = []
+    for doc_uuid, items in chunks_by_doc.items():
+        for item in items:
+            actions.append(
+                {
+                    "_index": KB_DOC_EMBED_INDEX,
+                    "_id": item["uuid"],
+                    "_source": {
+                        "uuid": item["uuid"],
+                        "kb_uuid": kb_uuid,
+                        "doc_uuid": doc_uuid,
+                        "chunk": item["chunk"],
+                        "embedding": item["embedding"],
+                        **{key: item[key] for key in CHUNK_META_FIELDS if key in item},
+                        "create_at": item["create_at"],
+                    },
+                }
+            )
+    return actions
+
+
+def _sync_local_index(
+    kb_uuid: str,
+    chunks_by_doc: Dict[str, List[Dict[str, Any]]],
+    errors: List[Dict[str, Any]],
+) -> None:
+    """apply the successfully written vectors to the in-process index"""
+    if _local_index is None:
+        return
+    failed = {error["uuid"] for error in errors}
+    for doc_uuid, items in chunks_by_doc.items():
+        written = [
+            {**item, "kb_uuid": kb_uuid, "doc_uuid": doc_uuid}
+            for item in items
+            if item["uuid"] not in failed
+        ]
+        _local_index.upsert_doc(kb_uuid, doc_uuid, written)
+
+
+def refresh_kb_indices(kb_uuid: str) -> None:
+    """make bulk written docs and vectors visible to search"""
+    client = get_es_client()
+    client.indices.refresh(index=[KB_DOC_INDEX, KB_DOC_EMBED_INDEX])
+    # results cached between the bulk writes and this refresh may miss some of them
+    bump_kb_generation(kb_uuid)
+
+
+# ==== vector search ====
+
+
+def iter_doc_embeddings(
+    kb_uuid: str,
+    source_includes: Optional[List[str]] = None,
+    page_size: int = ES_SCAN_PAGE_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    stream every vector of a kb in bounded pages (point in time + search_after, scroll on old clusters).
+    - source_includes: only fetch these _source fields, e.g. ["uuid", "chunk"] to skip the vectors
+    """
+    client = get_es_client()
+    yield from _iter_all(
+        client, KB_DOC_EMBED_INDEX, {"term": {"kb_uuid": kb_uuid}}, source_includes, page_size
     )
-    hits = res.get("hits", {}).get("hits", [])
-    return [hit["_source"] for hit in hits]
+
+
+def _iter_all(
+    client: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    source_includes: Optional[List[str]],
+    page_size: int,
+) -> Iterator[Dict[str, Any]]:
+    for hit in iter_hits(client, index, query, source_includes, page_size):
+        yield hit["_source"]
+
+
+def iter_hits(
+    client: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    source_includes: Optional[List[str]] = None,
+    page_size: int = ES_SCAN_PAGE_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """raw hits (_id, _source) of a query over a consistent snapshot of the index"""
+    if get_cluster_version(client) >= PIT_MIN_VERSION:
+        yield from _iter_with_pit(client, index, query, source_includes, page_size)
+    else:
+        yield from _iter_with_scroll(client, index, query, source_includes, page_size)
+
+
+def _iter_with_pit(
+    client: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    source_includes: Optional[List[str]],
+    page_size: int,
+) -> Iterator[Dict[str, Any]]:
+    pit_id = client.open_point_in_time(index=index, keep_alive="2m")["id"]
+    try:
+        search_after = None
+        while True:
+            body: Dict[str, Any] = {
+                "size": page_size,
+                "query": query,
+                "pit": {"id": pit_id, "keep_alive": "2m"},
+                "sort": [{"_shard_doc": "asc"}],
+                "track_total_hits": False,
+            }
+            if source_includes is not None:
+                body["_source"] = source_includes
+            if search_after is not None:
+                body["search_after"] = search_after
+            res = client.search(body=body)
+            pit_id = res.get("pit_id", pit_id)
+            hits = res.get("hits", {}).get("hits", [])
+            yield from hits
+            if len(hits) < page_size:
+                return
+            search_after = hits[-1]["sort"]
+    finally:
+        try:
+            client.close_point_in_time(body={"id": pit_id})
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[WARN] failed to close point in time: {exc}")
+
+
+def _iter_with_scroll(
+    client: Elasticsearch,
+    index: str,
+    query: Dict[str, Any],
+    source_includes: Optional[List[str]],
+    page_size: int,
+) -> Iterator[Dict[str, Any]]:
+    kwargs: Dict[str, Any] = {}
+    if source_includes is not None:
+        kwargs["_source_includes"] = source_includes
+    yield from scan(client, index=index, query={"query": query}, size=page_size, scroll="2m", **kwargs)
+
+
+def _load_kb_vectors(kb_uuid: str) -> Optional[Iterator[Dict[str, Any]]]:
+    """all vectors of a kb for the local index, None when the kb is too big to hold"""
+    client = get_es_client()
+    # make pending writes visible, later writes reach the index incrementally
+    client.indices.refresh(index=KB_DOC_EMBED_INDEX)
+    total = client.count(index=KB_DOC_EMBED_INDEX, body={"query": {"term": {"kb_uuid": kb_uuid}}})["count"]
+    if total > LOCAL_VECTOR_INDEX_MAX_VECTORS:
+        return None
+    return iter_doc_embeddings(kb_uuid, source_includes=LOCAL_SCORING_FIELDS)
+
+
+class VectorSearchBackend:
+    """runs a top_k vector query over one kb, returns raw ES hits with cosine similarity as score"""
+
+    name = ""
+
+    def request(self, kb_uuid: str, query_vector: List[float], top_k: int) -> Dict[str, Any]:
+        """keyword arguments of the search call"""
+        raise NotImplementedError
+
+    def parse_hits(self, response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def search(
+        self,
+        client: Elasticsearch,
+        kb_uuid: str,
+        query_vector: List[float],
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        return self.parse_hits(client.search(**self.request(kb_uuid, query_vector, top_k)))
+
+    async def asearch(
+        self,
+        client: AsyncElasticsearch,
+        kb_uuid: str,
+        query_vector: List[float],
+        top_k: int,
+    ) -> List[Dict[str, Any]]:
+        return self.parse_hits(await client.search(**self.request(kb_uuid, query_vector, top_k)))
+
+
+class ScriptScoreBackend(VectorSearchBackend):
+    """exact brute force scoring, works on every 7.x cluster"""
+
+    name = "script_score"
+
+    def request(self, kb_uuid, query_vector, top_k):
+        return {
+            "index": KB_DOC_EMBED_INDEX,
+            "size": top_k,
+            "query": {
+                "script_score": {
+                    "query": {"term": {"kb_uuid": kb_uuid}},
+                    "script": {
+                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                        "params": {"query_vector": query_vector},
+                    },
+                }
+            },
+        }
+
+    def parse_hits(self, response):
+        hits = response.get("hits", {}).get("hits", [])
+        for hit in hits:
+            hit["_score"] = hit.get("_score", 0.0) - 1.0  # remove +1 offset
+        return hits
+
+
+class KnnBackend(VectorSearchBackend):
+    """approximate search on the HNSW indexed embedding field (8.1+)"""
+
+    name = "knn"
+
+    def __init__(self, num_candidates_factor: int = 10, min_num_candidates: int = 100):
+        self.num_candidates_factor = num_candidates_factor
+        self.min_num_candidates = min_num_candidates
+
+    def request(self, kb_uuid, query_vector, top_k):
+        num_candidates = max(top_k * self.num_candidates_factor, self.min_num_candidates)
+        return {
+            "index": KB_DOC_EMBED_INDEX,
+            "body": {
+                "size": top_k,
+                "knn": {
+                    "field": "embedding",
+                    "query_vector": query_vector,
+                    "k": top_k,
+                    "num_candidates": num_candidates,
+                    "filter": {"term": {"kb_uuid": kb_uuid}},
+                },
+            },
+        }
+
+    def parse_hits(self, response):
+        hits = response.get("hits", {}).get("hits", [])
+        for hit in hits:
+            # cosine knn scores are (1 + cosine) / 2
+            hit["_score"] = hit.get("_score", 0.0) * 2.0 - 1.0
+        return hits
+
+
+def is_embedding_field_indexed(client: Elasticsearch) -> bool:
+    mapping = client.indices.get_mapping(index=KB_DOC_EMBED_INDEX)
+    for index_mapping in mapping.values():
+        field = index_mapping.get("mappings", {}).get("properties", {}).get("embedding", {})
+        if field.get("index") is True:
+            return True
+    return False
+
+
+def get_vector_backend(client: Elasticsearch) -> VectorSearchBackend:
+    """
+    pick the vector backend once per process:
+    knn when the cluster supports it and the embedding field is indexed, script_score otherwise
+    """
+    global _vector_backend
+    if _vector_backend is None:
+        if VECTOR_SEARCH_BACKEND == "script_score":
+            _vector_backend = ScriptScoreBackend()
+        elif VECTOR_SEARCH_BACKEND == "knn":
+            _vector_backend = KnnBackend()
+        elif supports_knn(client) and is_embedding_field_indexed(client):
+            _vector_backend = KnnBackend()
+        else:
+            _vector_backend = ScriptScoreBackend()
+    return _vector_backend
+
+
+def reset_vector_backend() -> None:
+    """forget the detected backend/version (e.g. after migrating the vector index)"""
+    global _vector_backend
+    _vector_backend = None
+    reset_cluster_version()
 
 
 def search_doc_embeddings_by_vector(
@@ -255,34 +830,89 @@ def search_doc_embeddings_by_vector(
     top_k: int = 5,
 ) -> List[Dict[str, Any]]:
     """
-    Server-side vector similarity search using script_score cosine similarity.
-    Returns top_k chunks with their scores.
+    Server-side vector similarity search through the selected backend
+    (kNN on an HNSW indexed field, or script_score cosine similarity).
+    Returns top_k chunks with their cosine scores.
     """
+    if _local_index is not None:
+        matrix = _local_index.get_or_load(kb_uuid, _load_kb_vectors)
+        if matrix is not None:
+            return matrix.search(query_vector, top_k)
+
     client = get_es_client()
-    _ensure_indices(client)
-    response = client.search(
-        index=KB_DOC_EMBED_INDEX,
-        size=top_k,
-        query={
-            "script_score": {
-                "query": {"term": {"kb_uuid": kb_uuid}},
-                "script": {
-                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                    "params": {"query_vector": query_vector},
-                },
-            }
-        },
-    )
-    hits = response.get("hits", {}).get("hits", [])
+    backend = get_vector_backend(client)
+    try:
+        hits = backend.search(client, kb_uuid, query_vector, top_k)
+    except RequestError as exc:
+        if backend.name == ScriptScoreBackend.name:
+            raise
+        print(f"[WARN] {backend.name} vector search rejected, retrying with script_score: {exc}")
+        hits = ScriptScoreBackend().search(client, kb_uuid, query_vector, top_k)
+    return _vector_results(hits)
+
+
+async def asearch_doc_embeddings_by_vector(
+    kb_uuid: str,
+    query_vector: List[float],
+    top_k: int = 5,
+) -> List[Dict[str, Any]]:
+    """async search_doc_embeddings_by_vector"""
+    if _local_index is not None:
+        # loading a kb streams it from ES with the sync client, keep that off the event loop
+        matrix = await asyncio.to_thread(_local_index.get_or_load, kb_uuid, _load_kb_vectors)
+        if matrix is not None:
+            return matrix.search(query_vector, top_k)
+
+    # backend detection runs once per process
+    backend = _vector_backend or await asyncio.to_thread(get_vector_backend, get_es_client())
+    client = get_async_es_client()
+    try:
+        hits = await backend.asearch(client, kb_uuid, query_vector, top_k)
+    except RequestError as exc:
+        if backend.name == ScriptScoreBackend.name:
+            raise
+        print(f"[WARN] {backend.name} vector search rejected, retrying with script_score: {exc}")
+        hits = await ScriptScoreBackend().asearch(client, kb_uuid, query_vector, top_k)
+    return _vector_results(hits)
+
+
+def _vector_results(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     results: List[Dict[str, Any]] = []
     for hit in hits:
         source = hit.get("_source", {})
-        score = hit.get("_score", 0.0) - 1.0  # remove +1 offset
-        source["score"] = score
+        source["score"] = hit.get("_score", 0.0)
         results.append(source)
     return results
 
 
+def _chunk_fulltext_body(kb_uuid: str, query: str, top_k: int) -> Dict[str, Any]:
+    """BM25 over the chunk text, so keyword and vector hits rank the same units"""
+    return {
+        "size": top_k,
+        "_source": {"excludes": ["embedding"]},
+        "query": {
+            "bool": {
+                "filter": [{"term": {"kb_uuid": kb_uuid}}],
+                "must": [{"match": {"chunk": {"query": query}}}],
+            }
+        },
+    }
+
+
+async def asearch_chunks_fulltext(
+    kb_uuid: str,
+    query: str,
+    top_k: int = 5,
+) -> List[Dict[str, Any]]:
+    """
+    keyword (BM25) search over kb_doc_embed_index chunks, results look like
+    asearch_doc_embeddings_by_vector results with the BM25 score
+    """
+    client = get_async_es_client()
+    res = await client.search(index=KB_DOC_EMBED_INDEX, body=_chunk_fulltext_body(kb_uuid, query, top_k))
+    return _vector_results(res.get("hits", {}).get("hits", []))
+
+
 def search_docs_fulltext(
     kb_uuid: str,
     query: str,
@@ -292,9 +922,23 @@ def search_docs_fulltext(
     Perform keyword-based full-text search with highlighting.
     """
     client = get_es_client()
-    _ensure_indices(client)
+    res = client.search(index=KB_DOC_INDEX, body=_fulltext_body(kb_uuid, query, top_k))
+    return _fulltext_results(res)
 
-    search_body = {
+
+async def asearch_docs_fulltext(
+    kb_uuid: str,
+    query: str,
+    top_k: int = 5,
+) -> List[Dict[str, Any]]:
+    """async search_docs_fulltext"""
+    client = get_async_es_client()
+    res = await client.search(index=KB_DOC_INDEX, body=_fulltext_body(kb_uuid, query, top_k))
+    return _fulltext_results(res)
+
+
+def _fulltext_body(kb_uuid: str, query: str, top_k: int) -> Dict[str, Any]:
+    return {
         "size": top_k,
         "query": {
             "bool": {
@@ -321,7 +965,8 @@ def search_docs_fulltext(
         },
     }
 
-    res = client.search(index=KB_DOC_INDEX, body=search_body)
+
+def _fulltext_results(res: Dict[str, Any]) -> List[Dict[str, Any]]:
     hits = res.get("hits", {}).get("hits", [])
     results: List[Dict[str, Any]] = []
     for hit in hits:
@@ -0,0 +1,311 @@
+"""
+one-off index migrations, run from the project root:
+
+    python -m dao.migrations bootstrap
+    python -m dao.migrations rekey-ids [--dry-run]
+    python -m dao.migrations knn-reindex [--dry-run]
+"""
+import argparse
+import os
+import socket
+import time
+from typing import Any, Dict, List, Tuple
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+from dao.init import get_es_client
+from dao.kb_dao import reset_vector_backend, is_embedding_field_indexed, iter_hits, bulk_write
+from dao.schema import (
+    INDEX_SCHEMAS,
+    MIGRATION_LOCK_INDEX,
+    bootstrap_schema,
+    embed_index_mapping,
+    supports_knn,
+    get_cluster_version,
+    has_uuid_ids,
+    mark_uuid_ids,
+    physical_index_name,
+    ID_SCHEME,
+)
+from models.chat import CHAT_INDEX
+from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX
+from models.user_basic import USER_BASIC_DAO_INDEX
+
+# indices whose documents are looked up by _id == uuid
+REKEY_INDICES = [KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX, USER_BASIC_DAO_INDEX, CHAT_INDEX]
+REKEY_BATCH = 500
+# a document written while it is copied is copied again, this many times at most
+REKEY_ATTEMPTS = 3
+# the rekey lease is renewed before each index, a crashed owner frees it after this long
+REKEY_LOCK_SECONDS = 3600
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def acquire_lock(client: Elasticsearch, name: str, seconds: int) -> bool:
+    """
+    take the lease doc of a migration, so that one process of the cluster runs it.
+    an expired lease (its owner crashed) is taken over, a live one is left alone
+    """
+    doc = {"owner": f"{socket.gethostname()}:{os.getpid()}", "expires_at": _now_ms() + seconds * 1000}
+    try:
+        client.create(index=MIGRATION_LOCK_INDEX, id=name, document=doc, refresh="wait_for")
+        return True
+    except ConflictError:
+        pass
+    try:
+        hit = client.get(index=MIGRATION_LOCK_INDEX, id=name)
+    except NotFoundError:
+        # released in between: the migration just ran
+        return False
+    if hit["_source"].get("expires_at", 0) > _now_ms():
+        return False
+    try:
+        client.index(
+            index=MIGRATION_LOCK_INDEX,
+            id=name,
+            document=doc,
+            if_seq_no=hit["_seq_no"],
+            if_primary_term=hit["_primary_term"],
+            refresh="wait_for",
+        )
+    except ConflictError:
+        return False
+    return True
+
+
+def renew_lock(client: Elasticsearch, name: str, seconds: int) -> None:
+    client.update(index=MIGRATION_LOCK_INDEX, id=name, doc={"expires_at": _now_ms() + seconds * 1000})
+
+
+def release_lock(client: Elasticsearch, name: str) -> None:
+    try:
+        client.delete(index=MIGRATION_LOCK_INDEX, id=name)
+    except NotFoundError:
+        pass
+
+
+def _mget(client: Elasticsearch, refs: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    """_id -> current (realtime) hit with _seq_no/_primary_term, for (index, _id) refs; missing ones are left out"""
+    if not refs:
+        return {}
+    res = client.mget(body={"docs": [{"_index": index, "_id": _id} for index, _id in refs]})
+    return {doc["_id"]: doc for doc in res["docs"] if doc.get("found")}
+
+
+def _rekey_batch(client: Elasticsearch, index: str, batch: List[Dict[str, Any]], stats: Dict[str, int]) -> None:
+    """
+    copy a batch of documents to _id == uuid and delete the old copies, safe next to live writes:
+    - the documents are read again (realtime) before they are copied, the snapshot may be older
+    - an old copy is only deleted at the _seq_no that was copied. when the application updated it
+      meanwhile (DAOs fall back to it until the uuid copy exists) the delete fails and the next
+      attempt copies it again, over the uuid copy at the _seq_no read with it
+    - a uuid copy written by the application (not only by this migration) wins over the old copy
+    """
+    pending = {hit["_id"]: hit["_index"] for hit in batch}
+    ours = set()  # old _ids whose uuid copy this migration wrote
+    for _ in range(REKEY_ATTEMPTS):
+        olds = _mget(client, [(physical, old_id) for old_id, physical in pending.items()])
+        for old_id in [old_id for old_id in pending if old_id not in olds]:
+            # deleted by the application meanwhile
+            del pending[old_id]
+        if not pending:
+            return
+        uuid_of = {old_id: hit["_source"]["uuid"] for old_id, hit in olds.items()}
+        copies = _mget(client, [(index, uuid) for uuid in uuid_of.values()])
+
+        copy_actions: List[Dict[str, Any]] = []
+        for old_id, hit in olds.items():
+            uuid = uuid_of[old_id]
+            copy = copies.get(uuid)
+            action = {"_index": index, "_id": uuid, "_source": hit["_source"]}
+            if copy is None:
+                copy_actions.append({**action, "_op_type": "create"})
+                ours.add(old_id)
+            elif old_id in ours:
+                copy_actions.append(
+                    {**action, "_op_type": "index", "if_seq_no": copy["_seq_no"], "if_primary_term": copy["_primary_term"]}
+                )
+        old_id_of = {uuid: old_id for old_id, uuid in uuid_of.items()}
+        not_copied = set()
+        for error in bulk_write(client, copy_actions):
+            old_id = old_id_of[error["uuid"]]
+            not_copied.add(old_id)
+            if error["status"] == 409:
+                # the application wrote the uuid copy since it was read, that copy wins
+                ours.discard(old_id)
+
+        deletes = [
+            {
+                "_op_type": "delete",
+                "_index": hit["_index"],
+                "_id": old_id,
+                "if_seq_no": hit["_seq_no"],
+                "if_primary_term": hit["_primary_term"],
+            }
+            for old_id, hit in olds.items()
+            if old_id not in not_copied
+        ]
+        retry = set(not_copied)
+        for error in bulk_write(client, deletes):
+            if error["status"] == 409:
+                retry.add(error["uuid"])
+            elif error["status"] != 404:
+                stats["failed"] += 1
+                print(f"[WARN] rekey {index}: failed to delete {error['uuid']}: {error['error']}")
+                pending.pop(error["uuid"], None)
+        for old_id in list(pending):
+            if old_id not in retry and old_id in olds:
+                stats["rekeyed"] += 1
+                del pending[old_id]
+    stats["failed"] += len(pending)
+
+
+def rekey_index_ids(client: Elasticsearch, index: str, dry_run: bool = False) -> Dict[str, int]:
+    """
+    copy every document whose _id is not its uuid to _id == uuid, then delete the old copy.
+    the candidates come from a point in time snapshot, each batch is re-read and copied with
+    optimistic concurrency (see _rekey_batch), so the application can keep writing meanwhile.
+    """
+    stats = {"scanned": 0, "rekeyed": 0, "failed": 0}
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        if dry_run:
+            stats["rekeyed"] += len(batch)
+            return
+        _rekey_batch(client, index, batch, stats)
+
+    for hit in iter_hits(client, index, {"match_all": {}}, ["uuid"]):
+        stats["scanned"] += 1
+        uuid = (hit.get("_source") or {}).get("uuid")
+        if not uuid or hit["_id"] == uuid:
+            continue
+        batch.append(hit)
+        if len(batch) >= REKEY_BATCH:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    if not dry_run:
+        client.indices.refresh(index=index)
+        if not stats["failed"]:
+            mark_uuid_ids(client, index)
+    return stats
+
+
+def rekey_document_ids(dry_run: bool = False) -> None:
+    """
+    re-key every index that still holds documents with ES generated ids.
+    every worker calls it on startup, the lease doc lets one of them (cluster wide) do the work
+    """
+    client = get_es_client()
+    pending = [
+        index
+        for index in REKEY_INDICES
+        if client.indices.exists(index=index) and not has_uuid_ids(client, index)
+    ]
+    if not pending:
+        return
+    if not dry_run and not acquire_lock(client, "rekey-ids", REKEY_LOCK_SECONDS):
+        print("[INFO] rekey is running in another process, skipped")
+        return
+    try:
+        for index in pending:
+            try:
+                if not dry_run:
+                    renew_lock(client, "rekey-ids", REKEY_LOCK_SECONDS)
+                # another process may have finished it before this one got the lease
+                if has_uuid_ids(client, index):
+                    continue
+                stats = rekey_index_ids(client, index, dry_run=dry_run)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[WARN] rekey {index} failed: {exc}")
+                continue
+            print(f"[INFO] rekey {index}: {stats}")
+    finally:
+        if not dry_run:
+            release_lock(client, "rekey-ids")
+
+
+def migrate_embed_index_to_knn(dry_run: bool = False) -> None:
+    """
+    rebuild kb_doc_embed_index with an HNSW indexed embedding field:
+    - reindex into the next versioned physical index (kb_doc_embed_index_v<n>), which gets the
+      knn mapping of its index template; id_scheme is only kept when the old index had it
+    - atomically drop the old index and point an alias with the old name at the new one
+    writes made while the reindex runs are not copied, run it in a quiet period.
+    """
+    client = get_es_client()
+    if not supports_knn(client):
+        version = ".".join(str(p) for p in get_cluster_version(client))
+        print(f"[ERROR] cluster {version} has no knn search, keep using script_score")
+        return
+    if not client.indices.exists(index=KB_DOC_EMBED_INDEX):
+        print(f"[INFO] {KB_DOC_EMBED_INDEX} does not exist yet, bootstrap creates it with knn mapping")
+        return
+    if is_embedding_field_indexed(client):
+        print(f"[INFO] {KB_DOC_EMBED_INDEX} is already knn indexed, nothing to do")
+        return
+
+    source_indices = list(client.indices.get(index=KB_DOC_EMBED_INDEX).keys())
+    schema_version = INDEX_SCHEMAS[KB_DOC_EMBED_INDEX][0]
+    version = schema_version
+    while client.indices.exists(index=physical_index_name(KB_DOC_EMBED_INDEX, version)):
+        version += 1
+    target = physical_index_name(KB_DOC_EMBED_INDEX, version)
+    uuid_ids = has_uuid_ids(client, KB_DOC_EMBED_INDEX)
+    source_count = client.count(index=KB_DOC_EMBED_INDEX)["count"]
+    print(f"[INFO] reindex {source_count} vectors: {', '.join(source_indices)} -> {target}")
+    if dry_run:
+        return
+
+    # the name matches the kb_doc_embed_index_v* template; the explicit mapping only makes sure of knn
+    client.indices.create(index=target, mappings=embed_index_mapping(knn=True))
+    meta = {"schema_version": schema_version}
+    if uuid_ids:
+        meta["id_scheme"] = ID_SCHEME
+    client.indices.put_mapping(index=target, body={"_meta": meta})
+    client.reindex(
+        body={"source": {"index": KB_DOC_EMBED_INDEX}, "dest": {"index": target}},
+        wait_for_completion=True,
+        refresh=True,
+        request_timeout=3600,
+    )
+    target_count = client.count(index=target)["count"]
+    if target_count != source_count:
+        print(f"[ERROR] copied {target_count} of {source_count} vectors, keeping {KB_DOC_EMBED_INDEX}")
+        return
+
+    # removing the old physical index(es) also drops any alias already named kb_doc_embed_index
+    actions = [{"remove_index": {"index": name}} for name in source_indices]
+    actions.append({"add": {"index": target, "alias": KB_DOC_EMBED_INDEX}})
+    client.indices.update_aliases(body={"actions": actions})
+    reset_vector_backend()
+    print(f"[INFO] {KB_DOC_EMBED_INDEX} now points to {target}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="index migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("bootstrap", help="create/upgrade index templates, indices and aliases")
+    rekey = sub.add_parser("rekey-ids", help="re-key documents so that _id == uuid")
+    rekey.add_argument("--dry-run", action="store_true", help="only count the documents to re-key")
+    knn = sub.add_parser("knn-reindex", help="rebuild the vector index with an HNSW indexed embedding field")
+    knn.add_argument("--dry-run", action="store_true", help="only print what would be done")
+    args = parser.parse_args()
+
+    if args.command == "bootstrap":
+        print(bootstrap_schema(force=True))
+    elif args.command == "rekey-ids":
+        rekey_document_ids(dry_run=args.dry_run)
+    elif args.command == "knn-reindex":
+        migrate_embed_index_to_knn(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
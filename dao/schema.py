@@ -0,0 +1,322 @@
+"""
+index schema bootstrap, run once per process on startup (see router/app.py).
+
+every logical index name (kb_index, chat_index, ...) is an alias onto a versioned
+physical index (kb_index_v1, ...) created from a versioned index template.
+indices created before the bootstrap existed keep their concrete names and are
+upgraded in place with additive mapping changes.
+"""
+import re
+import time
+from typing import Any, Callable, Dict, Optional
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import RequestError
+
+from dao.init import get_es_client
+from models.chat import CHAT_INDEX, CHAT_MESSAGE_INDEX
+from models.ingest import INGEST_JOB_INDEX
+from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX, EMBEDDING_DIMS
+from models.user_basic import USER_BASIC_DAO_INDEX
+
+# top-level knn search with a filter needs 8.1+
+KNN_MIN_VERSION = (8, 1)
+
+# _meta.id_scheme of indices whose documents all use _id == uuid
+ID_SCHEME = "uuid"
+
+# lease docs of migrations that must run in one process of the cluster (see dao/migrations.py)
+MIGRATION_LOCK_INDEX = "migration_lock_index"
+
+# an index not known to use uuid ids is checked again after this long, the rekey runs in one process
+UUID_IDS_RECHECK_SECONDS = 60
+
+_cluster_version: Optional[tuple] = None
+_schema_ready = False
+# indices this process knows to use _id == uuid, and when the others were last checked
+_uuid_id_indices: set = set()
+_uuid_ids_checked_at: Dict[str, float] = {}
+
+
+def get_cluster_version(client: Elasticsearch) -> tuple:
+    """(major, minor) of the connected cluster, fetched once per process"""
+    global _cluster_version
+    if _cluster_version is None:
+        number = client.info()["version"]["number"]
+        parts = [int(p) for p in re.findall(r"\d+", number)[:2]]
+        _cluster_version = tuple(parts + [0] * (2 - len(parts)))
+    return _cluster_version
+
+
+def reset_cluster_version() -> None:
+    global _cluster_version
+    _cluster_version = None
+
+
+def supports_knn(client: Elasticsearch) -> bool:
+    return get_cluster_version(client) >= KNN_MIN_VERSION
+
+
+def embed_index_mapping(knn: bool) -> Dict[str, Any]:
+    """mapping of the vector index, with an HNSW graph on embedding when knn is enabled"""
+    embedding: Dict[str, Any] = {"type": "dense_vector", "dims": EMBEDDING_DIMS}
+    if knn:
+        embedding.update({"index": True, "similarity": "cosine"})
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "kb_uuid": {"type": "keyword"},
+            "doc_uuid": {"type": "keyword"},
+            "chunk": {"type": "text"},
+            "embedding": embedding,
+            # chunk metadata for prompt assembly, stored at ingest
+            "tokens": {"type": "integer", "index": False},
+            "doc_title": {"type": "text", "index": False},
+            "position": {"type": "integer", "index": False},
+            "create_at": {"type": "long"},
+        }
+    }
+
+
+def _kb_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "name": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "description": {"type": "text"},
+            "chunk_tokens": {"type": "integer"},
+            "chunk_overlap": {"type": "integer"},
+            # bumped by content writes, keys cached search results and QA answers
+            "generation": {"type": "long"},
+            "generation_at": {"type": "long"},
+            "create_at": {"type": "long"},
+            "update_at": {"type": "long"},
+        }
+    }
+
+
+def _kb_doc_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "kb_uuid": {"type": "keyword"},
+            "title": {"type": "text"},
+            "content": {"type": "text"},
+            "source": {"type": "keyword"},
+            "section": {"type": "keyword"},
+            "content_hash": {"type": "keyword", "index": False},
+            "create_at": {"type": "long"},
+            "update_at": {"type": "long"},
+        }
+    }
+
+
+def _kb_doc_embed_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return embed_index_mapping(knn=supports_knn(client))
+
+
+def _chat_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "kb_uuid": {"type": "keyword"},
+            "title": {"type": "text"},
+            "user_uuid": {"type": "keyword"},
+            "create_at": {"type": "long"},
+            "update_at": {"type": "long"},
+        }
+    }
+
+
+def _chat_message_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "chat_uuid": {"type": "keyword"},
+            "role": {"type": "keyword"},
+            "content": {"type": "text"},
+            "create_at": {"type": "long"},
+        }
+    }
+
+
+def _user_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "username": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
+            "password": {"type": "keyword"},
+            "email": {"type": "keyword"},
+            "create_at": {"type": "long"},
+            "update_at": {"type": "long"},
+        }
+    }
+
+
+def _ingest_job_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "uuid": {"type": "keyword"},
+            "kb_uuid": {"type": "keyword"},
+            "owner_uuid": {"type": "keyword"},
+            "filename": {"type": "keyword"},
+            "file_path": {"type": "keyword", "index": False},
+            "status": {"type": "keyword"},
+            "stage": {"type": "keyword"},
+            "total": {"type": "integer"},
+            "processed": {"type": "integer"},
+            "success": {"type": "integer"},
+            "failed": {"type": "integer"},
+            "errors": {"type": "text", "index": False},
+            "files": {"type": "object", "enabled": False},
+            "sync": {"type": "boolean"},
+            "changes": {"type": "object", "enabled": False},
+            "message": {"type": "text", "index": False},
+            "attempts": {"type": "integer"},
+            "create_at": {"type": "long"},
+            "update_at": {"type": "long"},
+            "started_at": {"type": "long"},
+            "finished_at": {"type": "long"},
+        }
+    }
+
+
+def _migration_lock_mapping(client: Elasticsearch) -> Dict[str, Any]:
+    return {
+        "properties": {
+            "owner": {"type": "keyword"},
+            "expires_at": {"type": "long"},
+        }
+    }
+
+
+# logical index name -> (schema version, mapping builder).
+# bump the version whenever the mapping changes; additive changes are applied
+# to existing indices on startup, breaking ones need a reindex migration.
+INDEX_SCHEMAS: Dict[str, tuple] = {
+    KB_INDEX: (3, _kb_mapping),
+    KB_DOC_INDEX: (2, _kb_doc_mapping),
+    KB_DOC_EMBED_INDEX: (2, _kb_doc_embed_mapping),
+    CHAT_INDEX: (1, _chat_mapping),
+    CHAT_MESSAGE_INDEX: (1, _chat_message_mapping),
+    USER_BASIC_DAO_INDEX: (1, _user_mapping),
+    INGEST_JOB_INDEX: (3, _ingest_job_mapping),
+    MIGRATION_LOCK_INDEX: (1, _migration_lock_mapping),
+}
+
+
+def physical_index_name(name: str, version: int) -> str:
+    return f"{name}_v{version}"
+
+
+def _ensure_index(client: Elasticsearch, name: str, version: int, build_mapping: Callable) -> str:
+    mapping = build_mapping(client)
+
+    # versioned template, so every physical index of this name gets the same mapping.
+    # indices created from it only ever hold documents keyed by uuid
+    client.indices.put_index_template(
+        name=f"{name}-schema",
+        body={
+            "index_patterns": [f"{name}_v*"],
+            "priority": 100,
+            "version": version,
+            "template": {"mappings": {**mapping, "_meta": {"schema_version": version, "id_scheme": ID_SCHEME}}},
+        },
+    )
+
+    if not client.indices.exists(index=name):
+        target = physical_index_name(name, version)
+        try:
+            client.indices.create(index=target, body={"aliases": {name: {"is_write_index": True}}})
+        except RequestError as exc:
+            # another worker created it first
+            if "resource_already_exists_exception" not in str(exc):
+                raise
+        return "created"
+
+    # existing index (alias or legacy concrete index): apply additive mapping changes
+    metas = _index_metas(client, name)
+    versions = [meta.get("schema_version", 0) for meta in metas.values()]
+    if versions and min(versions) >= version:
+        return "ready"
+    # _meta is replaced as a whole, keep the other keys (id_scheme)
+    base_meta = next(iter(metas.values()), {})
+    mapping["_meta"] = {**base_meta, "schema_version": version}
+    try:
+        client.indices.put_mapping(index=name, body=mapping)
+    except RequestError as exc:
+        print(f"[WARN] {name} mapping can not be upgraded in place to v{version}, reindex needed: {exc}")
+        return "outdated"
+    return "upgraded"
+
+
+def _index_metas(client: Elasticsearch, name: str) -> Dict[str, Dict[str, Any]]:
+    """physical index name -> mapping _meta, for an alias or a concrete index"""
+    current = client.indices.get_mapping(index=name)
+    return {index: dict(body.get("mappings", {}).get("_meta") or {}) for index, body in current.items()}
+
+
+def has_uuid_ids(client: Elasticsearch, name: str) -> bool:
+    """whether every document of the index is known to use _id == uuid"""
+    metas = _index_metas(client, name)
+    return bool(metas) and all(meta.get("id_scheme") == ID_SCHEME for meta in metas.values())
+
+
+def mark_uuid_ids(client: Elasticsearch, name: str) -> None:
+    for index, meta in _index_metas(client, name).items():
+        meta["id_scheme"] = ID_SCHEME
+        client.indices.put_mapping(index=index, body={"_meta": meta})
+    _uuid_id_indices.add(name)
+
+
+def uuid_ids_known(client: Elasticsearch, name: str) -> bool:
+    """
+    has_uuid_ids, cached per process. true stays true (nothing writes generated ids any more),
+    false is asked again at most every UUID_IDS_RECHECK_SECONDS, until the rekey is done
+    """
+    if name in _uuid_id_indices:
+        return True
+    now = time.monotonic()
+    if now - _uuid_ids_checked_at.get(name, float("-inf")) < UUID_IDS_RECHECK_SECONDS:
+        return False
+    _uuid_ids_checked_at[name] = now
+    try:
+        known = has_uuid_ids(client, name)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] id scheme of {name} unknown: {exc}")
+        return False
+    if known:
+        _uuid_id_indices.add(name)
+    return known
+
+
+def bootstrap_schema(client: Optional[Elasticsearch] = None, force: bool = False) -> Dict[str, str]:
+    """create/upgrade every index once, then mark the schema as ready for this process"""
+    global _schema_ready
+    if _schema_ready and not force:
+        return {}
+    client = client or get_es_client()
+    result: Dict[str, str] = {}
+    for name, (version, build_mapping) in INDEX_SCHEMAS.items():
+        result[name] = _ensure_index(client, name, version, build_mapping)
+    _schema_ready = True
+    return result
+
+
+def bootstrap_schema_with_retry(attempts: int = 10, delay: float = 2.0) -> Dict[str, str]:
+    """startup hook: wait for elasticsearch to come up, fail the startup if it never does"""
+    for attempt in range(1, attempts + 1):
+        try:
+            result = bootstrap_schema()
+            print(f"[INFO] index schema ready: {result}")
+            return result
+        except Exception as exc:  # pylint: disable=broad-except
+            if attempt == attempts:
+                raise
+            print(f"[WARN] schema bootstrap failed ({attempt}/{attempts}), retrying: {exc}")
+            time.sleep(delay)
+    return {}
+
+
+def is_schema_ready() -> bool:
+    return _schema_ready
@@ -1,30 +1,12 @@
-from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+
 from dao.init import get_es_client
 from models.user_basic import UserBasicDao, USER_BASIC_DAO_INDEX
 
 
-def _ensure_indices(client: Elasticsearch) -> None:
-    """make sure user index is created"""
-    if not client.indices.exists(index=USER_BASIC_DAO_INDEX):
-        client.indices.create(
-            index=USER_BASIC_DAO_INDEX,
-            mappings={
-                "properties": {
-                    "uuid": {"type": "keyword"},
-                    "username": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                    "password": {"type": "keyword"},
-                    "email": {"type": "keyword"},
-                    "create_at": {"type": "long"},
-                    "update_at": {"type": "long"},
-                }
-            },
-        )
-
-
 def search_user_by_username(username: str) -> dict:
     """search user by username"""
     client = get_es_client()
-    _ensure_indices(client)
     response = client.search(
         index=USER_BASIC_DAO_INDEX,
         query={
@@ -39,7 +21,6 @@ def search_user_by_username(username: str) -> dict:
 def search_user_by_email(email: str) -> dict:
     """search user by email"""
     client = get_es_client()
-    _ensure_indices(client)
     response = client.search(
         index=USER_BASIC_DAO_INDEX,
         query={
@@ -52,9 +33,14 @@ def search_user_by_email(email: str) -> dict:
 
 
 def search_user_by_uuid(uuid: str) -> dict:
-    """search user by uuid"""
+    """search user by uuid, a realtime get shaped like a search response"""
     client = get_es_client()
-    _ensure_indices(client)
+    try:
+        hit = client.get(index=USER_BASIC_DAO_INDEX, id=uuid)
+        return {"hits": {"total": {"value": 1}, "hits": [hit]}}
+    except NotFoundError:
+        pass
+    # fallback for older documents without deterministic IDs
     response = client.search(
         index=USER_BASIC_DAO_INDEX,
         query={
@@ -69,9 +55,9 @@ def search_user_by_uuid(uuid: str) -> dict:
 def create_user(user: UserBasicDao) -> dict:
     """create user"""
     client = get_es_client()
-    _ensure_indices(client)
     response = client.index(
         index=USER_BASIC_DAO_INDEX,
+        id=user.uuid,
         document=user.dict()
     )
     return response
@@ -80,7 +66,6 @@ def create_user(user: UserBasicDao) -> dict:
 def update_user(user_id: str, update_data: dict) -> dict:
     """update user"""
     client = get_es_client()
-    _ensure_indices(client)
     response = client.update(
         index=USER_BASIC_DAO_INDEX,
         id=user_id,
@@ -92,7 +77,6 @@ def update_user(user_id: str, update_data: dict) -> dict:
 def list_users(page: int, size: int) -> dict:
     """list users"""
     client = get_es_client()
-    _ensure_indices(client)
     response = client.search(
         index=USER_BASIC_DAO_INDEX,
         size=size,
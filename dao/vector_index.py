@@ -0,0 +1,263 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+import numpy as np
+
+# rough per-row overhead of the python metadata kept next to each vector
+_ROW_META_BYTES = 256
+# rows converted to float32 at a time while building from a stream
+_BUILD_BATCH = 1000
+
+
+class VectorMatrix:
+    """
+    the vectors of one kb as a single pre-normalized float32 matrix,
+    a query is one matrix-vector product plus argpartition for top_k.
+    """
+
+    def __init__(self, dims: int):
+        self.dims = dims
+        self.items: List[Dict[str, Any]] = []
+        self._buffer = np.zeros((0, dims), dtype=np.float32)
+        self._meta_bytes = 0
+
+    @classmethod
+    def build(
+        cls,
+        vectors: Iterable[Dict[str, Any]],
+        dims: int,
+        max_rows: Optional[int] = None,
+    ) -> Optional["VectorMatrix"]:
+        """
+        build from a (streamed) iterable, converting rows in batches.
+        rows with a different dimension or a zero norm are kept as zero rows,
+        so they score 0.0 like the old python cosine implementation.
+        returns None once more than max_rows rows show up.
+        """
+        index = cls(dims)
+        batch: List[Dict[str, Any]] = []
+        for item in vectors:
+            batch.append(item)
+            if len(batch) >= _BUILD_BATCH:
+                index.add(batch)
+                batch = []
+                if max_rows is not None and len(index) > max_rows:
+                    return None
+        index.add(batch)
+        if max_rows is not None and len(index) > max_rows:
+            return None
+        return index
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._buffer[: len(self.items)]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self._buffer.nbytes) + self._meta_bytes
+
+    def add(self, vectors: List[Dict[str, Any]]) -> None:
+        """append rows, vectors without an embedding are skipped"""
+        items: List[Dict[str, Any]] = []
+        rows: List[Any] = []
+        for item in vectors:
+            emb = item.get("embedding") or []
+            if not emb:
+                continue
+            items.append({k: v for k, v in item.items() if k != "embedding"})
+            rows.append(emb if len(emb) == self.dims else np.zeros(self.dims, dtype=np.float32))
+        if not rows:
+            return
+        new_rows = _normalize_rows(np.asarray(rows, dtype=np.float32))
+        size = len(self.items)
+        needed = size + len(new_rows)
+        if needed > self._buffer.shape[0]:
+            # grow geometrically so repeated small appends stay amortized O(1)
+            capacity = max(needed, self._buffer.shape[0] * 2, 64)
+            grown = np.zeros((capacity, self.dims), dtype=np.float32)
+            grown[:size] = self._buffer[:size]
+            self._buffer = grown
+        self._buffer[size:needed] = new_rows
+        self.items.extend(items)
+        self._meta_bytes += sum(_meta_size(item) for item in items)
+
+    def remove_docs(self, doc_uuids: set) -> int:
+        """drop every row of the given docs, returns the number of removed rows"""
+        keep = [i for i, item in enumerate(self.items) if item.get("doc_uuid") not in doc_uuids]
+        removed = len(self.items) - len(keep)
+        if removed:
+            self._buffer = self.matrix[keep].copy()
+            self.items = [self.items[i] for i in keep]
+            self._meta_bytes = sum(_meta_size(item) for item in self.items)
+        return removed
+
+    def scores(self, query_vector: List[float]) -> np.ndarray:
+        """cosine similarity of the query against every row"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape != (self.dims,) or not len(self.items):
+            return np.zeros(len(self.items), dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0:
+            return np.zeros(len(self.items), dtype=np.float32)
+        return self.matrix @ (query / norm)
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        score_threshold: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """top_k rows by cosine similarity, rows scoring below score_threshold are dropped"""
+        if top_k <= 0 or not len(self.items):
+            return []
+        scores = self.scores(query_vector)
+        candidates = np.arange(len(scores))
+        if score_threshold is not None:
+            candidates = np.flatnonzero(scores >= score_threshold)
+        if len(candidates) > top_k:
+            picked = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = np.sort(candidates[picked])
+        # stable sort keeps insertion order between equal scores
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        results: List[Dict[str, Any]] = []
+        for row in order:
+            item = dict(self.items[row])
+            item["score"] = float(scores[row])
+            results.append(item)
+        return results
+
+
+class LocalVectorIndex:
+    """
+    in-process vector indices of hot kbs:
+    - a kb is loaded on first use, unless it has more than max_vectors vectors
+    - writes are applied incrementally to loaded kbs
+    - whole kbs are evicted in LRU order once max_bytes is exceeded
+    """
+
+    def __init__(self, dims: int, max_bytes: int, max_vectors: int):
+        self.dims = dims
+        self.max_bytes = max_bytes
+        self.max_vectors = max_vectors
+        self._kbs: "OrderedDict[str, VectorMatrix]" = OrderedDict()
+        self._doc_kb: Dict[str, str] = {}
+        # bumped on every write, a load racing with a write is not kept
+        self._write_seq: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get_or_load(
+        self,
+        kb_uuid: str,
+        loader: Callable[[str], Optional[Iterable[Dict[str, Any]]]],
+    ) -> Optional[VectorMatrix]:
+        """
+        loaded matrix of the kb, loader streams all its vectors
+        (or returns None when the kb should not be held in memory).
+        """
+        with self._lock:
+            matrix = self._kbs.get(kb_uuid)
+            if matrix is not None:
+                self._kbs.move_to_end(kb_uuid)
+                self.hits += 1
+                return matrix
+            seq = self._write_seq.get(kb_uuid, 0)
+
+        # load outside the lock, ES reads can be slow
+        vectors = loader(kb_uuid)
+        if vectors is None:
+            return None
+        matrix = VectorMatrix.build(vectors, self.dims, max_rows=self.max_vectors)
+        if matrix is None:
+            return None
+
+        with self._lock:
+            self.loads += 1
+            if self._write_seq.get(kb_uuid, 0) != seq or kb_uuid in self._kbs:
+                return matrix
+            self._kbs[kb_uuid] = matrix
+            for item in matrix.items:
+                self._doc_kb[item.get("doc_uuid")] = kb_uuid
+            self._evict()
+            return matrix
+
+    def upsert_doc(self, kb_uuid: str, doc_uuid: str, vectors: List[Dict[str, Any]]) -> None:
+        """replace the vectors of a doc"""
+        with self._lock:
+            self._bump(kb_uuid)
+            matrix = self._kbs.get(kb_uuid)
+            if matrix is None:
+                return
+            matrix.remove_docs({doc_uuid})
+            matrix.add(vectors)
+            self._doc_kb[doc_uuid] = kb_uuid
+            if len(matrix) > self.max_vectors:
+                self._drop(kb_uuid)
+            self._evict()
+
+    def delete_doc(self, doc_uuid: str, kb_uuid: Optional[str] = None) -> None:
+        with self._lock:
+            kb_uuid = kb_uuid or self._doc_kb.get(doc_uuid)
+            self._doc_kb.pop(doc_uuid, None)
+            if not kb_uuid:
+                return
+            self._bump(kb_uuid)
+            matrix = self._kbs.get(kb_uuid)
+            if matrix is not None:
+                matrix.remove_docs({doc_uuid})
+
+    def delete_kb(self, kb_uuid: str) -> None:
+        with self._lock:
+            self._bump(kb_uuid)
+            self._drop(kb_uuid)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._kbs.clear()
+            self._doc_kb.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kbs": len(self._kbs),
+                "vectors": sum(len(m) for m in self._kbs.values()),
+                "bytes": sum(m.nbytes for m in self._kbs.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def _bump(self, kb_uuid: str) -> None:
+        self._write_seq[kb_uuid] = self._write_seq.get(kb_uuid, 0) + 1
+
+    def _drop(self, kb_uuid: str) -> None:
+        matrix = self._kbs.pop(kb_uuid, None)
+        if matrix is None:
+            return
+        for item in matrix.items:
+            self._doc_kb.pop(item.get("doc_uuid"), None)
+
+    def _evict(self) -> None:
+        total = sum(m.nbytes for m in self._kbs.values())
+        while total > self.max_bytes and self._kbs:
+            kb_uuid, matrix = next(iter(self._kbs.items()))
+            total -= matrix.nbytes
+            self._drop(kb_uuid)
+            self.evictions += 1
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _meta_size(item: Dict[str, Any]) -> int:
+    return len(item.get("chunk") or "") + _ROW_META_BYTES
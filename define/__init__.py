@@ -7,3 +7,97 @@ JWT_SECRET = os.getenv("JWT_SECRET", "kb-secret")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 ELASTICSEARCH_URL = os.getenv("ELASTICSEARCH_URL", "http://127.0.0.1:9200")
 
+# embedding batching (OpenAI accepts up to 2048 inputs / ~300k tokens per request)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "200000"))
+
+# embedding cache: in-process LRU tier + optional SQLite tier (empty path disables it)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "5000"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "")
+EMBEDDING_CACHE_DB_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_DB_MAX_ITEMS", "200000"))
+
+# search result cache: LRU of SEARCH_CACHE_SIZE results kept SEARCH_CACHE_TTL seconds (0 disables it);
+# results computed within SEARCH_CACHE_SETTLE seconds of a kb write are not cached (ES refresh interval)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2000"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_SETTLE = float(os.getenv("SEARCH_CACHE_SETTLE", "1.0"))
+
+# QA answer cache: a question at least QA_ANSWER_CACHE_SIMILARITY (cosine) similar to one answered
+# before for the same kb, top_k and mode gets that answer; QA_ANSWER_CACHE_SIZE answers kept
+# QA_ANSWER_CACHE_TTL seconds (0 disables it), any kb write invalidates them
+QA_ANSWER_CACHE_SIZE = int(os.getenv("QA_ANSWER_CACHE_SIZE", "1000"))
+QA_ANSWER_CACHE_TTL = int(os.getenv("QA_ANSWER_CACHE_TTL", "3600"))
+QA_ANSWER_CACHE_SIMILARITY = float(os.getenv("QA_ANSWER_CACHE_SIMILARITY", "0.95"))
+
+# elasticsearch _bulk request limits
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", "500"))
+ES_BULK_MAX_BYTES = int(os.getenv("ES_BULK_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# vector search backend: auto (knn when the cluster/mapping supports it) | knn | script_score
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "auto")
+
+# optional in-process vector index for hot kbs (whole kbs evicted in LRU order).
+# writes are applied by the process that makes them, so use it with a single worker per host.
+LOCAL_VECTOR_INDEX_ENABLED = os.getenv("LOCAL_VECTOR_INDEX_ENABLED", "false").lower() == "true"
+LOCAL_VECTOR_INDEX_MAX_MB = int(os.getenv("LOCAL_VECTOR_INDEX_MAX_MB", "512"))
+LOCAL_VECTOR_INDEX_MAX_VECTORS = int(os.getenv("LOCAL_VECTOR_INDEX_MAX_VECTORS", "50000"))
+
+# page size when streaming all vectors of a kb (point in time / scroll)
+ES_SCAN_PAGE_SIZE = int(os.getenv("ES_SCAN_PAGE_SIZE", "500"))
+
+# re-key documents with ES generated ids to _id == uuid in the background after startup
+ES_REKEY_IDS_ON_STARTUP = os.getenv("ES_REKEY_IDS_ON_STARTUP", "true").lower() == "true"
+
+# bounded worker pools for blocking work: workers, and calls allowed to wait beyond them
+# (a full pool answers 503 instead of queueing without limit)
+CRYPTO_POOL_WORKERS = int(os.getenv("CRYPTO_POOL_WORKERS", "4"))
+CRYPTO_POOL_QUEUE = int(os.getenv("CRYPTO_POOL_QUEUE", "64"))
+PARSE_POOL_WORKERS = int(os.getenv("PARSE_POOL_WORKERS", "2"))
+PARSE_POOL_QUEUE = int(os.getenv("PARSE_POOL_QUEUE", "8"))
+
+# background import jobs: uploads are spooled to INGEST_UPLOAD_DIR (shared by all workers of a host),
+# jobs not updated for INGEST_JOB_STALE_SECONDS are picked up again by a periodic scan
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "data/uploads")
+INGEST_JOB_STALE_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS", "120"))
+INGEST_JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+# upload size limits: one file (413 above it), and all files spooled in INGEST_UPLOAD_DIR (503 above it)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_DIR_MAX_BYTES = int(os.getenv("UPLOAD_DIR_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# zip/tar imports: members are parsed by ARCHIVE_PARSE_PROCESSES processes (0 = one per core),
+# limits guard against archive bombs
+ARCHIVE_PARSE_PROCESSES = int(os.getenv("ARCHIVE_PARSE_PROCESSES", "0"))
+ARCHIVE_MAX_MEMBERS = int(os.getenv("ARCHIVE_MAX_MEMBERS", "10000"))
+ARCHIVE_MAX_UNPACKED_BYTES = int(os.getenv("ARCHIVE_MAX_UNPACKED_BYTES", str(4 * 1024 * 1024 * 1024)))
+# rows per pandas chunk when parsing csv imports
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "10000"))
+
+# OCR of scanned PDFs: pages are rasterized OCR_PAGE_BATCH at a time and run by
+# OCR_PAGE_WORKERS parallel tesseract processes (0 = one per core, split between archive parse processes)
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "chi_sim+eng")
+OCR_PAGE_TIMEOUT = int(os.getenv("OCR_PAGE_TIMEOUT", "120"))
+OCR_PAGE_WORKERS = int(os.getenv("OCR_PAGE_WORKERS", "0"))
+OCR_PAGE_BATCH = int(os.getenv("OCR_PAGE_BATCH", "0"))
+# chunking: CHUNKER splits docs into chunks of CHUNK_MAX_TOKENS for embedding (structure | fixed),
+# each repeating up to CHUNK_OVERLAP_TOKENS of the previous one; kbs can override both.
+# parsers split long pages into docs of PARSE_PART_MAX_TOKENS
+CHUNKER = os.getenv("CHUNKER", "structure")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+PARSE_PART_MAX_TOKENS = int(os.getenv("PARSE_PART_MAX_TOKENS", "800"))
+
+# QA prompt: retrieved chunks are packed into QA_CONTEXT_MAX_TOKENS, chunks at least
+# QA_CONTEXT_DUPLICATE_SIMILARITY similar to a picked one are dropped
+QA_CONTEXT_MAX_TOKENS = int(os.getenv("QA_CONTEXT_MAX_TOKENS", "3000"))
+QA_CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("QA_CONTEXT_DUPLICATE_SIMILARITY", "0.9"))
+
+# retrieval: QA_RETRIEVAL_MODE is vector | hybrid (BM25 + vector fused by reciprocal rank,
+# RRF_K damps the weight of top ranks); each retriever returns at least HYBRID_CANDIDATES
+QA_RETRIEVAL_MODE = os.getenv("QA_RETRIEVAL_MODE", "vector")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# PDF pages whose text layer has fewer characters than this are OCRed
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "20"))
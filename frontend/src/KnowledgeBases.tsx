@@ -10,6 +10,18 @@ type KnowledgeBase = {
   update_at: number;
 };
 
+type ImportJob = {
+  status: "queued" | "running" | "succeeded" | "failed";
+  stage: string;
+  total: number;
+  processed: number;
+  success: number;
+  failed: number;
+  message?: string | null;
+};
+
+const IMPORT_POLL_MS = 1500;
+
 type Props = {
   token: string;
   selectedKbUuid?: string | null;
@@ -27,6 +39,7 @@ const KnowledgeBasesPage = ({ token, selectedKbUuid, onSelectKb }: Props) => {
   const [total, setTotal] = useState(0);
   const [exportingKb, setExportingKb] = useState<string | null>(null);
   const [importingKb, setImportingKb] = useState<string | null>(null);
+  const [importProgress, setImportProgress] = useState<string | null>(null);
 
   const hasToken = token.trim().length > 0;
 
@@ -146,7 +159,7 @@ const KnowledgeBasesPage = ({ token, selectedKbUuid, onSelectKb }: Props) => {
     if (!hasToken) return;
     const input = document.createElement("input");
     input.type = "file";
-    input.accept = ".md,.markdown,.txt,.csv,.docx,.pptx,.pdf";
+    input.accept = ".md,.markdown,.txt,.csv,.docx,.pptx,.pdf,.zip,.tar,.tgz,.gz";
     input.onchange = async (event) => {
       const file = (event.target as HTMLInputElement).files?.[0];
       if (!file) {
@@ -162,10 +175,28 @@ const KnowledgeBasesPage = ({ token, selectedKbUuid, onSelectKb }: Props) => {
           formData,
           { headers }
         );
-        const summary = res.data?.data;
-        const success = summary?.success ?? 0;
-        const totalDocs = summary?.total ?? 0;
-        const failed = summary?.failed ?? Math.max(0, totalDocs - success);
+        const jobUuid = res.data?.data?.job_uuid;
+        // the import runs as a background job, poll until it is done
+        let job: ImportJob | undefined;
+        while (jobUuid) {
+          await new Promise((resolve) => setTimeout(resolve, IMPORT_POLL_MS));
+          const jobRes = await axios.get(
+            `${API_BASE}/api/v1/kb/import/job/${jobUuid}`,
+            { headers }
+          );
+          job = jobRes.data?.data as ImportJob | undefined;
+          if (!job || job.status === "succeeded" || job.status === "failed") {
+            break;
+          }
+          setImportProgress(
+            job.total ? `${job.processed}/${job.total}` : job.stage
+          );
+        }
+        if (job?.status === "failed") {
+          throw new Error(job.message || "Import failed");
+        }
+        const success = job?.success ?? 0;
+        const failed = job?.failed ?? 0;
         window.alert(
           `Import finished\nSuccess: ${success}\nFailed: ${failed}`
         );
@@ -178,6 +209,7 @@ const KnowledgeBasesPage = ({ token, selectedKbUuid, onSelectKb }: Props) => {
         setError(String(msg));
       } finally {
         setImportingKb(null);
+        setImportProgress(null);
         input.value = "";
       }
     };
@@ -328,7 +360,9 @@ const KnowledgeBasesPage = ({ token, selectedKbUuid, onSelectKb }: Props) => {
                           onClick={() => handleImport(kb.uuid)}
                           disabled={importingKb === kb.uuid}
                         >
-                          {importingKb === kb.uuid ? "Importing…" : "Import"}
+                          {importingKb === kb.uuid
+                            ? `Importing… ${importProgress ?? ""}`.trim()
+                            : "Import"}
                         </button>
                         <button
                           style={styles.exportBtn}
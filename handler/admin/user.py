@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 from service.admin.user import create_service, reset_password_service, list_service
@@ -26,7 +27,7 @@ async def create(
     current_user: UserClaim = Depends(get_current_user)
 ):
     """create user"""
-    success, error = create_service(req.username, req.password, req.email)
+    success, error = await create_service(req.username, req.password, req.email)
     if error:
         return {"code": -1, "msg": error}
     return {"code": 200, "msg": "create success"}
@@ -38,7 +39,7 @@ async def reset_password(
     current_user: UserClaim = Depends(get_current_user)
 ):
     """reset password"""
-    success, error = reset_password_service(req.uuid, req.password)
+    success, error = await reset_password_service(req.uuid, req.password)
     if error:
         return {"code": -1, "msg": error}
     return {"code": 200, "msg": "reset success"}
@@ -51,7 +52,7 @@ async def list(
     current_user: UserClaim = Depends(get_current_user)
 ):
     """user list"""
-    result, error = list_service(page, size)
+    result, error = await run_in_threadpool(list_service, page, size)
     if error:
         return {"code": -1, "msg": error}
     return {"code": 200, "data": result}
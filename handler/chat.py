@@ -22,7 +22,7 @@ async def create_chat(
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
     try:
-        chat = chat_service.create_chat_service(current_user.uuid, req)
+        chat = await chat_service.create_chat_service(current_user.uuid, req)
     except ValueError as exc:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": str(exc)})
     return {"code": 200, "data": chat}
@@ -34,7 +34,7 @@ async def list_chats(
     size: int = Query(10, description="data per page"),
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    data = chat_service.list_chats_service(current_user.uuid, page, size)
+    data = await chat_service.list_chats_service(current_user.uuid, page, size)
     return {"code": 200, "data": data}
 
 
@@ -43,7 +43,7 @@ async def delete_chat(
     chat_uuid: str,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    ok = chat_service.delete_chat_service(current_user.uuid, chat_uuid)
+    ok = await chat_service.delete_chat_service(current_user.uuid, chat_uuid)
     if not ok:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "chat not found"})
     return {"code": 200, "msg": "delete success"}
@@ -55,7 +55,7 @@ async def update_chat_title(
     req: ChatUpdateRequest,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    ok = chat_service.update_chat_title_service(
+    ok = await chat_service.update_chat_title_service(
         current_user.uuid, chat_uuid, req.title
     )
     if not ok:
@@ -75,7 +75,7 @@ async def list_messages(
     current_user: UserClaim = Depends(get_current_user),
 ) -> List[ChatMessage]:
     try:
-        return chat_service.list_messages_service(
+        return await chat_service.list_messages_service(
             current_user.uuid, chat_uuid, limit=100
         )
     except ValueError as exc:
@@ -90,7 +90,7 @@ async def send_message(
     req: ChatMessageCreate,
     current_user: UserClaim = Depends(get_current_user),
 ) -> ChatReply:
-    reply = chat_service.send_message_service(current_user.uuid, chat_uuid, req)
+    reply = await chat_service.send_message_service(current_user.uuid, chat_uuid, req)
     if not reply:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "chat not found"})
     return reply
@@ -102,14 +102,14 @@ async def send_message_stream(
     req: ChatMessageCreate,
     current_user: UserClaim = Depends(get_current_user),
 ):
-    generator = chat_service.stream_message_service(
+    generator = await chat_service.stream_message_service(
         current_user.uuid, chat_uuid, req
     )
     if not generator:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "chat not found"})
 
-    def iter_chunks():
-        for chunk in generator:
+    async def iter_chunks():
+        async for chunk in generator:
             if chunk:
                 yield chunk.encode("utf-8")
 
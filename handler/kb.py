@@ -1,7 +1,7 @@
-import io
 from typing import Any, Dict
 
-from fastapi import APIRouter, Depends, Query, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, Query, HTTPException, UploadFile, File, Form, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 
 from middleware.auth import get_current_user, UserClaim
@@ -14,12 +14,16 @@ from models.kb import (
     KnowledgeQAReply,
 )
 from service import kb as kb_service
+from service import ingest as ingest_service
+from service.retrieval import server_timing
 from pydantic import BaseModel
 
 router = APIRouter(tags=["kb"])
 
 
 # ==== 知识库管理 ====
+# CRUD, import and export run on the sync ES client, in the threadpool;
+# QA and search await the async clients directly.
 
 
 @router.post("/kb", summary="create kb")
@@ -27,7 +31,7 @@ async def create_kb(
     req: KnowledgeBaseCreate,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    kb = kb_service.create_kb_service(current_user.uuid, req)
+    kb = await run_in_threadpool(kb_service.create_kb_service, current_user.uuid, req)
     return {"code": 200, "data": kb}
 
 
@@ -37,7 +41,7 @@ async def list_kb(
     size: int = Query(10, description="data per page"),
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    data = kb_service.list_kb_service(current_user.uuid, page, size)
+    data = await run_in_threadpool(kb_service.list_kb_service, current_user.uuid, page, size)
     return {"code": 200, "data": data}
 
 
@@ -47,7 +51,7 @@ async def update_kb(
     req: KnowledgeBaseUpdate,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    kb = kb_service.update_kb_service(current_user.uuid, kb_uuid, req)
+    kb = await run_in_threadpool(kb_service.update_kb_service, current_user.uuid, kb_uuid, req)
     if not kb:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
     return {"code": 200, "data": kb}
@@ -58,7 +62,7 @@ async def delete_kb(
     kb_uuid: str,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    ok = kb_service.delete_kb_service(current_user.uuid, kb_uuid)
+    ok = await run_in_threadpool(kb_service.delete_kb_service, current_user.uuid, kb_uuid)
     if not ok:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
     return {"code": 200, "msg": "delete success"}
@@ -73,7 +77,7 @@ async def create_doc(
     req: KnowledgeDocumentCreate,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    doc = kb_service.create_doc_service(current_user.uuid, kb_uuid, req)
+    doc = await run_in_threadpool(kb_service.create_doc_service, current_user.uuid, kb_uuid, req)
     if not doc:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
     return {"code": 200, "data": doc}
@@ -86,7 +90,7 @@ async def list_docs(
     size: int = Query(10, description="data per page"),
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    data = kb_service.list_docs_service(current_user.uuid, kb_uuid, page, size)
+    data = await run_in_threadpool(kb_service.list_docs_service, current_user.uuid, kb_uuid, page, size)
     return {"code": 200, "data": data}
 
 
@@ -96,7 +100,7 @@ async def update_doc(
     req: KnowledgeDocumentUpdate,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    doc = kb_service.update_doc_service(current_user.uuid, doc_uuid, req)
+    doc = await run_in_threadpool(kb_service.update_doc_service, current_user.uuid, doc_uuid, req)
     if not doc:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "doc not found"})
     return {"code": 200, "data": doc}
@@ -107,43 +111,82 @@ async def delete_doc(
     doc_uuid: str,
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    ok = kb_service.delete_doc_service(current_user.uuid, doc_uuid)
+    ok = await run_in_threadpool(kb_service.delete_doc_service, current_user.uuid, doc_uuid)
     if not ok:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "doc not found"})
     return {"code": 200, "msg": "delete success"}
 
 
-@router.post("/kb/{kb_uuid}/import", summary="bulk import docs")
+@router.post("/kb/{kb_uuid}/import", summary="bulk import docs (background job)")
 async def import_docs(
     kb_uuid: str,
     file: UploadFile = File(...),
+    sync: bool = Form(False, description="re-import: only update, re-embed and delete what changed"),
     current_user: UserClaim = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    content = await file.read()
+    # returns right away, poll GET /kb/import/job/{job_uuid} for progress.
+    # starlette spools the body to a temp file, it is copied to the job file in chunks
     try:
-        summary = kb_service.import_kb_file_service(
-            current_user.uuid, kb_uuid, file.filename or "", content
+        job = await run_in_threadpool(
+            ingest_service.submit_import_job, current_user.uuid, kb_uuid, file.filename or "", file.file, sync
         )
+    except ingest_service.UploadTooLargeError as exc:
+        raise HTTPException(status_code=413, detail={"code": 413, "msg": str(exc)})
     except ValueError as exc:
         raise HTTPException(status_code=400, detail={"code": 400, "msg": str(exc)})
-    if not summary:
+    if not job:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
-    return {"code": 200, "data": summary}
+    return {"code": 200, "data": {"job_uuid": job.uuid, "status": job.status}}
+
+
+@router.get("/kb/import/job/{job_uuid}", summary="import job progress")
+async def get_import_job(
+    job_uuid: str,
+    current_user: UserClaim = Depends(get_current_user),
+) -> Dict[str, Any]:
+    job = await run_in_threadpool(ingest_service.get_import_job_service, current_user.uuid, job_uuid)
+    if not job:
+        raise HTTPException(status_code=404, detail={"code": 404, "msg": "job not found"})
+    return {"code": 200, "data": job}
 
 
 @router.get("/kb/{kb_uuid}/export", summary="export kb bundle")
 async def export_kb(
     kb_uuid: str,
+    embedding_format: str = Query(
+        "float32", description="embedding encoding: float32 / float16 / int8 / json"
+    ),
     current_user: UserClaim = Depends(get_current_user),
 ):
-    bundle = kb_service.export_kb_service(current_user.uuid, kb_uuid)
+    try:
+        bundle = await run_in_threadpool(kb_service.export_kb_service, current_user.uuid, kb_uuid, embedding_format)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 400, "msg": str(exc)})
     if not bundle:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
-    bytes_io = io.BytesIO(bundle["content"])
     headers = {
         "Content-Disposition": f'attachment; filename="{bundle["filename"]}"'
     }
-    return StreamingResponse(bytes_io, media_type="application/zip", headers=headers)
+    # sync generator, starlette iterates it in the threadpool
+    return StreamingResponse(bundle["content"], media_type="application/zip", headers=headers)
+
+
+@router.post("/kb/{kb_uuid}/restore", summary="restore kb bundle")
+async def restore_kb(
+    kb_uuid: str,
+    file: UploadFile = File(...),
+    current_user: UserClaim = Depends(get_current_user),
+) -> Dict[str, Any]:
+    # the upload is spooled like an import (same size limits), the bundle is read entry by entry
+    try:
+        summary = await run_in_threadpool(ingest_service.restore_kb_upload, current_user.uuid, kb_uuid, file.file)
+    except ingest_service.UploadTooLargeError as exc:
+        raise HTTPException(status_code=413, detail={"code": 413, "msg": str(exc)})
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 400, "msg": str(exc)})
+    if summary is None:
+        raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
+    return {"code": 200, "data": summary}
 
 
 # ==== QA ====
@@ -153,17 +196,34 @@ async def export_kb(
 async def kb_qa(
     kb_uuid: str,
     req: KnowledgeQARequest,
+    response: Response,
     current_user: UserClaim = Depends(get_current_user),
 ) -> KnowledgeQAReply:
-    result = kb_service.qa_service(current_user.uuid, kb_uuid, req.question, req.top_k)
+    # per-stage latency is reported in the Server-Timing header
+    timings: Dict[str, float] = {}
+    try:
+        result = await kb_service.qa_service(
+            current_user.uuid,
+            kb_uuid,
+            req.question,
+            req.top_k,
+            mode=req.mode,
+            timings=timings,
+            bypass_cache=req.bypass_cache,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 400, "msg": str(exc)})
     if not result:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
+    response.headers["Server-Timing"] = server_timing(timings)
     return result
 
 
 class SemanticSearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    # vector, or hybrid: BM25 + vector fused by reciprocal rank
+    mode: str = "vector"
 
 
 class FullTextSearchRequest(BaseModel):
@@ -175,12 +235,20 @@ class FullTextSearchRequest(BaseModel):
 async def semantic_search(
     kb_uuid: str,
     req: SemanticSearchRequest,
+    response: Response,
     current_user: UserClaim = Depends(get_current_user),
 ):
-    result = kb_service.semantic_search_service(current_user.uuid, kb_uuid, req.query, req.top_k)
+    timings: Dict[str, float] = {}
+    try:
+        result = await kb_service.semantic_search_service(
+            current_user.uuid, kb_uuid, req.query, req.top_k, mode=req.mode, timings=timings
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail={"code": 400, "msg": str(exc)})
     if result is None:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
-    return {"code": 200, "data": result}
+    response.headers["Server-Timing"] = server_timing(timings)
+    return {"code": 200, "data": result, "timings_ms": timings}
 
 
 @router.post("/kb/{kb_uuid}/fulltext-search", summary="kb keyword search")
@@ -189,7 +257,7 @@ async def fulltext_search(
     req: FullTextSearchRequest,
     current_user: UserClaim = Depends(get_current_user),
 ):
-    result = kb_service.fulltext_search_service(current_user.uuid, kb_uuid, req.query, req.top_k)
+    result = await kb_service.fulltext_search_service(current_user.uuid, kb_uuid, req.query, req.top_k)
     if result is None:
         raise HTTPException(status_code=404, detail={"code": 404, "msg": "kb not found"})
     return {"code": 200, "data": result}
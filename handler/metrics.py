@@ -0,0 +1,24 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from service.answer_cache import get_answer_cache
+from service.embedding_cache import get_embedding_cache
+from service.executor import executor_stats
+from service.search_cache import get_search_cache
+from middleware.auth import get_current_user, UserClaim
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", summary="worker pool and cache metrics")
+async def metrics(current_user: UserClaim = Depends(get_current_user)) -> Dict[str, Any]:
+    return {
+        "code": 200,
+        "data": {
+            "executors": executor_stats(),
+            "embedding_cache": get_embedding_cache().stats(),
+            "search_cache": get_search_cache().stats(),
+            "answer_cache": get_answer_cache().stats(),
+        },
+    }
@@ -39,7 +39,7 @@ async def login(req: UserLoginRequest):
     """user login"""
     identifier = (req.identifier or req.username or "").strip()
     try:
-        token = login_service(identifier, req.password)
+        token = await login_service(identifier, req.password)
     except AuthError as exc:
         raise HTTPException(
             status_code=exc.status_code,
@@ -52,7 +52,7 @@ async def login(req: UserLoginRequest):
 async def register(req: UserRegisterRequest):
     """user register"""
     try:
-        register_service(req.username, req.password, req.email)
+        await register_service(req.username, req.password, req.email)
     except AuthError as exc:
         raise HTTPException(
             status_code=exc.status_code,
@@ -68,7 +68,7 @@ async def password_modify(
 ):
     """password modify"""
     try:
-        password_modify_service(
+        await password_modify_service(
             current_user.uuid,
             current_user.username,
             req.old_password,
@@ -0,0 +1,35 @@
+from typing import Any, Dict, Optional, List
+
+from pydantic import BaseModel
+
+
+class IngestJob(BaseModel):
+    """background import of one uploaded file (or zip/tar archive of files)"""
+
+    uuid: str
+    kb_uuid: str
+    owner_uuid: str
+    filename: str
+    file_path: str  # spooled upload, removed when the job finishes
+    status: str = "queued"  # queued / running / succeeded / failed
+    stage: str = "queued"  # queued / parsing / indexing / done
+    total: int = 0  # parsed documents
+    processed: int = 0
+    success: int = 0
+    failed: int = 0
+    errors: List[str] = []
+    sync: bool = False  # re-import: only changed sections are updated and re-embedded
+    # sync counters: created / updated / unchanged / deleted docs, chunks_embedded / chunks_reused
+    changes: Dict[str, int] = {}
+    # archives: one entry per member, {name, sha256, status, docs, processed, success, failed, errors, changes, error}
+    # status is indexing / done / duplicate / skipped / failed
+    files: List[Dict[str, Any]] = []
+    message: Optional[str] = None  # why the whole job failed, or why it is queued for a retry
+    attempts: int = 0
+    create_at: int
+    update_at: int
+    started_at: Optional[int] = None
+    finished_at: Optional[int] = None
+
+
+INGEST_JOB_INDEX = "kb_ingest_job_index"
@@ -1,6 +1,6 @@
 from typing import Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class KnowledgeBase(BaseModel):
@@ -10,6 +10,13 @@ class KnowledgeBase(BaseModel):
     name: str
     description: Optional[str] = None
     owner_uuid: str
+    # chunk budget for embeddings, None = CHUNK_MAX_TOKENS / CHUNK_OVERLAP_TOKENS.
+    # applies to docs embedded after a change, existing vectors are kept
+    chunk_tokens: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+    # content version, bumped by doc/vector writes (see dao.kb_dao.bump_kb_generation)
+    generation: int = 0
+    generation_at: int = 0
     create_at: int
     update_at: int
 
@@ -19,6 +26,8 @@ class KnowledgeBaseCreate(BaseModel):
 
     name: str
     description: Optional[str] = None
+    chunk_tokens: Optional[int] = Field(None, ge=32, le=8000)
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)
 
 
 class KnowledgeBaseUpdate(BaseModel):
@@ -26,6 +35,8 @@ class KnowledgeBaseUpdate(BaseModel):
 
     name: Optional[str] = None
     description: Optional[str] = None
+    chunk_tokens: Optional[int] = Field(None, ge=32, le=8000)
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)
 
 
 class KnowledgeDocument(BaseModel):
@@ -35,6 +46,9 @@ class KnowledgeDocument(BaseModel):
     kb_uuid: str
     title: str
     content: str
+    source: Optional[str] = None  # imported file (or archive member) the doc was parsed from
+    section: Optional[str] = None  # the doc's place in source, source + section identify it on re-import
+    content_hash: Optional[str] = None  # sha256 of title + content when imported
     create_at: int
     update_at: int
 
@@ -58,6 +72,10 @@ class KnowledgeQARequest(BaseModel):
 
     question: str
     top_k: int = 3
+    # vector / hybrid, QA_RETRIEVAL_MODE when unset
+    mode: Optional[str] = None
+    # skip the answer cache and ask the LLM again
+    bypass_cache: bool = False
 
 
 class KnowledgeQAReply(BaseModel):
@@ -65,10 +83,15 @@ class KnowledgeQAReply(BaseModel):
 
     answer: str
     context: List[str]
+    # answered from the answer cache
+    cached: bool = False
 
 
 KB_INDEX = "kb_index"
 KB_DOC_INDEX = "kb_doc_index"
 KB_DOC_EMBED_INDEX = "kb_doc_embed_index"
 
+# text-embedding-ada-002 vector size
+EMBEDDING_DIMS = 1536
+
 
@@ -1,10 +1,21 @@
-from fastapi import FastAPI
+import threading
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from handler.user import router as user_router
 from handler.admin.user import router as admin_user_router
 from handler.kb import router as kb_router
 from handler.chat import router as chat_router
+from handler.metrics import router as metrics_router
+from dao.schema import bootstrap_schema_with_retry
+from dao.init import close_async_es_client
+from dao.migrations import rekey_document_ids
+from service.executor import PoolOverloadedError, shutdown_executors
+from service.ingest import resume_import_jobs, shutdown_ingest_pool
+from service.openai_service import close_async_openai_client
+from define import ES_REKEY_IDS_ON_STARTUP
 
 app = FastAPI(
     title="KnowledgeBase",
@@ -15,6 +26,34 @@ app = FastAPI(
     openapi_url="/api-docs/openapi.json"
 )
 
+@app.on_event("startup")
+def bootstrap_indices() -> None:
+    # create/upgrade every index once, DAO calls assume the schema exists
+    bootstrap_schema_with_retry()
+    if ES_REKEY_IDS_ON_STARTUP:
+        # indices already keyed by uuid are skipped, so this is a no-op after the first run
+        threading.Thread(target=rekey_document_ids, name="rekey-ids", daemon=True).start()
+    # import jobs interrupted by a restart, re-scanned until shutdown
+    threading.Thread(target=resume_import_jobs, name="resume-imports", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def close_clients() -> None:
+    await close_async_es_client()
+    await close_async_openai_client()
+    shutdown_ingest_pool()
+    shutdown_executors()
+
+
+@app.exception_handler(PoolOverloadedError)
+async def pool_overloaded(request: Request, exc: PoolOverloadedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": {"code": 503, "msg": str(exc)}},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -28,3 +67,4 @@ app.include_router(user_router, prefix="/api/v1")
 app.include_router(admin_user_router, prefix="/api/v1/admin")
 app.include_router(kb_router, prefix="/api/v1")
 app.include_router(chat_router, prefix="/api/v1")
+app.include_router(metrics_router, prefix="/api/v1")
@@ -3,6 +3,7 @@ from datetime import datetime
 from typing import Optional
 
 import bcrypt
+from fastapi.concurrency import run_in_threadpool
 
 from dao.user_basic_dao import (
     search_user_by_username,
@@ -12,24 +13,24 @@ from dao.user_basic_dao import (
     list_users,
 )
 from models.user_basic import UserBasicDao
+from service.executor import get_executor
 
 
-def _hash_password(plain_password: str) -> str:
+async def _hash_password(plain_password: str) -> str:
     """
-    hash password using bcrypt
+    hash password using bcrypt (in the bounded crypto pool, awaited so no threadpool thread waits on it)
     """
-    return bcrypt.hashpw(plain_password.encode("utf-8"), bcrypt.gensalt()).decode(
-        "utf-8"
-    )
+    hashed = await get_executor("crypto").run(bcrypt.hashpw, plain_password.encode("utf-8"), bcrypt.gensalt())
+    return hashed.decode("utf-8")
 
 
-def create_service(username: str, password: str, email: Optional[str] = None) -> tuple[bool, Optional[str]]:
+async def create_service(username: str, password: str, email: Optional[str] = None) -> tuple[bool, Optional[str]]:
     """
     create user service
     返回: (success, error_message)
     """
     # 1. check if username exists
-    response = search_user_by_username(username)
+    response = await run_in_threadpool(search_user_by_username, username)
     total = response.get("hits", {}).get("total", {}).get("value", 0)
     if total > 0:
         return False, "username already exists"
@@ -39,23 +40,23 @@ def create_service(username: str, password: str, email: Optional[str] = None) ->
     user = UserBasicDao(
         uuid=str(uuid.uuid4()),
         username=username,
-        password=_hash_password(password),
+        password=await _hash_password(password),
         email=email,
         create_at=now,
         update_at=now
     )
-    create_user(user)
+    await run_in_threadpool(create_user, user)
     
     return True, None
 
 
-def reset_password_service(user_uuid: str, password: str) -> tuple[bool, Optional[str]]:
+async def reset_password_service(user_uuid: str, password: str) -> tuple[bool, Optional[str]]:
     """
     reset password service
     return: (success, error_message)
     """
     # 1. get user info
-    response = search_user_by_uuid(user_uuid)
+    response = await run_in_threadpool(search_user_by_uuid, user_uuid)
     
     hits = response.get("hits", {}).get("hits", [])
     if not hits:
@@ -64,8 +65,9 @@ def reset_password_service(user_uuid: str, password: str) -> tuple[bool, Optiona
     user_id = hits[0]["_id"]
     
     # 2. update password (hash password)
-    update_user(user_id, {
-        "password": _hash_password(password),
+    password_hash = await _hash_password(password)
+    await run_in_threadpool(update_user, user_id, {
+        "password": password_hash,
         "update_at": int(datetime.utcnow().timestamp() * 1000)
     })
     
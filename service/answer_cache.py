@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from define import QA_ANSWER_CACHE_SIZE, QA_ANSWER_CACHE_TTL, QA_ANSWER_CACHE_SIMILARITY
+
+
+class _Answer:
+    __slots__ = ("vector", "answer", "context", "created_at")
+
+    def __init__(self, vector: np.ndarray, answer: str, context: List[str], created_at: float):
+        self.vector = vector
+        self.answer = answer
+        self.context = context
+        self.created_at = created_at
+
+
+def _unit(vector: List[float]) -> Optional[np.ndarray]:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else None
+
+
+class AnswerCache:
+    """
+    in-process cache of QA answers, looked up by question embedding (cosine >= similarity).
+    answers are grouped by (kb, kb generation, top_k, mode): a kb content write starts
+    a new, empty group for that kb and the old groups age out of the LRU.
+    bounded by answer count and answer age
+    """
+
+    def __init__(
+        self,
+        max_items: int = QA_ANSWER_CACHE_SIZE,
+        ttl: int = QA_ANSWER_CACHE_TTL,
+        similarity: float = QA_ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.similarity = similarity
+        self._groups: "OrderedDict[Tuple[Any, ...], List[_Answer]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_items > 0
+
+    def get(
+        self,
+        kb_uuid: str,
+        generation: str,
+        top_k: int,
+        mode: str,
+        question_vector: List[float],
+    ) -> Optional[Dict[str, Any]]:
+        """{"answer", "context", "similarity"} of the closest cached question, None below the threshold"""
+        if not self.enabled:
+            return None
+        vector = _unit(question_vector)
+        group_key = (kb_uuid, generation, top_k, mode)
+        now = time.time()
+        with self._lock:
+            answers = self._groups.get(group_key)
+            if answers:
+                self._drop_expired(group_key, answers, now)
+            if not answers or vector is None or vector.shape != answers[0].vector.shape:
+                self.misses += 1
+                return None
+            scores = np.stack([item.vector for item in answers]) @ vector
+            best = int(np.argmax(scores))
+            if float(scores[best]) < self.similarity:
+                self.misses += 1
+                return None
+            self._groups.move_to_end(group_key)
+            self.hits += 1
+            item = answers[best]
+            return {"answer": item.answer, "context": item.context, "similarity": float(scores[best])}
+
+    def put(
+        self,
+        kb_uuid: str,
+        generation: str,
+        top_k: int,
+        mode: str,
+        question_vector: List[float],
+        answer: str,
+        context: List[str],
+    ) -> None:
+        """remember an answer under a kb generation, replacing a near-identical question"""
+        vector = _unit(question_vector)
+        if not self.enabled or vector is None:
+            return
+        group_key = (kb_uuid, generation, top_k, mode)
+        with self._lock:
+            answers = self._groups.setdefault(group_key, [])
+            self._groups.move_to_end(group_key)
+            if answers and answers[0].vector.shape == vector.shape:
+                scores = np.stack([item.vector for item in answers]) @ vector
+                best = int(np.argmax(scores))
+                if float(scores[best]) >= self.similarity:
+                    answers.pop(best)
+                    self._size -= 1
+            answers.append(_Answer(vector, answer, context, time.time()))
+            self._size += 1
+            while self._size > self.max_items:
+                oldest_key, oldest = next(iter(self._groups.items()))
+                oldest.pop(0)
+                self._size -= 1
+                self.evictions += 1
+                if not oldest:
+                    del self._groups[oldest_key]
+
+    def _drop_expired(self, group_key: Tuple[Any, ...], answers: List[_Answer], now: float) -> None:
+        fresh = [item for item in answers if now - item.created_at <= self.ttl]
+        if len(fresh) != len(answers):
+            self.evictions += len(answers) - len(fresh)
+            self._size -= len(answers) - len(fresh)
+            answers[:] = fresh
+            if not fresh:
+                del self._groups[group_key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._groups.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self._size,
+                "max_items": self.max_items,
+                "ttl": self.ttl,
+                "similarity": self.similarity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """get QA answer cache (singleton pattern)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, Tuple
+
+from define import UPLOAD_MAX_BYTES, ARCHIVE_MAX_MEMBERS, ARCHIVE_MAX_UNPACKED_BYTES
+from service.kb import is_supported_upload
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# members are copied out of the archive this much at a time
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def is_archive(filename: str) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _is_hidden(name: str) -> bool:
+    """macOS resource forks, .DS_Store, dot files and folders"""
+    return any(part.startswith(".") or part == "__MACOSX" for part in Path(name).parts)
+
+
+def _open_members(file_path: str, filename: str) -> Iterator[Tuple[str, int, IO[bytes]]]:
+    """(name, declared size, stream) of every regular file, read sequentially"""
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(file_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as stream:
+                    yield info.filename, info.file_size, stream
+        return
+    with tarfile.open(file_path, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            stream = archive.extractfile(member)
+            if stream is not None:
+                with stream:
+                    yield member.name, member.size, stream
+
+
+def iter_archive_members(
+    file_path: str,
+    filename: str,
+    out_dir: str,
+) -> Iterator[Dict[str, Any]]:
+    """
+    unpack a zip/tar upload one member at a time into out_dir, hashing it on the way.
+    yields {"name", "path", "sha256", "error"}, path is None for members that are not unpacked
+    (unsupported format or too large). the caller removes the unpacked files.
+    raises ValueError when the archive has too many members or unpacks to too many bytes.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    unpacked = 0
+    for name, size, stream in _open_members(file_path, filename):
+        if _is_hidden(name):
+            continue
+        count += 1
+        if count > ARCHIVE_MAX_MEMBERS:
+            raise ValueError(f"archive has more than {ARCHIVE_MAX_MEMBERS} files")
+        if not is_supported_upload(name):
+            yield {"name": name, "path": None, "sha256": None, "error": "unsupported format, skipped"}
+            continue
+        if size > UPLOAD_MAX_BYTES:
+            yield {"name": name, "path": None, "sha256": None, "error": "file too large, skipped"}
+            continue
+
+        # the name inside the archive is never used as a path
+        member_path = os.path.join(out_dir, f"{count}{Path(name).suffix.lower()}")
+        digest = hashlib.sha256()
+        written = 0
+        with open(member_path, "wb") as out:
+            while True:
+                chunk = stream.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                unpacked += len(chunk)
+                if unpacked > ARCHIVE_MAX_UNPACKED_BYTES:
+                    out.close()
+                    os.remove(member_path)
+                    raise ValueError(f"archive unpacks to more than {ARCHIVE_MAX_UNPACKED_BYTES // (1024 * 1024)} MB")
+                if written > UPLOAD_MAX_BYTES:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        if written > UPLOAD_MAX_BYTES:
+            os.remove(member_path)
+            yield {"name": name, "path": None, "sha256": None, "error": "file too large, skipped"}
+            continue
+        yield {"name": name, "path": member_path, "sha256": digest.hexdigest(), "error": None}
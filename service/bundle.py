@@ -0,0 +1,264 @@
+import io
+import json
+import tempfile
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# kb export bundle layout
+BUNDLE_FORMAT_VERSION = 3
+BUNDLE_KB_FILE = "kb.json"
+BUNDLE_DOCS_FILE = "docs.ndjson"
+BUNDLE_EMBEDDINGS_FILE = "embeddings.ndjson"
+BUNDLE_EMBEDDINGS_BIN_FILE = "embeddings.bin"
+BUNDLE_EMBEDDINGS_INDEX_FILE = "embeddings_index.ndjson"
+BUNDLE_MANIFEST_FILE = "manifest.json"
+
+# embedding encodings of an export: raw matrices, or the legacy json float lists
+EMBEDDING_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": "i1"}
+EMBEDDING_FORMATS = tuple(EMBEDDING_DTYPES) + ("json",)
+
+# rows converted with numpy at a time
+_ENCODE_BATCH = 256
+# keep the row index in memory up to this size, spill to disk beyond
+_INDEX_SPOOL_BYTES = 8 * 1024 * 1024
+
+# flush compressed output to the client in pieces of at least this size
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    write-only, unseekable target for zipfile.
+    zipfile then writes data descriptors after each entry,
+    so written bytes can be handed out right away.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._buffered = 0
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._buffered += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self, min_bytes: int = 0) -> bytes:
+        if not self._parts or self._buffered < min_bytes:
+            return b""
+        data = b"".join(self._parts)
+        self._parts = []
+        self._buffered = 0
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    build a zip archive on the fly: entries are (name, byte pieces),
+    each entry is read lazily and compressed output is yielded as it is produced.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, pieces in entries:
+            # size is unknown up front, allow entries above 4 GiB
+            with zf.open(name, "w", force_zip64=True) as fh:
+                for piece in pieces:
+                    fh.write(piece)
+                    data = sink.drain(_STREAM_CHUNK_BYTES)
+                    if data:
+                        yield data
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]], counter: Dict[str, int], key: str) -> Iterator[bytes]:
+    """encode rows as json lines, counting them into counter[key]"""
+    counter.setdefault(key, 0)
+    for row in rows:
+        counter[key] += 1
+        yield json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def json_bytes(data: Any) -> Iterator[bytes]:
+    yield json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+class EmbeddingMatrixWriter:
+    """
+    binary embeddings section of a bundle, written in one pass over the vectors:
+    - embeddings.bin: row-major little-endian matrix (float32, float16 or int8)
+    - embeddings_index.ndjson: one line per row with uuid/doc_uuid/chunk (+ int8 scale)
+    the index is spooled while the matrix streams out, then written as the next entry.
+    int8 rows use symmetric per-row quantization: value = q * scale.
+    """
+
+    def __init__(self, encoding: str):
+        if encoding not in EMBEDDING_DTYPES:
+            raise ValueError(f"unsupported embedding format: {encoding}")
+        self.encoding = encoding
+        self.dtype = np.dtype(EMBEDDING_DTYPES[encoding])
+        self.dims: Optional[int] = None
+        self.count = 0
+        self.skipped = 0
+        self._index = tempfile.SpooledTemporaryFile(max_size=_INDEX_SPOOL_BYTES)
+
+    def iter_matrix(self, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+        batch: List[Dict[str, Any]] = []
+        for row in rows:
+            emb = row.get("embedding") or []
+            if self.dims is None and emb:
+                self.dims = len(emb)
+            if not emb or len(emb) != self.dims:
+                self.skipped += 1
+                continue
+            batch.append(row)
+            if len(batch) >= _ENCODE_BATCH:
+                yield self._encode(batch)
+                batch = []
+        if batch:
+            yield self._encode(batch)
+
+    def _encode(self, batch: List[Dict[str, Any]]) -> bytes:
+        matrix = np.asarray([row["embedding"] for row in batch], dtype=np.float32)
+        scales: Optional[np.ndarray] = None
+        if self.encoding == "int8":
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            encoded = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(self.dtype)
+        else:
+            encoded = matrix.astype(self.dtype)
+        for i, row in enumerate(batch):
+            entry = {k: v for k, v in row.items() if k != "embedding"}
+            entry["row"] = self.count + i
+            if scales is not None:
+                entry["scale"] = float(scales[i])
+            self._index.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.count += len(batch)
+        return encoded.tobytes()
+
+    def iter_index(self) -> Iterator[bytes]:
+        self._index.seek(0)
+        try:
+            while True:
+                data = self._index.read(_STREAM_CHUNK_BYTES)
+                if not data:
+                    return
+                yield data
+        finally:
+            self._index.close()
+
+    def describe(self) -> Dict[str, Any]:
+        """manifest section, enough to load the matrix without this code"""
+        return {
+            "encoding": self.encoding,
+            "file": BUNDLE_EMBEDDINGS_BIN_FILE,
+            "index_file": BUNDLE_EMBEDDINGS_INDEX_FILE,
+            "dtype": self.dtype.str,
+            "byte_order": "little",
+            "layout": "row-major",
+            "dims": self.dims or 0,
+            "count": self.count,
+            "skipped": self.skipped,
+            "quantization": (
+                {"scheme": "symmetric-per-row", "scale_field": "scale", "value": "q * scale"}
+                if self.encoding == "int8"
+                else None
+            ),
+        }
+
+
+class BundleReader:
+    """
+    reads an export bundle from a seekable zip file:
+    - format 2/3: manifest.json + docs.ndjson + embeddings (ndjson or binary matrix)
+    - format 1: docs.json / embeddings.json written by older exports
+    rows are streamed, except for format 1 json arrays.
+    """
+
+    def __init__(self, fileobj):
+        try:
+            self._zf = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as exc:
+            raise ValueError("bundle is not a valid zip file") from exc
+        self._names = set(self._zf.namelist())
+        self.manifest: Dict[str, Any] = (
+            self._read_json(BUNDLE_MANIFEST_FILE) if BUNDLE_MANIFEST_FILE in self._names else {}
+        )
+        if BUNDLE_KB_FILE not in self._names:
+            raise ValueError(f"bundle has no {BUNDLE_KB_FILE}")
+        self.kb: Dict[str, Any] = self._read_json(BUNDLE_KB_FILE)
+        self.format_version = int(self.manifest.get("format_version", 1))
+
+    @property
+    def source_kb_uuid(self) -> Optional[str]:
+        return self.manifest.get("kb_uuid") or self.kb.get("uuid")
+
+    @property
+    def embedding_dims(self) -> Optional[int]:
+        """declared dims of the binary matrix, None for json embeddings"""
+        section = self.manifest.get("embeddings") or {}
+        return section.get("dims") if section.get("encoding") in EMBEDDING_DTYPES else None
+
+    def iter_documents(self) -> Iterator[Dict[str, Any]]:
+        if BUNDLE_DOCS_FILE in self._names:
+            yield from self._iter_ndjson(BUNDLE_DOCS_FILE)
+        elif "docs.json" in self._names:
+            yield from self._read_json("docs.json")
+        else:
+            raise ValueError("bundle has no documents")
+
+    def iter_embeddings(self) -> Iterator[Dict[str, Any]]:
+        """rows with a float list "embedding", whatever encoding the bundle uses"""
+        section = self.manifest.get("embeddings") or {}
+        encoding = section.get("encoding")
+        if encoding in EMBEDDING_DTYPES:
+            yield from self._iter_matrix(section)
+        elif BUNDLE_EMBEDDINGS_FILE in self._names:
+            yield from self._iter_ndjson(BUNDLE_EMBEDDINGS_FILE)
+        elif "embeddings.json" in self._names:
+            yield from self._read_json("embeddings.json")
+
+    def _iter_matrix(self, section: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        dtype = np.dtype(section.get("dtype") or EMBEDDING_DTYPES[section["encoding"]])
+        dims = int(section.get("dims") or 0)
+        row_bytes = dims * dtype.itemsize
+        bin_name = section.get("file", BUNDLE_EMBEDDINGS_BIN_FILE)
+        index_name = section.get("index_file", BUNDLE_EMBEDDINGS_INDEX_FILE)
+        if not dims or bin_name not in self._names or index_name not in self._names:
+            raise ValueError("bundle embeddings section is incomplete")
+        scaled = section.get("encoding") == "int8"
+        # rows of the matrix and lines of the index are in the same order
+        with self._zf.open(bin_name) as matrix:
+            for entry in self._iter_ndjson(index_name):
+                raw = matrix.read(row_bytes)
+                if len(raw) != row_bytes:
+                    raise ValueError("bundle embeddings matrix is shorter than its index")
+                vector = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+                if scaled:
+                    vector = vector * np.float32(entry.pop("scale", 1.0))
+                entry.pop("row", None)
+                entry["embedding"] = vector.tolist()
+                yield entry
+
+    def _iter_ndjson(self, name: str) -> Iterator[Dict[str, Any]]:
+        with self._zf.open(name) as fh:
+            for line in io.TextIOWrapper(fh, encoding="utf-8"):
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def _read_json(self, name: str) -> Any:
+        with self._zf.open(name) as fh:
+            return json.load(fh)
@@ -12,8 +12,8 @@ from dao.chat_dao import (
     list_messages,
 )
 from models.chat import Chat, ChatCreate, ChatMessage, ChatMessageCreate, ChatReply
-from service.kb import save_qa_to_kb, get_owned_kb
-from service.openai_service import chat_completion, stream_chat_completion
+from service.kb import save_qa_to_kb, aget_owned_kb
+from service.openai_service import achat_completion, astream_chat_completion
 
 
 DEFAULT_CHAT_TITLE = "Untitled chat"
@@ -35,14 +35,14 @@ def _should_autoname_chat(current_title: str) -> bool:
     return normalized in LEGACY_AUTO_TITLE_CANDIDATES
 
 
-def _apply_auto_title(chat_obj: Chat, question: str) -> None:
+async def _apply_auto_title(chat_obj: Chat, question: str) -> None:
     trimmed = (question or "").strip()
     if not trimmed:
         return
     if not _should_autoname_chat(chat_obj.title):
         return
     new_title = trimmed[:80]
-    update_chat(
+    await update_chat(
         chat_obj.uuid,
         {
             "title": new_title,
@@ -52,10 +52,10 @@ def _apply_auto_title(chat_obj: Chat, question: str) -> None:
     chat_obj.title = new_title
 
 
-def create_chat_service(user_uuid: str, req: ChatCreate) -> Chat:
+async def create_chat_service(user_uuid: str, req: ChatCreate) -> Chat:
     title = (req.title or "").strip() or DEFAULT_CHAT_TITLE
     kb_uuid = req.kb_uuid
-    if kb_uuid and not get_owned_kb(kb_uuid, user_uuid):
+    if kb_uuid and not await aget_owned_kb(kb_uuid, user_uuid):
         raise ValueError("knowledge base not found")
     chat = Chat(
         uuid=str(uuid.uuid4()),
@@ -65,29 +65,29 @@ def create_chat_service(user_uuid: str, req: ChatCreate) -> Chat:
         create_at=_now_ms(),
         update_at=_now_ms(),
     )
-    create_chat(chat.dict())
+    await create_chat(chat.dict())
 
     return chat
 
 
-def list_chats_service(user_uuid: str, page: int, size: int) -> Dict[str, Any]:
-    return list_chats(user_uuid, page, size)
+async def list_chats_service(user_uuid: str, page: int, size: int) -> Dict[str, Any]:
+    return await list_chats(user_uuid, page, size)
 
 
-def delete_chat_service(user_uuid: str, chat_uuid: str) -> bool:
-    chat_data = get_chat(chat_uuid)
+async def delete_chat_service(user_uuid: str, chat_uuid: str) -> bool:
+    chat_data = await get_chat(chat_uuid)
     if not chat_data or chat_data.get("user_uuid") != user_uuid:
         return False
-    delete_chat(chat_uuid)
+    await delete_chat(chat_uuid)
     return True
 
 
-def update_chat_title_service(user_uuid: str, chat_uuid: str, title: str) -> bool:
-    chat_data = get_chat(chat_uuid)
+async def update_chat_title_service(user_uuid: str, chat_uuid: str, title: str) -> bool:
+    chat_data = await get_chat(chat_uuid)
     if not chat_data or chat_data.get("user_uuid") != user_uuid:
         return False
     new_title = title.strip() or "Untitled chat"
-    update_chat(
+    await update_chat(
         chat_uuid,
         {
             "title": new_title,
@@ -97,26 +97,26 @@ def update_chat_title_service(user_uuid: str, chat_uuid: str, title: str) -> boo
     return True
 
 
-def list_messages_service(
+async def list_messages_service(
     user_uuid: str, chat_uuid: str, limit: int = 50
 ) -> List[ChatMessage]:
-    chat_data = get_chat(chat_uuid)
+    chat_data = await get_chat(chat_uuid)
     if not chat_data or chat_data.get("user_uuid") != user_uuid:
         raise ValueError("chat not found")
-    docs = list_messages(chat_uuid, limit)
+    docs = await list_messages(chat_uuid, limit)
     return [ChatMessage(**d) for d in docs]
 
 
-def send_message_service(
+async def send_message_service(
     user_uuid: str, chat_uuid: str, req: ChatMessageCreate
 ) -> Optional[ChatReply]:
-    chat_data = get_chat(chat_uuid)
+    chat_data = await get_chat(chat_uuid)
     if not chat_data or chat_data.get("user_uuid") != user_uuid:
         return None
 
     chat_obj = Chat(**chat_data)
 
-    _apply_auto_title(chat_obj, req.content)
+    await _apply_auto_title(chat_obj, req.content)
 
     # 1. insert user message
     user_msg = ChatMessage(
@@ -126,27 +126,27 @@ def send_message_service(
         content=req.content,
         create_at=_now_ms(),
     )
-    append_message(user_msg.dict())
+    await append_message(user_msg.dict())
 
     # 2. generate reply (with kb RAG)
-    reply = _generate_and_store_reply(chat_obj, req.content)
+    reply = await _generate_and_store_reply(chat_obj, req.content)
 
     # 3. 更新对话更新时间
-    update_chat(chat_uuid, {"update_at": _now_ms(), "title": chat_obj.title})
+    await update_chat(chat_uuid, {"update_at": _now_ms(), "title": chat_obj.title})
 
     return reply
 
 
-def stream_message_service(
+async def stream_message_service(
     user_uuid: str, chat_uuid: str, req: ChatMessageCreate
 ):
-    chat_data = get_chat(chat_uuid)
+    chat_data = await get_chat(chat_uuid)
     if not chat_data or chat_data.get("user_uuid") != user_uuid:
         return None
 
     chat_obj = Chat(**chat_data)
 
-    _apply_auto_title(chat_obj, req.content)
+    await _apply_auto_title(chat_obj, req.content)
     user_msg = ChatMessage(
         uuid=str(uuid.uuid4()),
         chat_uuid=chat_uuid,
@@ -154,25 +154,25 @@ def stream_message_service(
         content=req.content,
         create_at=_now_ms(),
     )
-    append_message(user_msg.dict())
+    await append_message(user_msg.dict())
 
-    def generator():
-        for chunk in stream_reply_generator(chat_obj, req.content):
+    async def generator():
+        async for chunk in stream_reply_generator(chat_obj, req.content):
             if chunk:
                 yield chunk
-        update_chat(chat_uuid, {"update_at": _now_ms(), "title": chat_obj.title})
+        await update_chat(chat_uuid, {"update_at": _now_ms(), "title": chat_obj.title})
 
     return generator()
 
 
-def _generate_and_store_reply(chat_obj: Chat, question: str) -> ChatReply:
+async def _generate_and_store_reply(chat_obj: Chat, question: str) -> ChatReply:
     """
     Use conversation history to generate reply.
     If kb_uuid is bound, still write Q&A into KB for later retrieval.
     """
-    history_docs = list_messages(chat_obj.uuid, limit=20)
+    history_docs = await list_messages(chat_obj.uuid, limit=20)
     messages = _build_completion_messages(history_docs, question)
-    answer = chat_completion(messages)
+    answer = await achat_completion(messages)
 
     # 2. insert assistant message
     assistant_msg = ChatMessage(
@@ -182,22 +182,22 @@ def _generate_and_store_reply(chat_obj: Chat, question: str) -> ChatReply:
         content=answer,
         create_at=_now_ms(),
     )
-    append_message(assistant_msg.dict())
+    await append_message(assistant_msg.dict())
 
     # 3. if kb_uuid is bound, write Q&A as doc into the kb, and generate vector for the answer
     if chat_obj.kb_uuid:
-        if get_owned_kb(chat_obj.kb_uuid, chat_obj.user_uuid):
-            save_qa_to_kb(chat_obj.kb_uuid, question, answer)
+        if await aget_owned_kb(chat_obj.kb_uuid, chat_obj.user_uuid):
+            await save_qa_to_kb(chat_obj.kb_uuid, question, answer)
 
     # currently context is conversation history, already used by model
     return ChatReply(answer=answer, context=[])
 
 
-def stream_reply_generator(chat_obj: Chat, question: str):
-    history_docs = list_messages(chat_obj.uuid, limit=20)
+async def stream_reply_generator(chat_obj: Chat, question: str):
+    history_docs = await list_messages(chat_obj.uuid, limit=20)
     messages = _build_completion_messages(history_docs, question)
     buffer = ""
-    for chunk in stream_chat_completion(messages):
+    async for chunk in astream_chat_completion(messages):
         if chunk:
             buffer += chunk
             yield chunk
@@ -209,9 +209,9 @@ def stream_reply_generator(chat_obj: Chat, question: str):
             content=buffer,
             create_at=_now_ms(),
         )
-        append_message(assistant_msg.dict())
-        if chat_obj.kb_uuid and get_owned_kb(chat_obj.kb_uuid, chat_obj.user_uuid):
-            save_qa_to_kb(chat_obj.kb_uuid, question, buffer)
+        await append_message(assistant_msg.dict())
+        if chat_obj.kb_uuid and await aget_owned_kb(chat_obj.kb_uuid, chat_obj.user_uuid):
+            await save_qa_to_kb(chat_obj.kb_uuid, question, buffer)
 
 
 def _build_completion_messages(
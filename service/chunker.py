@@ -0,0 +1,234 @@
+import hashlib
+import re
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Type
+
+from define import CHUNKER, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# token counting: tiktoken (requirements.txt). the char based estimate is only a fallback,
+# it counts English text about twice too high, which halves every token budget
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception as exc:  # pylint: disable=broad-except
+    _ENCODING = None
+    print(
+        f"[WARN] tiktoken cl100k_base unavailable ({exc}), token budgets use a 2 chars per token estimate; "
+        "install tiktoken and, offline, pre-fill TIKTOKEN_CACHE_DIR"
+    )
+
+_SENTENCE_END = re.compile(r"(?<=[。．！？.!?])\s+|(?<=[。！？])")
+_CJK_SENTENCE_END = "。！？；"
+_HEADING = re.compile(r"^#{1,6}\s+\S")
+_FENCE = re.compile(r"^(```|~~~)")
+_TABLE_ROW = re.compile(r"^\s*\|.*\|\s*$")
+
+
+def count_tokens(text: str) -> int:
+    """count tokens with tiktoken, or estimate ~1 token per 2 chars (safe for CJK text)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return len(text) // 2 + 1
+
+
+def _cut_tokens(text: str, max_tokens: int) -> List[str]:
+    """hard split of a single over-long sentence/line"""
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        return [_ENCODING.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+    # the estimate counts len // 2 + 1 tokens
+    step = max(1, (max_tokens - 1) * 2)
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def chunk_uuids(doc_uuid: str, chunks: List[str]) -> List[str]:
+    """vector uuids derived from the doc and chunk text, so an unchanged chunk keeps its id"""
+    seen: Counter = Counter()
+    uuids: List[str] = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        seen[digest] += 1
+        uuids.append(str(uuid.uuid5(uuid.UUID(doc_uuid), f"{digest}:{seen[digest]}")))
+    return uuids
+
+
+class Chunker:
+    """splits doc content into the chunks that are embedded and retrieved"""
+
+    name = ""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        self.max_tokens = max(16, max_tokens)
+        # more overlap than half a chunk would mostly re-embed the previous chunk
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+
+    def split(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+
+class FixedChunker(Chunker):
+    """
+    fixed size character slices, max_tokens * 2 chars each, no overlap.
+    the chunker before token budgets cut 400 chars: max_tokens=200 reproduces it, the default budget does not
+    """
+
+    name = "fixed"
+
+    def split(self, text: str) -> List[str]:
+        text = text.strip()
+        step = self.max_tokens * 2
+        return [text[i:i + step] for i in range(0, len(text), step)] if text else []
+
+
+class StructureChunker(Chunker):
+    """
+    token budget chunks that follow the text structure:
+    - a markdown heading starts a new chunk once the current one is a quarter full
+    - fenced code and tables are split between lines (table pieces repeat the header row),
+      prose between sentences, only a single over-long line/sentence is cut by tokens
+    - each chunk starts with the last overlap_tokens of the previous one (whole sentences/lines)
+    """
+
+    name = "structure"
+
+    def split(self, text: str) -> List[str]:
+        chunks: List[str] = []
+        current: List[Tuple[str, int]] = []  # (piece with its leading separator, tokens of both)
+        size = 0
+        fresh = False  # current holds more than the overlap of the last chunk
+
+        def flush(carry: Optional[List[Tuple[str, int]]] = None) -> None:
+            nonlocal current, size, fresh
+            if fresh:
+                chunks.append("".join(piece for piece, _ in current).strip())
+            if carry is None:
+                carry = []
+                for item in reversed(current):
+                    if sum(tokens for _, tokens in carry) + item[1] > self.overlap_tokens:
+                        break
+                    carry.insert(0, item)
+            current, size, fresh = carry, sum(tokens for _, tokens in carry), False
+
+        for kind, pieces in _blocks(text):
+            if kind == "heading" and fresh and size >= self.max_tokens // 4:
+                flush(carry=[])
+            header = _table_header(pieces) if kind == "table" else None
+            previous = ""
+            for idx, piece in enumerate(_fit(pieces, self.max_tokens)):
+                sep = "\n\n" if idx == 0 else _joiner(kind, previous)
+                piece_tokens = count_tokens(piece)
+                # the separator counts against the budget, except at the start of a chunk
+                tokens = count_tokens(sep + piece) if current else piece_tokens
+                if current and size + tokens > self.max_tokens:
+                    # a table continued in the next chunk starts with its header instead of the overlap
+                    carry = None
+                    if header and idx >= 2 and count_tokens(header) * 4 <= self.max_tokens:
+                        carry = [(header, count_tokens(header))]
+                    flush(carry)
+                    # overlap that leaves no room for the next piece is dropped
+                    while current and size + tokens > self.max_tokens:
+                        size -= current.pop(0)[1]
+                    if not current:
+                        tokens = piece_tokens
+                current.append(((sep if current else "") + piece, tokens))
+                previous = piece
+                size += tokens
+                fresh = True
+        flush(carry=[])
+        return [chunk for chunk in chunks if chunk]
+
+
+def _joiner(kind: str, previous: str) -> str:
+    """lines are joined by newlines, sentences by a space (none after CJK punctuation)"""
+    if kind != "prose":
+        return "\n"
+    return "" if previous and previous[-1] in _CJK_SENTENCE_END else " "
+
+
+def _fit(pieces: List[str], max_tokens: int) -> List[str]:
+    """pieces no larger than the budget"""
+    fitted: List[str] = []
+    for piece in pieces:
+        if count_tokens(piece) <= max_tokens:
+            fitted.append(piece)
+        else:
+            fitted.extend(_cut_tokens(piece, max_tokens))
+    return fitted
+
+
+def _table_header(rows: List[str]) -> Optional[str]:
+    """header + separator row of a markdown table"""
+    if len(rows) > 2 and re.match(r"^\|?[\s:|-]+\|?$", rows[1]) and "-" in rows[1]:
+        return "\n".join(rows[:2])
+    return None
+
+
+def _blocks(text: str) -> List[Tuple[str, List[str]]]:
+    """(kind, pieces) of the text: heading / code / table (one piece per line) and prose (one per sentence)"""
+    blocks: List[Tuple[str, List[str]]] = []
+    lines = text.replace("\r\n", "\n").split("\n")
+    paragraph: List[str] = []
+
+    def end_paragraph() -> None:
+        if paragraph:
+            prose = " ".join(line.strip() for line in paragraph if line.strip())
+            sentences = [s.strip() for s in _SENTENCE_END.split(prose) if s and s.strip()]
+            if sentences:
+                blocks.append(("prose", sentences))
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if _FENCE.match(line.strip()):
+            end_paragraph()
+            fence = line.strip()[:3]
+            code = [line]
+            i += 1
+            while i < len(lines):
+                code.append(lines[i])
+                i += 1
+                if lines[i - 1].strip().startswith(fence):
+                    break
+            blocks.append(("code", code))
+            continue
+        if _TABLE_ROW.match(line):
+            end_paragraph()
+            rows = []
+            while i < len(lines) and _TABLE_ROW.match(lines[i]):
+                rows.append(lines[i].strip())
+                i += 1
+            blocks.append(("table", rows))
+            continue
+        if _HEADING.match(line.strip()):
+            end_paragraph()
+            blocks.append(("heading", [line.strip()]))
+        elif not line.strip():
+            end_paragraph()
+        else:
+            paragraph.append(line)
+        i += 1
+    end_paragraph()
+    return blocks
+
+
+CHUNKERS: Dict[str, Type[Chunker]] = {
+    FixedChunker.name: FixedChunker,
+    StructureChunker.name: StructureChunker,
+}
+
+
+def get_chunker(
+    max_tokens: Optional[int] = None,
+    overlap_tokens: Optional[int] = None,
+    name: str = CHUNKER,
+) -> Chunker:
+    """chunker by name (CHUNKERS), unset budgets fall back to CHUNK_MAX_TOKENS / CHUNK_OVERLAP_TOKENS"""
+    cls = CHUNKERS.get(name)
+    if cls is None:
+        raise ValueError(f"unknown chunker {name}, use one of {', '.join(CHUNKERS)}")
+    return cls(
+        CHUNK_MAX_TOKENS if max_tokens is None else max_tokens,
+        CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens,
+    )
@@ -0,0 +1,105 @@
+import re
+from typing import Any, Dict, List
+
+from define import QA_CONTEXT_MAX_TOKENS, QA_CONTEXT_DUPLICATE_SIMILARITY
+from service.chunker import count_tokens
+
+# characters per shingle when comparing chunks for near-duplicates
+_SHINGLE_CHARS = 5
+# how far back in a chunk the overlap with the next chunk of the doc is looked for
+_MAX_OVERLAP_CHARS = 4000
+
+
+def pack_context(
+    chunks: List[Dict[str, Any]],
+    max_tokens: int = QA_CONTEXT_MAX_TOKENS,
+    duplicate_similarity: float = QA_CONTEXT_DUPLICATE_SIMILARITY,
+) -> List[Dict[str, Any]]:
+    """
+    fit retrieved chunks into a prompt token budget:
+    - best scores first, a chunk that does not fit is skipped in favour of smaller ones
+    - chunks nearly identical to a picked one (shingle jaccard >= duplicate_similarity) are dropped
+    - picked chunks of a doc at neighbouring positions become one passage, their overlap is not repeated
+    token counts stored at ingest are used, older vectors are counted here.
+    returns passages {doc_uuid, doc_title, chunk, score, tokens}, best first
+    """
+    picked: List[Dict[str, Any]] = []
+    picked_shingles: List[set] = []
+    used = 0
+    for item in sorted(chunks, key=lambda c: c.get("score", 0.0), reverse=True):
+        text = (item.get("chunk") or "").strip()
+        if not text:
+            continue
+        tokens = item.get("tokens") or count_tokens(text)
+        if used + tokens > max_tokens:
+            continue
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, other) >= duplicate_similarity for other in picked_shingles):
+            continue
+        picked.append({**item, "chunk": text, "tokens": tokens})
+        picked_shingles.append(shingles)
+        used += tokens
+    return _merge_neighbours(picked)
+
+
+def _merge_neighbours(picked: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    passages: List[Dict[str, Any]] = []
+    by_doc: Dict[str, List[Dict[str, Any]]] = {}
+    for item in picked:
+        if item.get("doc_uuid") and item.get("position") is not None:
+            by_doc.setdefault(item["doc_uuid"], []).append(item)
+        else:
+            passages.append(_passage(item))
+
+    for items in by_doc.values():
+        items.sort(key=lambda c: c["position"])
+        current = _passage(items[0])
+        last_position = items[0]["position"]
+        for item in items[1:]:
+            if item["position"] == last_position + 1:
+                current["chunk"] = _join_overlapping(current["chunk"], item["chunk"])
+                current["score"] = max(current["score"], item.get("score", 0.0))
+                current["tokens"] += item["tokens"]
+            else:
+                passages.append(current)
+                current = _passage(item)
+            last_position = item["position"]
+        passages.append(current)
+
+    passages.sort(key=lambda p: p["score"], reverse=True)
+    return passages
+
+
+def _passage(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "doc_uuid": item.get("doc_uuid"),
+        "doc_title": item.get("doc_title"),
+        "chunk": item["chunk"],
+        "score": item.get("score", 0.0),
+        "tokens": item["tokens"],
+    }
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """first + second without the text the chunker repeated at the start of second"""
+    probe = second[:32]
+    start = first.find(probe, max(0, len(first) - _MAX_OVERLAP_CHARS)) if probe else -1
+    while start != -1:
+        tail = first[start:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        start = first.find(probe, start + 1)
+    return f"{first}\n{second}"
+
+
+def _shingles(text: str) -> set:
+    normalized = re.sub(r"\s+", " ", text.lower())
+    if len(normalized) <= _SHINGLE_CHARS:
+        return {normalized}
+    return {normalized[i:i + _SHINGLE_CHARS] for i in range(len(normalized) - _SHINGLE_CHARS + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
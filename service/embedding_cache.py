@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+
+from define import (
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_CACHE_DB,
+    EMBEDDING_CACHE_DB_MAX_ITEMS,
+)
+
+# run size/age eviction on the SQLite tier every N writes
+_DB_EVICT_EVERY = 500
+
+
+def normalize_text(text: str) -> str:
+    """collapse whitespace, so formatting-only edits still hit the cache"""
+    return " ".join((text or "").split())
+
+
+def make_cache_key(model: str, text: str) -> str:
+    """content address of an embedding: hash of model name + normalized text"""
+    payload = f"{model}\n{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class _SqliteTier:
+    """
+    persistent tier, vectors stored as float32 blobs.
+    the row count is kept up to date by this process and recounted on each eviction pass
+    (other workers sharing the file write to it too)
+    """
+
+    def __init__(self, path: str, max_items: int, ttl: int):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_accessed "
+            "ON embedding_cache (accessed_at)"
+        )
+        self._conn.commit()
+        self._writes = 0
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    def get_many(self, keys: List[str], now: float) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        # stay below SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            marks = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT key, vector, created_at FROM embedding_cache WHERE key IN ({marks})",
+                part,
+            ).fetchall()
+            for key, blob, created_at in rows:
+                if self.ttl and now - created_at > self.ttl:
+                    continue
+                found[key] = array("f", blob).tolist()
+        if found:
+            self._conn.executemany(
+                "UPDATE embedding_cache SET accessed_at = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]], now: float) -> None:
+        rows = [(key, array("f", vec).tobytes(), now, now) for key, vec in items]
+        if not rows:
+            return
+        inserted = self._conn.executemany(
+            "INSERT OR IGNORE INTO embedding_cache (key, vector, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            rows,
+        ).rowcount
+        if inserted < len(rows):
+            # some keys were cached already (e.g. by another worker), refresh them
+            self._conn.executemany(
+                "UPDATE embedding_cache SET vector = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                [(blob, created_at, accessed_at, key) for key, blob, created_at, accessed_at in rows],
+            )
+        self._conn.commit()
+        self._count += inserted
+        self._writes += len(rows)
+        if self._writes >= _DB_EVICT_EVERY:
+            self._writes = 0
+            self.evict(now)
+
+    def evict(self, now: float) -> None:
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM embedding_cache WHERE created_at < ?", (now - self.ttl,)
+            )
+        count = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        overflow = count - self.max_items
+        if overflow > 0:
+            count -= self._conn.execute(
+                "DELETE FROM embedding_cache WHERE key IN ("
+                "SELECT key FROM embedding_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,),
+            ).rowcount
+        self._conn.commit()
+        self._count = count
+
+    def size(self) -> int:
+        return self._count
+
+
+class EmbeddingCache:
+    """
+    two tier embedding cache:
+    - in-process LRU, bounded by item count and entry age
+    - optional SQLite file shared across restarts (and workers on the same host)
+    the SQLite tier has its own lock, so disk I/O never holds up memory hits;
+    async callers use aget_many / aput_many, which run the disk tier in a thread
+    """
+
+    def __init__(
+        self,
+        max_items: int = EMBEDDING_CACHE_SIZE,
+        ttl: int = EMBEDDING_CACHE_TTL,
+        db_path: str = EMBEDDING_CACHE_DB,
+        db_max_items: int = EMBEDDING_CACHE_DB_MAX_ITEMS,
+    ):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db: Optional[_SqliteTier] = None
+        if db_path:
+            try:
+                self._db = _SqliteTier(db_path, db_max_items, ttl)
+            except sqlite3.Error as exc:
+                print(f"[WARN] embedding cache db unavailable, using memory only: {exc}")
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        now = time.time()
+        found, missing = self._get_memory(keys, now)
+        if missing and self._db is not None:
+            self._add_from_db(found, self._get_db(missing, now), now)
+        self._count_misses(len(keys) - len(found))
+        return found
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """get_many without blocking the event loop on the SQLite tier"""
+        now = time.time()
+        found, missing = self._get_memory(keys, now)
+        if missing and self._db is not None:
+            self._add_from_db(found, await asyncio.to_thread(self._get_db, missing, now), now)
+        self._count_misses(len(keys) - len(found))
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        self._put_memory(items, now)
+        if self._db is not None:
+            self._put_db(items, now)
+
+    async def aput_many(self, items: Dict[str, List[float]]) -> None:
+        """put_many without blocking the event loop on the SQLite tier"""
+        now = time.time()
+        self._put_memory(items, now)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_db, items, now)
+
+    def _get_memory(self, keys: List[str], now: float) -> Tuple[Dict[str, List[float]], List[str]]:
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for key in keys:
+                entry = self._items.get(key)
+                if entry is not None and self.ttl and now - entry[1] > self.ttl:
+                    del self._items[key]
+                    self.evictions += 1
+                    entry = None
+                if entry is None:
+                    missing.append(key)
+                    continue
+                self._items.move_to_end(key)
+                found[key] = entry[0]
+            self.hits += len(found)
+        return found, missing
+
+    def _get_db(self, keys: List[str], now: float) -> Dict[str, List[float]]:
+        with self._db_lock:
+            try:
+                return self._db.get_many(keys, now)
+            except sqlite3.Error as exc:
+                print(f"[WARN] embedding cache db read failed: {exc}")
+                return {}
+
+    def _add_from_db(self, found: Dict[str, List[float]], from_db: Dict[str, List[float]], now: float) -> None:
+        with self._lock:
+            for key, vec in from_db.items():
+                self._remember(key, vec, now)
+            self.db_hits += len(from_db)
+        found.update(from_db)
+
+    def _count_misses(self, misses: int) -> None:
+        with self._lock:
+            self.misses += misses
+
+    def _put_memory(self, items: Dict[str, List[float]], now: float) -> None:
+        with self._lock:
+            for key, vec in items.items():
+                self._remember(key, vec, now)
+
+    def _put_db(self, items: Dict[str, List[float]], now: float) -> None:
+        with self._db_lock:
+            try:
+                self._db.put_many(items.items(), now)
+            except sqlite3.Error as exc:
+                print(f"[WARN] embedding cache db write failed: {exc}")
+
+    def _remember(self, key: str, vec: List[float], now: float) -> None:
+        self._items[key] = (vec, now)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "db_size": self._db.size() if self._db is not None else None,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+            }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """get embedding cache (singleton pattern)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from define import (
+    CRYPTO_POOL_WORKERS,
+    CRYPTO_POOL_QUEUE,
+    PARSE_POOL_WORKERS,
+    PARSE_POOL_QUEUE,
+)
+
+# pool name -> (workers, queue limit)
+POOL_SIZES = {
+    "crypto": (CRYPTO_POOL_WORKERS, CRYPTO_POOL_QUEUE),
+    "parse": (PARSE_POOL_WORKERS, PARSE_POOL_QUEUE),
+}
+
+
+class PoolOverloadedError(Exception):
+    """a pool has max_workers calls running and max_queue waiting, answered with 503"""
+
+    def __init__(self, pool: str, retry_after: int = 1):
+        super().__init__(f"{pool} pool is overloaded, try again later")
+        self.pool = pool
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    thread pool with a hard limit on waiting calls.
+    - submit raises PoolOverloadedError instead of queueing past max_queue
+    - run awaits the call from async code, call blocks a worker/threadpool thread
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-pool")
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.peak_in_flight = 0
+        self.wait_seconds = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._running + self._queued >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolOverloadedError(self.name)
+            self._queued += 1
+            self.peak_in_flight = max(self.peak_in_flight, self._running + self._queued)
+        return self._pool.submit(self._run, time.monotonic(), fn, args, kwargs)
+
+    def _run(self, queued_at: float, fn: Callable, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self.wait_seconds += time.monotonic() - queued_at
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "saturation": (self._running + self._queued) / (self.max_workers + self.max_queue),
+                "peak_in_flight": self.peak_in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": self.wait_seconds * 1000 / finished if finished else 0.0,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    """get the bounded pool for crypto / parse / ocr work (singleton pattern)"""
+    executor: Optional[BoundedExecutor] = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                workers, queue = POOL_SIZES[name]
+                executor = BoundedExecutor(name, workers, queue)
+                _executors[name] = executor
+    return executor
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: get_executor(name).stats() for name in POOL_SIZES}
+
+
+def shutdown_executors() -> None:
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown()
+        _executors.clear()
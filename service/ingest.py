@@ -0,0 +1,569 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import openai
+from elasticsearch.exceptions import ConnectionError as ESConnectionError, TransportError
+
+from dao.ingest_job_dao import create_job, get_job, update_job, claim_job, list_resumable_jobs
+from define import (
+    INGEST_WORKERS,
+    INGEST_UPLOAD_DIR,
+    INGEST_JOB_STALE_SECONDS,
+    INGEST_JOB_MAX_ATTEMPTS,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_DIR_MAX_BYTES,
+    ARCHIVE_PARSE_PROCESSES,
+)
+from models.ingest import IngestJob
+from service.archive import is_archive, iter_archive_members
+from service.executor import PoolOverloadedError, get_executor
+from service.ocr import page_workers, set_page_workers
+from service.kb import (
+    SYNC_COUNTERS,
+    get_owned_kb,
+    is_supported_upload,
+    is_streamed_upload,
+    extract_docs_from_upload,
+    iter_docs_from_upload,
+    ingest_documents,
+    sync_documents,
+    restore_kb_service,
+)
+
+# per-document error messages kept on a job, and on each file of an archive job
+JOB_MAX_ERRORS = 100
+FILE_MAX_ERRORS = 20
+# a running job refreshes update_at at least this often, see INGEST_JOB_STALE_SECONDS
+HEARTBEAT_SECONDS = 30
+# stale jobs are looked for this often, a job interrupted just before a restart only goes stale later
+RESUME_SCAN_SECONDS = 60
+# uploads are copied to the spool file this much at a time
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# ES answers worth another attempt of the job later (rejected, overloaded, unavailable)
+TRANSIENT_ES_STATUSES = {429, 502, 503, 504}
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_parse_processes: Optional[ProcessPoolExecutor] = None
+_parse_processes_lock = threading.Lock()
+# jobs this process has queued and not finished, a resume scan does not queue them again
+_queued_jobs: set = set()
+_queued_jobs_lock = threading.Lock()
+_resume_stop = threading.Event()
+
+
+def _now_ms() -> int:
+    return int(datetime.utcnow().timestamp() * 1000)
+
+
+def get_ingest_pool() -> ThreadPoolExecutor:
+    """get the worker pool that runs import jobs (singleton pattern)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=max(1, INGEST_WORKERS), thread_name_prefix="ingest")
+    return _pool
+
+
+def _init_parse_process(ocr_page_workers: int) -> None:
+    # the parse processes already use the cores, each OCRs with its share of them
+    set_page_workers(ocr_page_workers)
+
+
+def get_parse_processes() -> ProcessPoolExecutor:
+    """
+    get the processes parsing archive members in parallel (singleton pattern).
+    spawned rather than forked, the parent runs ES/OpenAI client threads.
+    """
+    global _parse_processes
+    if _parse_processes is None:
+        with _parse_processes_lock:
+            if _parse_processes is None:
+                processes = ARCHIVE_PARSE_PROCESSES or os.cpu_count() or 1
+                _parse_processes = ProcessPoolExecutor(
+                    max_workers=processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_parse_process,
+                    initargs=(max(1, page_workers() // processes),),
+                )
+    return _parse_processes
+
+
+def _reset_parse_processes() -> None:
+    global _parse_processes
+    with _parse_processes_lock:
+        if _parse_processes is not None:
+            _parse_processes.shutdown(wait=False, cancel_futures=True)
+            _parse_processes = None
+
+
+def shutdown_ingest_pool() -> None:
+    """stop taking jobs, running ones are resumed by the next startup"""
+    global _pool
+    _resume_stop.set()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+    _reset_parse_processes()
+
+
+class UploadTooLargeError(ValueError):
+    """an upload is larger than UPLOAD_MAX_BYTES, answered with 413"""
+
+
+def _spooled_bytes() -> int:
+    """size of all uploads waiting in INGEST_UPLOAD_DIR (shared by the workers of a host)"""
+    total = 0
+    with os.scandir(INGEST_UPLOAD_DIR) as entries:
+        for entry in entries:
+            try:
+                total += entry.stat().st_size
+            except OSError:
+                continue
+    return total
+
+
+def _remove_file(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def spool_upload(fileobj, file_path: str) -> int:
+    """
+    copy an upload to file_path chunk by chunk, so only one chunk is in memory.
+    raises UploadTooLargeError past UPLOAD_MAX_BYTES and PoolOverloadedError
+    while the spool directory holds UPLOAD_DIR_MAX_BYTES.
+    """
+    os.makedirs(INGEST_UPLOAD_DIR, exist_ok=True)
+    if _spooled_bytes() >= UPLOAD_DIR_MAX_BYTES:
+        raise PoolOverloadedError("upload", retry_after=30)
+    size = 0
+    try:
+        with open(file_path, "wb") as out:
+            while True:
+                chunk = fileobj.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise UploadTooLargeError(f"file is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)} MB")
+                out.write(chunk)
+    except BaseException:
+        _remove_file(file_path)
+        raise
+    return size
+
+
+def submit_import_job(
+    owner_uuid: str,
+    kb_uuid: str,
+    filename: str,
+    fileobj,
+    sync: bool = False,
+) -> Optional[IngestJob]:
+    """
+    spool the upload to disk, record a queued job and hand it to the worker pool.
+    sync re-imports a file (or the files of an archive) imported before, see sync_documents.
+    returns None when the kb does not exist, raises ValueError for unsupported files
+    and UploadTooLargeError for files over the size limit.
+    """
+    if not get_owned_kb(kb_uuid, owner_uuid):
+        return None
+    if not (is_supported_upload(filename) or is_archive(filename)):
+        raise ValueError(
+            "Unsupported file format. Use markdown/txt, csv, docx, pptx, pdf, image files, or a zip/tar of them."
+        )
+
+    job_uuid = str(uuid.uuid4())
+    file_path = os.path.join(INGEST_UPLOAD_DIR, job_uuid + Path(filename or "").suffix.lower())
+    spool_upload(fileobj, file_path)
+
+    now = _now_ms()
+    job = IngestJob(
+        uuid=job_uuid,
+        kb_uuid=kb_uuid,
+        owner_uuid=owner_uuid,
+        filename=filename or "",
+        file_path=file_path,
+        sync=sync,
+        create_at=now,
+        update_at=now,
+    )
+    create_job(job.dict())
+    _submit_job(job.uuid)
+    return job
+
+
+def restore_kb_upload(owner_uuid: str, kb_uuid: str, fileobj) -> Optional[Dict[str, Any]]:
+    """
+    restore_kb_service for an uploaded bundle. it is spooled like an import upload first,
+    so the same size limits apply (UploadTooLargeError, PoolOverloadedError), and read from the spool file
+    """
+    if not get_owned_kb(kb_uuid, owner_uuid):
+        return None
+    file_path = os.path.join(INGEST_UPLOAD_DIR, f"restore-{uuid.uuid4()}.zip")
+    spool_upload(fileobj, file_path)
+    try:
+        with open(file_path, "rb") as bundle:
+            return restore_kb_service(owner_uuid, kb_uuid, bundle, max_errors=JOB_MAX_ERRORS)
+    finally:
+        _remove_file(file_path)
+
+
+def get_import_job_service(owner_uuid: str, job_uuid: str) -> Optional[Dict[str, Any]]:
+    """job state plus elapsed time and throughput"""
+    job = get_job(job_uuid)
+    if not job or job.get("owner_uuid") != owner_uuid:
+        return None
+    started = job.get("started_at")
+    elapsed = 0.0
+    if started:
+        elapsed = max(0.0, ((job.get("finished_at") or _now_ms()) - started) / 1000)
+    job.pop("file_path", None)
+    job["elapsed_seconds"] = round(elapsed, 3)
+    job["docs_per_second"] = round(job.get("processed", 0) / elapsed, 3) if elapsed else 0.0
+    return job
+
+
+def _submit_job(job_uuid: str) -> bool:
+    """queue a job on the ingest pool unless this process already has it queued"""
+    with _queued_jobs_lock:
+        if job_uuid in _queued_jobs:
+            return False
+        _queued_jobs.add(job_uuid)
+
+    def _done(_: Future) -> None:
+        with _queued_jobs_lock:
+            _queued_jobs.discard(job_uuid)
+
+    get_ingest_pool().submit(run_import_job, job_uuid).add_done_callback(_done)
+    return True
+
+
+def resume_import_jobs() -> None:
+    """
+    re-queue jobs left queued/running by a process that stopped, started at startup and
+    repeated every RESUME_SCAN_SECONDS until shutdown: a job only counts as stopped once
+    it is INGEST_JOB_STALE_SECONDS old, which is after a quick restart has done its first scan
+    """
+    _resume_stop.clear()
+    while True:
+        _resume_stale_jobs()
+        if _resume_stop.wait(RESUME_SCAN_SECONDS):
+            return
+
+
+def _resume_stale_jobs() -> None:
+    stale_before = _now_ms() - INGEST_JOB_STALE_SECONDS * 1000
+    try:
+        jobs = list_resumable_jobs(stale_before)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] failed to list import jobs to resume: {exc}")
+        return
+    for job in jobs:
+        if _resume_stop.is_set():
+            return
+        if _submit_job(job["uuid"]):
+            print(f"[INFO] resuming import job {job['uuid']} ({job.get('processed', 0)}/{job.get('total', 0)})")
+
+
+class _Heartbeat:
+    """keeps update_at fresh during long steps (parsing, OCR), so other workers do not take over the job"""
+
+    def __init__(self, job_uuid: str):
+        self.job_uuid = job_uuid
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f"ingest-heartbeat-{job_uuid}", daemon=True)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                update_job(self.job_uuid, {"update_at": _now_ms()})
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[WARN] import job {self.job_uuid} heartbeat failed: {exc}")
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _call_when_free(pool: str, fn: Callable, *args) -> Any:
+    """
+    background work waits for a slot in a full pool instead of failing like a request would.
+    only the submit is retried, an error raised by fn itself is not a reason to run it again
+    """
+    while True:
+        try:
+            future = get_executor(pool).submit(fn, *args)
+        except PoolOverloadedError:
+            time.sleep(1.0)
+            continue
+        return future.result()
+
+
+def run_import_job(job_uuid: str) -> None:
+    """parse, index and embed the file of a job, recording progress on the job document"""
+    stale_before = _now_ms() - INGEST_JOB_STALE_SECONDS * 1000
+    job = get_job(job_uuid)
+    if not job:
+        return
+    # a running job is only taken over once its worker stopped updating it
+    if job.get("status") == "running" and job.get("update_at", 0) >= stale_before:
+        return
+    now = _now_ms()
+    job = claim_job(
+        job_uuid,
+        {"status": "running", "stage": "parsing", "started_at": job.get("started_at") or now, "update_at": now},
+        ["queued", "running"],
+    )
+    if not job:
+        return
+
+    file_path = job["file_path"]
+    # the spool is only removed once the job has a final status, an interrupted job runs again from it
+    finished = False
+    try:
+        if job["attempts"] > INGEST_JOB_MAX_ATTEMPTS:
+            raise RuntimeError(f"gave up after {INGEST_JOB_MAX_ATTEMPTS} attempts")
+        if not get_owned_kb(job["kb_uuid"], job["owner_uuid"]):
+            raise RuntimeError("kb not found")
+        if is_archive(job["filename"]):
+            with _Heartbeat(job_uuid):
+                _run_archive_job(job)
+            finished = True
+            return
+        if is_streamed_upload(job["filename"]):
+            # parsed page by page in this worker while it is indexed, the total grows with it
+            docs = iter_docs_from_upload(job["filename"], file_path)
+        else:
+            with _Heartbeat(job_uuid):
+                docs = _call_when_free("parse", extract_docs_from_upload, job["filename"], file_path)
+            update_job(job_uuid, {"stage": "indexing", "total": len(docs), "update_at": _now_ms()})
+
+        def on_progress(summary: Dict[str, Any]) -> None:
+            update_job(job_uuid, {"stage": "indexing", **_summary_fields(summary), "update_at": _now_ms()})
+
+        # a streamed parse OCRs between groups, the heartbeat covers those gaps
+        with _Heartbeat(job_uuid):
+            if job.get("sync"):
+                # a sync skips what an interrupted run already wrote by itself, no resume counters needed
+                summary = sync_documents(
+                    job["kb_uuid"], job["filename"], docs, on_progress=on_progress, max_errors=JOB_MAX_ERRORS
+                )
+            else:
+                summary = ingest_documents(
+                    job["kb_uuid"],
+                    docs,
+                    summary={key: job.get(key) for key in ("processed", "success", "failed", "errors")},
+                    on_progress=on_progress,
+                    id_namespace=job_uuid,
+                    max_errors=JOB_MAX_ERRORS,
+                    source=job["filename"],
+                )
+        now = _now_ms()
+        update_job(
+            job_uuid,
+            {
+                "status": "succeeded",
+                "stage": "done",
+                **_summary_fields(summary),
+                "message": None,
+                "update_at": now,
+                "finished_at": now,
+            },
+        )
+        finished = True
+    except Exception as exc:  # pylint: disable=broad-except
+        if _is_transient(exc) and job["attempts"] < INGEST_JOB_MAX_ATTEMPTS:
+            # left queued with its progress: the resume scan takes it again once it is stale,
+            # ingest_documents skips what was processed, the archive path the finished members
+            print(f"[WARN] import job {job_uuid} interrupted, retried later: {exc}")
+            update_job(
+                job_uuid,
+                {"status": "queued", "stage": "queued", "message": f"retrying: {exc}", "update_at": _now_ms()},
+            )
+            return
+        print(f"[WARN] import job {job_uuid} failed: {exc}")
+        now = _now_ms()
+        update_job(
+            job_uuid,
+            {"status": "failed", "stage": "done", "message": str(exc), "update_at": now, "finished_at": now},
+        )
+        finished = True
+    finally:
+        if finished:
+            _remove_file(file_path)
+            shutil.rmtree(file_path + ".d", ignore_errors=True)
+
+
+def _is_transient(exc: Exception) -> bool:
+    """errors a later attempt can get past: ES / OpenAI unreachable, throttled or overloaded"""
+    if isinstance(exc, (ESConnectionError, PoolOverloadedError)):
+        return True
+    if isinstance(exc, TransportError):
+        return exc.status_code in TRANSIENT_ES_STATUSES
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+
+def _summary_fields(summary: Dict[str, Any]) -> Dict[str, Any]:
+    """job fields of an ingest_documents / sync_documents summary"""
+    fields = {key: summary[key] for key in ("total", "processed", "success", "failed", "errors")}
+    if "created" in summary:
+        fields["changes"] = {key: summary[key] for key in SYNC_COUNTERS}
+    return fields
+
+
+def _job_totals(files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """job counters summed over the files of an archive job"""
+    totals: Dict[str, Any] = {"total": 0, "processed": 0, "success": 0, "failed": 0, "errors": []}
+    changes = {key: 0 for key in SYNC_COUNTERS}
+    for entry in files:
+        for key in ("processed", "success", "failed"):
+            totals[key] += entry.get(key, 0)
+        for key, value in (entry.get("changes") or {}).items():
+            changes[key] = changes.get(key, 0) + value
+        totals["total"] += entry.get("docs", 0)
+        messages = list(entry.get("errors") or [])
+        if entry.get("status") == "failed" and entry.get("error"):
+            messages.insert(0, entry["error"])
+        for message in messages:
+            if len(totals["errors"]) < JOB_MAX_ERRORS:
+                totals["errors"].append(f"{entry['name']}: {message}")
+    if any(entry.get("changes") for entry in files):
+        totals["changes"] = changes
+    return totals
+
+
+def _run_archive_job(job: Dict[str, Any]) -> None:
+    """
+    import every supported file of a zip/tar upload:
+    - members are unpacked one by one and parsed in parallel by the parse processes,
+      at most two per process are unpacked/parsed ahead of the indexing
+    - parsed documents are indexed and embedded file by file, in archive order
+    - members with the same content (sha256) are imported once
+    - job.files records a summary per member, a resumed job skips finished members
+      and continues the member it was indexing
+    - sync jobs diff every member against the docs imported from it before (sync_documents),
+      members missing from the archive are left alone
+    """
+    job_uuid = job["uuid"]
+    files: List[Dict[str, Any]] = list(job.get("files") or [])
+    by_name = {entry["name"]: entry for entry in files}
+    seen = {entry["sha256"]: entry["name"] for entry in files if entry.get("sha256")}
+
+    def save(stage: str = "indexing") -> None:
+        update_job(job_uuid, {"stage": stage, "files": files, **_job_totals(files), "update_at": _now_ms()})
+
+    def record(entry: Dict[str, Any]) -> Dict[str, Any]:
+        if entry["name"] in by_name:
+            by_name[entry["name"]].update(entry)
+            return by_name[entry["name"]]
+        files.append(entry)
+        by_name[entry["name"]] = entry
+        return entry
+
+    def index_member(member: Dict[str, Any], future: Future) -> None:
+        try:
+            docs = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            record({"name": member["name"], "sha256": member["sha256"], "status": "failed", "error": str(exc)})
+            save()
+            return
+        finally:
+            _remove_file(member["path"])
+        entry = record({"name": member["name"], "sha256": member["sha256"], "status": "indexing", "docs": len(docs)})
+
+        def apply(summary: Dict[str, Any]) -> None:
+            entry.update(_summary_fields(summary))
+            entry.pop("total", None)
+
+        def on_progress(summary: Dict[str, Any]) -> None:
+            apply(summary)
+            save()
+
+        if job.get("sync"):
+            summary = sync_documents(
+                job["kb_uuid"], member["name"], docs, on_progress=on_progress, max_errors=FILE_MAX_ERRORS
+            )
+        else:
+            summary = ingest_documents(
+                job["kb_uuid"],
+                docs,
+                summary={key: entry[key] for key in ("processed", "success", "failed", "errors") if key in entry},
+                on_progress=on_progress,
+                id_namespace=str(uuid.uuid5(uuid.UUID(job_uuid), member["sha256"])),
+                max_errors=FILE_MAX_ERRORS,
+                source=member["name"],
+            )
+        apply(summary)
+        entry["status"] = "done"
+        save()
+
+    update_job(job_uuid, {"stage": "parsing", "update_at": _now_ms()})
+    pool = get_parse_processes()
+    in_flight = 2 * (ARCHIVE_PARSE_PROCESSES or os.cpu_count() or 1)
+    pending: Deque[Tuple[Dict[str, Any], Future]] = deque()
+    try:
+        for member in iter_archive_members(job["file_path"], job["filename"], job["file_path"] + ".d"):
+            done = by_name.get(member["name"], {}).get("status") not in (None, "indexing")
+            if done or member["path"] is None:
+                if member["path"] is not None:
+                    _remove_file(member["path"])
+                if not done:
+                    record({"name": member["name"], "status": "skipped", "error": member["error"]})
+                continue
+            first = seen.setdefault(member["sha256"], member["name"])
+            if first != member["name"]:
+                _remove_file(member["path"])
+                record(
+                    {
+                        "name": member["name"],
+                        "sha256": member["sha256"],
+                        "status": "duplicate",
+                        "error": f"same content as {first}",
+                    }
+                )
+                continue
+            pending.append((member, pool.submit(extract_docs_from_upload, member["name"], member["path"])))
+            while len(pending) >= in_flight:
+                index_member(*pending.popleft())
+        while pending:
+            index_member(*pending.popleft())
+    except BrokenProcessPool:
+        # a parser crashed its process, the next job gets a fresh pool
+        _reset_parse_processes()
+        raise RuntimeError("a parse process crashed")
+
+    now = _now_ms()
+    update_job(
+        job_uuid,
+        {
+            "status": "succeeded",
+            "stage": "done",
+            "files": files,
+            **_job_totals(files),
+            "message": None,
+            "update_at": now,
+            "finished_at": now,
+        },
+    )
@@ -1,45 +1,53 @@
+import asyncio
+import hashlib
 import uuid
-import math
-import io
-import json
-import zipfile
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Callable
 from pathlib import Path
 import re
 from collections import Counter
+from itertools import islice
 
 import pandas as pd
 from docx import Document as DocxDocument
 from pptx import Presentation
-from pdfminer.high_level import extract_text as extract_pdf_text
+from pdfminer.high_level import extract_pages
+from pdfminer.layout import LTTextContainer
 from PIL import Image
 
-# OCR support (optional - graceful fallback if not installed)
-try:
-    import pytesseract
-    from pdf2image import convert_from_bytes
-    OCR_AVAILABLE = True
-except ImportError:
-    OCR_AVAILABLE = False
-    print("[WARN] pytesseract/pdf2image not installed, OCR disabled")
-
 from dao.kb_dao import (
     create_kb,
     update_kb,
     delete_kb,
     list_kb,
     get_kb,
+    aget_kb,
     create_doc,
+    acreate_doc,
     update_doc,
     delete_doc,
+    delete_docs_by_uuid,
     list_docs,
+    iter_docs,
     get_doc,
     upsert_doc_embeddings,
-    list_doc_embeddings,
-    search_doc_embeddings_by_vector,
-    search_docs_fulltext,
+    aupsert_doc_embeddings,
+    bulk_create_docs,
+    bulk_upsert_doc_embeddings,
+    get_source_doc_hashes,
+    get_doc_embedding_ids,
+    write_doc_embedding_changes,
+    refresh_kb_indices,
+    bump_kb_generation,
+    iter_doc_embeddings,
+    LOCAL_SCORING_FIELDS,
+    CHUNK_META_FIELDS,
+    kb_generation,
+    asearch_doc_embeddings_by_vector,
+    asearch_docs_fulltext,
+    asearch_chunks_fulltext,
 )
+from dao.vector_index import VectorMatrix
 from models.kb import (
     KnowledgeBase,
     KnowledgeBaseCreate,
@@ -48,25 +56,47 @@ from models.kb import (
     KnowledgeDocumentCreate,
     KnowledgeDocumentUpdate,
     KnowledgeQAReply,
+    EMBEDDING_DIMS,
+)
+from service.bundle import (
+    BUNDLE_FORMAT_VERSION,
+    BUNDLE_KB_FILE,
+    BUNDLE_DOCS_FILE,
+    BUNDLE_EMBEDDINGS_FILE,
+    BUNDLE_EMBEDDINGS_BIN_FILE,
+    BUNDLE_EMBEDDINGS_INDEX_FILE,
+    BUNDLE_MANIFEST_FILE,
+    EMBEDDING_FORMATS,
+    EmbeddingMatrixWriter,
+    BundleReader,
+    stream_zip,
+    iter_ndjson,
+    json_bytes,
 )
-from service.openai_service import chat_completion, create_embeddings
+from define import OCR_MIN_PAGE_CHARS, CSV_CHUNK_ROWS, PARSE_PART_MAX_TOKENS, QA_RETRIEVAL_MODE, HYBRID_CANDIDATES
+from service.chunker import Chunker, get_chunker, chunk_uuids, count_tokens
+from service.context import pack_context
+from service.retrieval import RETRIEVAL_MODES, reciprocal_rank_fusion, stage_timer
+from service.search_cache import get_search_cache, search_key, kb_settled
+from service.answer_cache import get_answer_cache
+from service.ocr import OCR_AVAILABLE, iter_pdf_ocr_pages, ocr_image
+from service.openai_service import (
+    achat_completion,
+    acreate_embeddings,
+    create_embeddings_batch,
+    acreate_embeddings_batch,
+)
+
+# number of imported docs whose chunks are embedded together
+IMPORT_EMBED_DOC_GROUP = 100
+# docs / vectors written per bulk round when restoring a bundle
+RESTORE_BATCH = 500
 
 
 def _now_ms() -> int:
     return int(datetime.utcnow().timestamp() * 1000)
 
 
-def _cosine_similarity(a: List[float], b: List[float]) -> float:
-    if len(a) != len(b):
-        return 0.0
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(y * y for y in b))
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot / (norm_a * norm_b)
-
-
 def _get_owned_kb(kb_uuid: str, owner_uuid: str) -> Optional[KnowledgeBase]:
     kb_data = get_kb(kb_uuid, owner_uuid=owner_uuid)
     if not kb_data:
@@ -78,6 +108,13 @@ def get_owned_kb(kb_uuid: str, owner_uuid: str) -> Optional[KnowledgeBase]:
     return _get_owned_kb(kb_uuid, owner_uuid)
 
 
+async def aget_owned_kb(kb_uuid: str, owner_uuid: str) -> Optional[KnowledgeBase]:
+    kb_data = await aget_kb(kb_uuid, owner_uuid=owner_uuid)
+    if not kb_data:
+        return None
+    return KnowledgeBase(**kb_data)
+
+
 # ==== kb ====
 
 
@@ -87,6 +124,8 @@ def create_kb_service(owner_uuid: str, req: KnowledgeBaseCreate) -> KnowledgeBas
         name=req.name,
         description=req.description,
         owner_uuid=owner_uuid,
+        chunk_tokens=req.chunk_tokens,
+        chunk_overlap=req.chunk_overlap,
         create_at=_now_ms(),
         update_at=_now_ms(),
     )
@@ -104,6 +143,10 @@ def update_kb_service(owner_uuid: str, uuid_: str, req: KnowledgeBaseUpdate) ->
         fields["name"] = req.name
     if req.description is not None:
         fields["description"] = req.description
+    if req.chunk_tokens is not None:
+        fields["chunk_tokens"] = req.chunk_tokens
+    if req.chunk_overlap is not None:
+        fields["chunk_overlap"] = req.chunk_overlap
     if not fields:
         return kb
 
@@ -132,7 +175,8 @@ def list_kb_service(owner_uuid: str, page: int, size: int) -> Dict[str, Any]:
 def create_doc_service(
     owner_uuid: str, kb_uuid: str, req: KnowledgeDocumentCreate
 ) -> Optional[KnowledgeDocument]:
-    if not _get_owned_kb(kb_uuid, owner_uuid):
+    kb = _get_owned_kb(kb_uuid, owner_uuid)
+    if not kb:
         return None
 
     doc = KnowledgeDocument(
@@ -146,7 +190,7 @@ def create_doc_service(
     create_doc(doc.dict())
 
     # generate embedding and write into
-    _generate_and_store_embeddings_for_doc(doc)
+    _generate_and_store_embeddings_for_doc(doc, _kb_chunker(kb))
 
     return doc
 
@@ -158,7 +202,8 @@ def update_doc_service(
     if not doc_data:
         return None
     kb_uuid = doc_data.get("kb_uuid")
-    if not kb_uuid or not _get_owned_kb(kb_uuid, owner_uuid):
+    kb = _get_owned_kb(kb_uuid, owner_uuid) if kb_uuid else None
+    if not kb:
         return None
 
     fields: Dict[str, Any] = {}
@@ -170,13 +215,13 @@ def update_doc_service(
         return KnowledgeDocument(**doc_data)
 
     fields["update_at"] = _now_ms()
-    update_doc(uuid_, fields)
+    update_doc(uuid_, fields, kb_uuid)
     doc_data.update(fields)
     doc = KnowledgeDocument(**doc_data)
 
     # if content has changed, regenerate embedding
     if req.content is not None:
-        _generate_and_store_embeddings_for_doc(doc)
+        _generate_and_store_embeddings_for_doc(doc, _kb_chunker(kb))
 
     return doc
 
@@ -185,7 +230,7 @@ def delete_doc_service(owner_uuid: str, uuid_: str) -> bool:
     doc_data = get_doc(uuid_)
     if not doc_data or not _get_owned_kb(doc_data.get("kb_uuid", ""), owner_uuid):
         return False
-    delete_doc(uuid_)
+    delete_doc(uuid_, doc_data["kb_uuid"])
     return True
 
 
@@ -195,60 +240,128 @@ def list_docs_service(owner_uuid: str, kb_uuid: str, page: int, size: int) -> Di
     return list_docs(kb_uuid, page, size)
 
 
-def _chunk_text(content: str, max_chars: int = 400) -> List[str]:
+def _kb_chunker(kb: Optional[KnowledgeBase]) -> Chunker:
+    """chunker with the kb's chunk budget (service/chunker.py)"""
+    if kb is None:
+        return get_chunker()
+    return get_chunker(kb.chunk_tokens, kb.chunk_overlap)
+
+
+def _load_kb_chunker(kb_uuid: str) -> Chunker:
+    kb_data = get_kb(kb_uuid)
+    return _kb_chunker(KnowledgeBase(**kb_data) if kb_data else None)
+
+
+def _section_id(seen: Counter, title: str) -> str:
     """
-    currently kb is mainly used for ES query, not fed to OpenAI.
-    keep a simple chunking function for future extension.
+    place of a parsed doc in its file: the title, numbered from the second doc with the same title
+    (e.g. "Page 3 - Part 1", "Row 12", "Section#2"). seen counts the titles of the docs before it
     """
-    content = content.strip()
-    if not content:
-        return []
-    chunks: List[str] = []
-    start = 0
-    while start < len(content):
-        end = min(start + max_chars, len(content))
-        chunks.append(content[start:end])
-        start = end
-    return chunks
+    seen[title] += 1
+    return title if seen[title] == 1 else f"{title}#{seen[title]}"
 
 
-def _generate_and_store_embeddings_for_doc(doc: KnowledgeDocument) -> None:
-    chunks = _chunk_text(doc.content)
-    if not chunks:
-        return
+def _content_hash(title: str, content: str) -> str:
+    return hashlib.sha256(f"{title}\n{content}".encode("utf-8")).hexdigest()
+
 
-    vectors: List[Dict[str, Any]] = []
-    for chunk in chunks:
-        embedding = create_embeddings(chunk)
-        vectors.append(
+def _source_doc_uuid(kb_uuid: str, source: str, section: str) -> str:
+    return str(uuid.uuid5(uuid.UUID(kb_uuid), f"{source}\n{section}"))
+
+
+def _generate_and_store_embeddings_for_doc(doc: KnowledgeDocument, chunker: Chunker) -> None:
+    vectors = _build_doc_vectors([doc], chunker).get(doc.uuid)
+    if vectors:
+        upsert_doc_embeddings(doc.kb_uuid, doc.uuid, vectors)
+
+
+def _build_doc_vectors(docs: List[KnowledgeDocument], chunker: Chunker) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    chunk every doc and embed all chunks with batched requests.
+    returns doc uuid -> vectors, docs without content are left out.
+    """
+    pending: List[tuple] = []
+    for doc in docs:
+        chunks = chunker.split(doc.content)
+        for position, (chunk_uuid, chunk) in enumerate(zip(chunk_uuids(doc.uuid, chunks), chunks)):
+            pending.append((doc, chunk_uuid, chunk, position))
+    if not pending:
+        return {}
+
+    embeddings = create_embeddings_batch([chunk for _, _, chunk, _ in pending])
+
+    vectors_by_doc: Dict[str, List[Dict[str, Any]]] = {}
+    for (doc, chunk_uuid, chunk, position), embedding in zip(pending, embeddings):
+        vectors_by_doc.setdefault(doc.uuid, []).append(
             {
-                "uuid": str(uuid.uuid4()),
+                "uuid": chunk_uuid,
                 "chunk": chunk,
                 "embedding": embedding,
+                **_chunk_meta(doc.title, chunk, position),
                 "create_at": _now_ms(),
             }
         )
-    upsert_doc_embeddings(doc.kb_uuid, doc.uuid, vectors)
+    return vectors_by_doc
 
 
-def qa_service(owner_uuid: str, kb_uuid: str, question: str, top_k: int = 3) -> Optional[KnowledgeQAReply]:
-    if not _get_owned_kb(kb_uuid, owner_uuid):
+def _chunk_meta(doc_title: str, chunk: str, position: int) -> Dict[str, Any]:
+    """metadata stored with a vector, so QA can pack its prompt without re-tokenizing"""
+    return {"tokens": count_tokens(chunk), "doc_title": doc_title, "position": position}
+
+
+async def qa_service(
+    owner_uuid: str,
+    kb_uuid: str,
+    question: str,
+    top_k: int = 3,
+    mode: Optional[str] = None,
+    timings: Optional[Dict[str, float]] = None,
+    bypass_cache: bool = False,
+) -> Optional[KnowledgeQAReply]:
+    """
+    - mode: retrieval mode (vector / hybrid), QA_RETRIEVAL_MODE when unset
+    - timings: filled with the latency (ms) of each stage
+    - bypass_cache: always ask the LLM, the fresh answer replaces the cached one
+    a question close enough to one answered before for the kb gets the cached answer,
+    without an LLM call or a new Q/A doc (see service/answer_cache.py)
+    """
+    kb = await aget_owned_kb(kb_uuid, owner_uuid)
+    if not kb:
         return None
 
-    context_chunks = _retrieve_context_chunks(kb_uuid, question, top_k)
-    messages = _build_messages_with_context(question, context_chunks)
-    answer = chat_completion(messages)
+    mode = mode or QA_RETRIEVAL_MODE
+    answers = get_answer_cache()
+    generation, _ = kb_generation(kb.dict())
+    cacheable = kb_settled(kb.dict())
+    with stage_timer(timings, "answer_cache"):
+        # the retrieval below embeds the question again, the embedding cache answers that
+        question_vector = await acreate_embeddings(question)
+        cached = None if bypass_cache else answers.get(kb_uuid, generation, top_k, mode, question_vector)
+    if cached is not None:
+        return KnowledgeQAReply(answer=cached["answer"], context=cached["context"], cached=True)
+
+    context_chunks = await _retrieve_context_chunks(kb_uuid, question, top_k, mode=mode, timings=timings)
+    # bounded prompt: token budget, neighbouring chunks merged, near-duplicates dropped
+    with stage_timer(timings, "pack"):
+        passages = pack_context(context_chunks)
+        messages = _build_messages_with_context(question, passages)
+    with stage_timer(timings, "llm"):
+        answer = await achat_completion(messages)
 
     # write current Q&A into kb, and generate vector for the answer
-    save_qa_to_kb(kb_uuid, question, answer)
+    with stage_timer(timings, "save"):
+        await save_qa_to_kb(kb_uuid, question, answer)
 
-    context_texts = [item["chunk"] for item in context_chunks]
+    context_texts = [item["chunk"] for item in passages]
+    if cacheable:
+        answers.put(kb_uuid, generation, top_k, mode, question_vector, answer, context_texts)
     return KnowledgeQAReply(answer=answer, context=context_texts)
 
 
-def save_qa_to_kb(kb_uuid: str, question: str, answer: str) -> None:
+async def save_qa_to_kb(kb_uuid: str, question: str, answer: str) -> None:
     """
-    write current Q&A into kb, and generate vector for the answer
+    write current Q&A into kb, and generate vector for the answer.
+    not a content write: cached search results and answers of the kb stay valid
     """
     doc = KnowledgeDocument(
         uuid=str(uuid.uuid4()),
@@ -258,47 +371,55 @@ def save_qa_to_kb(kb_uuid: str, question: str, answer: str) -> None:
         create_at=_now_ms(),
         update_at=_now_ms(),
     )
-    create_doc(doc.dict())
+    await acreate_doc(doc.dict(), invalidate=False)
 
     # only generate embedding for the answer text
-    embedding = create_embeddings(answer)
-    upsert_doc_embeddings(
+    embeddings = await acreate_embeddings_batch([answer])
+    await aupsert_doc_embeddings(
         kb_uuid,
         doc.uuid,
         [
             {
                 "uuid": str(uuid.uuid4()),
                 "chunk": answer,
-                "embedding": embedding,
+                "embedding": embeddings[0],
+                **_chunk_meta(doc.title, answer, 0),
                 "create_at": _now_ms(),
             }
         ],
+        invalidate=False,
     )
 
 
-def semantic_search_service(owner_uuid: str, kb_uuid: str, query: str, top_k: int = 5) -> Optional[List[Dict[str, Any]]]:
+async def semantic_search_service(
+    owner_uuid: str,
+    kb_uuid: str,
+    query: str,
+    top_k: int = 5,
+    mode: str = "vector",
+    timings: Optional[Dict[str, float]] = None,
+) -> Optional[List[Dict[str, Any]]]:
     """
     do vector semantic search for the specified kb:
     - generate embedding for the query
     - fetch all vectors under the kb from kb_doc_embed_index
     - calculate cosine similarity, return top_k chunks + scores
+    - mode hybrid: also BM25 over the chunk text, fused by reciprocal rank (see _aretrieve)
+    - timings: filled with the latency (ms) of each stage
+    results are cached per kb generation, see service/search_cache.py
     """
-    if not _get_owned_kb(kb_uuid, owner_uuid):
+    kb = await aget_owned_kb(kb_uuid, owner_uuid)
+    if not kb:
         return None
 
-    query_vector = create_embeddings(query)
-    results: List[Dict[str, Any]] = []
-    try:
-        results = search_doc_embeddings_by_vector(kb_uuid, query_vector, top_k)
-    except Exception as exc:  # pylint: disable=broad-except
-        print(f"[WARN] ES vector search failed, falling back to local scoring: {exc}")
-        vectors = list_doc_embeddings(kb_uuid)
-        results = _score_vectors_locally(
-            vectors,
-            query_vector,
-            top_k=top_k,
-            score_threshold=0.0,
-        )
+    cache = get_search_cache()
+    with stage_timer(timings, "cache"):
+        key, cacheable = search_key("semantic", kb.dict(), query, top_k, mode)
+        cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    results = await _aretrieve(kb_uuid, query, top_k, mode=mode, timings=timings)
 
     formatted: List[Dict[str, Any]] = []
     for item in results[:top_k]:
@@ -308,12 +429,15 @@ def semantic_search_service(owner_uuid: str, kb_uuid: str, query: str, top_k: in
                 "doc_uuid": item.get("doc_uuid"),
                 "chunk": item.get("chunk", ""),
                 "score": item.get("score", 0.0),
+                **{field: item[field] for field in ("vector_score", "bm25_score") if field in item},
             }
         )
+    if cacheable:
+        cache.put(key, formatted)
     return formatted
 
 
-def fulltext_search_service(
+async def fulltext_search_service(
     owner_uuid: str,
     kb_uuid: str,
     query: str,
@@ -321,90 +445,368 @@ def fulltext_search_service(
 ) -> Optional[List[Dict[str, Any]]]:
     """
     Keyword-based full-text search with ES highlighting.
+    results are cached per kb generation, see service/search_cache.py
     """
-    if not _get_owned_kb(kb_uuid, owner_uuid):
+    kb = await aget_owned_kb(kb_uuid, owner_uuid)
+    if not kb:
         return None
-    return search_docs_fulltext(kb_uuid, query, top_k)
 
+    cache = get_search_cache()
+    key, cacheable = search_key("fulltext", kb.dict(), query, top_k)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
 
-def import_kb_file_service(
-    owner_uuid: str,
+    results = await asearch_docs_fulltext(kb_uuid, query, top_k)
+    if cacheable:
+        cache.put(key, results)
+    return results
+
+
+def ingest_documents(
     kb_uuid: str,
-    filename: str,
-    file_bytes: bytes,
-) -> Optional[Dict[str, Any]]:
+    payloads: Iterable[Dict[str, str]],
+    summary: Optional[Dict[str, Any]] = None,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    id_namespace: Optional[str] = None,
+    max_errors: int = 20,
+    source: Optional[str] = None,
+) -> Dict[str, Any]:
     """
-    Parse uploaded file(s) and insert docs into KB.
-    Supports markdown/txt/csv/docx/pptx/pdf.
+    index parsed docs and their vectors, one group of IMPORT_EMBED_DOC_GROUP docs at a time.
+    - payloads: a list or an iterator (iter_docs_from_upload), read one group at a time
+    - summary: counters of an earlier run, its "processed" payloads are skipped (resume)
+    - on_progress: called with the summary after every group
+    - id_namespace: derive doc uuids from it and the payload position,
+      so a resumed run overwrites the docs of an interrupted group instead of duplicating them
+    - source: file the payloads were parsed from, recorded with section and content hash
+      so that a later sync_documents of the same file can diff against them (it matches
+      docs on source + section, whatever their uuid)
     """
-    if not _get_owned_kb(kb_uuid, owner_uuid):
-        return None
+    summary = {"processed": 0, "success": 0, "failed": 0, "errors": [], **(summary or {})}
+    # a generator (streamed PDF parse) has no length, its total grows as docs arrive
+    known_total = len(payloads) if isinstance(payloads, list) else None
+    summary["total"] = known_total if known_total is not None else summary["processed"]
+    resumed = summary["processed"] > 0
+    seen: Counter = Counter()
+    chunker = _load_kb_chunker(kb_uuid)
+
+    def _record_error(message: str) -> None:
+        summary["failed"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append(message)
+
+    def _doc_uuid(idx: int) -> str:
+        if id_namespace:
+            return str(uuid.uuid5(uuid.UUID(id_namespace), str(idx)))
+        return str(uuid.uuid4())
+
+    def _title(payload: Dict[str, str], idx: int) -> str:
+        return (payload.get("title") or f"Imported {idx}").strip()
+
+    rows = iter(payloads)
+    # payloads done by an earlier run still number the sections after them
+    for idx, payload in enumerate(islice(rows, summary["processed"]), start=1):
+        _section_id(seen, _title(payload, idx))
+
+    start = summary["processed"]
+    while True:
+        batch = list(islice(rows, IMPORT_EMBED_DOC_GROUP))
+        if not batch:
+            break
+        pending: List[KnowledgeDocument] = []
+        for idx, payload in enumerate(batch, start=start + 1):
+            title = _title(payload, idx)
+            section = _section_id(seen, title)
+            content = (payload.get("content") or "").strip()
+            if not content:
+                _record_error(f"{title or 'Document'} has empty content, skipped")
+                continue
+            pending.append(
+                KnowledgeDocument(
+                    uuid=_doc_uuid(idx),
+                    kb_uuid=kb_uuid,
+                    title=title or f"Imported {idx}",
+                    content=content,
+                    source=source,
+                    section=section if source else None,
+                    content_hash=_content_hash(title, content) if source else None,
+                    create_at=_now_ms(),
+                    update_at=_now_ms(),
+                )
+            )
 
-    docs = _extract_docs_from_upload(filename, file_bytes)
-    summary = {
-        "total": len(docs),
-        "success": 0,
-        "failed": 0,
-        "errors": [],
-    }
+        titles = {doc.uuid: doc.title[:50] or "Document" for doc in pending}
+        failed_docs = set()
+        for error in bulk_create_docs([doc.dict() for doc in pending], invalidate=False):
+            failed_docs.add(error["uuid"])
+            _record_error(f"{titles.get(error['uuid'], 'Document')}: {error['error']}")
+        group = [doc for doc in pending if doc.uuid not in failed_docs]
 
-    for idx, payload in enumerate(docs, start=1):
-        title = (payload.get("title") or f"Imported {idx}").strip()
-        content = (payload.get("content") or "").strip()
-        if not content:
-            summary["failed"] += 1
-            if len(summary["errors"]) < 20:
-                summary["errors"].append(f"{title or 'Document'} has empty content, skipped")
-            continue
+        # one failed embedding request only affects its own group
         try:
-            create_doc_service(
-                owner_uuid,
-                kb_uuid,
-                KnowledgeDocumentCreate(title=title or f"Imported {idx}", content=content),
-            )
-            summary["success"] += 1
+            vectors_by_doc = _build_doc_vectors(group, chunker)
         except Exception as exc:  # pylint: disable=broad-except
-            summary["failed"] += 1
-            if len(summary["errors"]) < 20:
-                summary["errors"].append(f"{title[:50] or 'Document'}: {exc}")
+            vectors_by_doc = None
+            for doc in group:
+                _record_error(f"{titles[doc.uuid]}: {exc}")
+        if vectors_by_doc is not None:
+            # the first group after a resume may have vectors from the interrupted run
+            embed_errors = bulk_upsert_doc_embeddings(
+                kb_uuid, vectors_by_doc, replace_existing=resumed, invalidate=False
+            )
+            group_failed = set()
+            for error in embed_errors:
+                if error["doc_uuid"] in group_failed:
+                    continue
+                group_failed.add(error["doc_uuid"])
+                _record_error(f"{titles.get(error['doc_uuid'], 'Document')}: {error['error']}")
+            summary["success"] += len(group) - len(group_failed)
+
+        # one generation bump per group, searches during a long import see what is indexed so far
+        bump_kb_generation(kb_uuid)
+        resumed = False
+        start += len(batch)
+        summary["processed"] = start
+        if known_total is None:
+            summary["total"] = start
+        if on_progress is not None:
+            on_progress(summary)
+
+    if summary["processed"]:
+        refresh_kb_indices(kb_uuid)
+    return summary
 
+
+SYNC_COUNTERS = ("created", "updated", "unchanged", "deleted", "chunks_embedded", "chunks_reused")
+
+
+def sync_documents(
+    kb_uuid: str,
+    source: str,
+    payloads: Iterable[Dict[str, str]],
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    max_errors: int = 20,
+) -> Dict[str, Any]:
+    """
+    make the docs imported from source match payloads, touching only what changed:
+    - docs are keyed by source + section, docs with an unchanged content hash are skipped.
+      a section imported before keeps its doc uuid, new sections get one derived from both
+    - vectors of changed docs are keyed by chunk hash, only new chunks are embedded
+    - docs whose section is gone from the source are deleted with their vectors
+    the content hash of a doc is written last, so a failed or interrupted sync is simply run again.
+    """
+    known_total = len(payloads) if isinstance(payloads, list) else None
+    summary: Dict[str, Any] = {"total": known_total or 0, "processed": 0, "success": 0, "failed": 0, "errors": []}
+    summary.update({key: 0 for key in SYNC_COUNTERS})
+    existing = get_source_doc_hashes(kb_uuid, source)
+    # a file imported twice without sync has two docs per section, the extra ones are deleted
+    by_section: Dict[str, Dict[str, Any]] = {}
+    for doc in sorted(existing.values(), key=lambda d: d.get("create_at") or 0):
+        if doc.get("section"):
+            by_section.setdefault(doc["section"], doc)
+    seen: Counter = Counter()
+    chunker = _load_kb_chunker(kb_uuid)
+    keep = set()
+
+    def _record_error(message: str) -> None:
+        summary["failed"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append(message)
+
+    rows = iter(payloads)
+    start = 0
+    while True:
+        batch = list(islice(rows, IMPORT_EMBED_DOC_GROUP))
+        if not batch:
+            break
+        changed: List[KnowledgeDocument] = []
+        for idx, payload in enumerate(batch, start=start + 1):
+            title = (payload.get("title") or f"Imported {idx}").strip()
+            section = _section_id(seen, title)
+            content = (payload.get("content") or "").strip()
+            if not content:
+                _record_error(f"{title or 'Document'} has empty content, skipped")
+                continue
+            old = by_section.get(section) or {}
+            doc_uuid = old.get("uuid") or _source_doc_uuid(kb_uuid, source, section)
+            keep.add(doc_uuid)
+            content_hash = _content_hash(title, content)
+            if old.get("content_hash") == content_hash:
+                summary["unchanged"] += 1
+                summary["success"] += 1
+                continue
+            now = _now_ms()
+            changed.append(
+                KnowledgeDocument(
+                    uuid=doc_uuid,
+                    kb_uuid=kb_uuid,
+                    title=title,
+                    content=content,
+                    source=source,
+                    section=section,
+                    content_hash=content_hash,
+                    create_at=old.get("create_at") or now,
+                    update_at=now,
+                )
+            )
+        if changed:
+            _sync_changed_docs(kb_uuid, changed, existing, chunker, summary, _record_error)
+            bump_kb_generation(kb_uuid)
+        start += len(batch)
+        summary["processed"] = start
+        if known_total is None:
+            summary["total"] = start
+        if on_progress is not None:
+            on_progress(summary)
+
+    # only once the whole source was read: a section missing so far may still come
+    removed = [doc_uuid for doc_uuid in existing if doc_uuid not in keep]
+    if removed:
+        delete_docs_by_uuid(kb_uuid, removed, invalidate=False)
+        summary["deleted"] = len(removed)
+    if start or removed:
+        refresh_kb_indices(kb_uuid)
     return summary
 
 
-def _retrieve_context_chunks(
+def _sync_changed_docs(
+    kb_uuid: str,
+    changed: List[KnowledgeDocument],
+    existing: Dict[str, Dict[str, Any]],
+    chunker: Chunker,
+    summary: Dict[str, Any],
+    record_error: Callable[[str], None],
+) -> None:
+    """
+    embed the new chunks of changed docs, drop their stale vectors, then write the docs.
+    reused vectors get the doc title and position they have now
+    """
+    titles = {doc.uuid: doc.title[:50] or "Document" for doc in changed}
+    old_ids = get_doc_embedding_ids([doc.uuid for doc in changed if doc.uuid in existing])
+    new_chunks: List[tuple] = []
+    stale_by_doc: Dict[str, List[str]] = {}
+    meta_by_doc: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for doc in changed:
+        chunks = chunker.split(doc.content)
+        wanted = chunk_uuids(doc.uuid, chunks)
+        have = old_ids.get(doc.uuid, {})
+        for position, (chunk_uuid, chunk) in enumerate(zip(wanted, chunks)):
+            if chunk_uuid not in have:
+                new_chunks.append((doc, chunk_uuid, chunk, position))
+            elif have[chunk_uuid] != {"doc_title": doc.title, "position": position}:
+                meta_by_doc.setdefault(doc.uuid, {})[chunk_uuid] = {"doc_title": doc.title, "position": position}
+        stale_by_doc[doc.uuid] = list(set(have) - set(wanted))
+        summary["chunks_reused"] += len(set(have) & set(wanted))
+
+    try:
+        embeddings = create_embeddings_batch([chunk for _, _, chunk, _ in new_chunks]) if new_chunks else []
+    except Exception as exc:  # pylint: disable=broad-except
+        for doc in changed:
+            record_error(f"{titles[doc.uuid]}: {exc}")
+        return
+    vectors_by_doc: Dict[str, List[Dict[str, Any]]] = {}
+    for (doc, chunk_uuid, chunk, position), embedding in zip(new_chunks, embeddings):
+        vectors_by_doc.setdefault(doc.uuid, []).append(
+            {
+                "uuid": chunk_uuid,
+                "chunk": chunk,
+                "embedding": embedding,
+                **_chunk_meta(doc.title, chunk, position),
+                "create_at": _now_ms(),
+            }
+        )
+
+    failed = set()
+    for error in write_doc_embedding_changes(kb_uuid, vectors_by_doc, stale_by_doc, meta_by_doc, invalidate=False):
+        if error["doc_uuid"] not in failed:
+            failed.add(error["doc_uuid"])
+            record_error(f"{titles.get(error['doc_uuid'], 'Document')}: {error['error']}")
+    written = [doc for doc in changed if doc.uuid not in failed]
+    for error in bulk_create_docs([doc.dict() for doc in written], invalidate=False):
+        failed.add(error["uuid"])
+        record_error(f"{titles.get(error['uuid'], 'Document')}: {error['error']}")
+
+    for doc in written:
+        if doc.uuid in failed:
+            continue
+        summary["success"] += 1
+        summary["updated" if doc.uuid in existing else "created"] += 1
+        summary["chunks_embedded"] += len(vectors_by_doc.get(doc.uuid, []))
+
+
+async def _retrieve_context_chunks(
     kb_uuid: str,
     question: str,
     top_k: int = 3,
     score_threshold: float = 0.2,
+    mode: str = "vector",
+    timings: Optional[Dict[str, float]] = None,
 ) -> List[Dict[str, Any]]:
     """
     Retrieve top_k most relevant chunks from KB embeddings.
     Falls back gracefully if no embeddings exist or ES vector search fails.
     """
-    query_vector = create_embeddings(question)
-    scored: List[Dict[str, Any]] = []
+    return await _aretrieve(kb_uuid, question, top_k, mode=mode, score_threshold=score_threshold, timings=timings)
+
 
+async def _aretrieve(
+    kb_uuid: str,
+    query: str,
+    top_k: int,
+    mode: str = "vector",
+    score_threshold: Optional[float] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    top_k chunks for the query by vector similarity (below score_threshold dropped).
+    mode hybrid runs a BM25 query over the chunk text next to it and fuses both lists by
+    reciprocal rank, so exact identifiers (error codes, SKUs) the embedding misses still rank.
+    stage latencies (ms) are recorded in timings: embed, vector, bm25, fuse
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"unknown retrieval mode {mode}, use one of {', '.join(RETRIEVAL_MODES)}")
+    candidates = max(top_k, 5) if mode == "vector" else max(top_k, HYBRID_CANDIDATES)
+
+    async def vector() -> List[Dict[str, Any]]:
+        with stage_timer(timings, "embed"):
+            query_vector = await acreate_embeddings(query)
+        with stage_timer(timings, "vector"):
+            return await _avector_search(kb_uuid, query_vector, candidates, score_threshold)
+
+    if mode == "vector":
+        return (await vector())[:top_k]
+
+    async def keyword() -> List[Dict[str, Any]]:
+        with stage_timer(timings, "bm25"):
+            try:
+                return await asearch_chunks_fulltext(kb_uuid, query, candidates)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f"[WARN] BM25 chunk search failed, using vector results only: {exc}")
+                return []
+
+    vector_hits, keyword_hits = await asyncio.gather(vector(), keyword())
+    with stage_timer(timings, "fuse"):
+        return reciprocal_rank_fusion({"vector": vector_hits, "bm25": keyword_hits}, top_k)
+
+
+async def _avector_search(
+    kb_uuid: str,
+    query_vector: List[float],
+    top_k: int,
+    score_threshold: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """ES vector search, scoring the kb in process when ES fails"""
     try:
-        scored = [
-            item
-            for item in search_doc_embeddings_by_vector(
-                kb_uuid,
-                query_vector,
-                top_k=max(top_k, 5),
-            )
-            if item.get("score", 0.0) >= score_threshold
-        ]
+        results = await asearch_doc_embeddings_by_vector(kb_uuid, query_vector, top_k)
     except Exception as exc:  # pylint: disable=broad-except
-        print(f"[WARN] ES vector search failed, fallback to local scoring: {exc}")
-        vectors = list_doc_embeddings(kb_uuid)
-        scored = _score_vectors_locally(
-            vectors,
-            query_vector,
-            top_k=max(top_k, 5),
-            score_threshold=score_threshold,
+        print(f"[WARN] ES vector search failed, falling back to local scoring: {exc}")
+        return await _ascore_kb_locally(
+            kb_uuid, query_vector, top_k=top_k, score_threshold=score_threshold or 0.0
         )
-
-    return scored[:top_k]
+    if score_threshold is None:
+        return results
+    return [item for item in results if item.get("score", 0.0) >= score_threshold]
 
 
 def _build_messages_with_context(
@@ -422,8 +824,12 @@ def _build_messages_with_context(
     messages: List[Dict[str, str]] = [{"role": "system", "content": base_instruction}]
 
     if context_chunks:
+        # passages are best first, labelled by rank: a hybrid score is a fused rank, not a similarity
         context_text = "\n\n".join(
-            f"[Score {item['score']:.2f}] {item['chunk']}" for item in context_chunks
+            f"[{rank}] {item['doc_title']}\n{item['chunk']}"
+            if item.get("doc_title")
+            else f"[{rank}] {item['chunk']}"
+            for rank, item in enumerate(context_chunks, start=1)
         )
         messages.append({"role": "system", "content": f"Knowledge base context:\n{context_text}"})
 
@@ -432,104 +838,272 @@ def _build_messages_with_context(
 
 
 def _score_vectors_locally(
-    vectors: List[Dict[str, Any]],
+    vectors: Iterable[Dict[str, Any]],
     query_vector: List[float],
     top_k: int,
     score_threshold: float,
 ) -> List[Dict[str, Any]]:
-    """Fallback cosine scoring executed in Python."""
-    scored: List[Dict[str, Any]] = []
-    for item in vectors:
-        emb = item.get("embedding") or []
-        if not emb:
-            continue
-        score = _cosine_similarity(query_vector, emb)
-        if score < score_threshold:
-            continue
-        scored.append(
-            {
-                "kb_uuid": item.get("kb_uuid"),
-                "doc_uuid": item.get("doc_uuid"),
-                "chunk": item.get("chunk", ""),
-                "score": score,
-            }
-        )
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:top_k]
+    """Fallback cosine scoring on a pre-normalized float32 matrix."""
+    matrix = VectorMatrix.build(vectors, dims=len(query_vector))
+    return [
+        {
+            "kb_uuid": item.get("kb_uuid"),
+            "doc_uuid": item.get("doc_uuid"),
+            "chunk": item.get("chunk", ""),
+            **{key: item[key] for key in CHUNK_META_FIELDS if key in item},
+            "score": item["score"],
+        }
+        for item in matrix.search(query_vector, top_k, score_threshold=score_threshold)
+    ]
+
+
+async def _ascore_kb_locally(
+    kb_uuid: str,
+    query_vector: List[float],
+    top_k: int,
+    score_threshold: float,
+) -> List[Dict[str, Any]]:
+    """stream the kb vectors and score them in a worker thread, off the event loop"""
+
+    def score() -> List[Dict[str, Any]]:
+        vectors = iter_doc_embeddings(kb_uuid, source_includes=LOCAL_SCORING_FIELDS)
+        return _score_vectors_locally(vectors, query_vector, top_k=top_k, score_threshold=score_threshold)
 
+    return await asyncio.to_thread(score)
 
-def export_kb_service(owner_uuid: str, kb_uuid: str) -> Optional[Dict[str, Any]]:
+
+def export_kb_service(
+    owner_uuid: str,
+    kb_uuid: str,
+    embedding_format: str = "float32",
+) -> Optional[Dict[str, Any]]:
     """
     Bundle kb metadata, documents, and embeddings into a zip for download.
+    The zip is produced lazily: "content" yields bytes while docs/embeddings are read from ES.
+    - embedding_format: float32 / float16 / int8 binary matrix, or json for float lists
     """
+    if embedding_format not in EMBEDDING_FORMATS:
+        raise ValueError(f"embedding_format must be one of {', '.join(EMBEDDING_FORMATS)}")
     kb = _get_owned_kb(kb_uuid, owner_uuid)
     if not kb:
         return None
 
     kb_data = kb.dict()
-    docs = _fetch_all_docs(kb_uuid)
-    embeddings = list_doc_embeddings(kb_uuid)
-
-    bundle = {
-        "kb": kb_data,
-        "documents": docs,
-        "embeddings": embeddings,
+    safe_name = re.sub(r"[^a-zA-Z0-9_-]", "-", kb_data.get("name", "kb"))
+    filename = f"{safe_name or 'kb'}-{kb_uuid[:8]}.zip"
+    return {"filename": filename, "content": stream_zip(_export_entries(kb_data, embedding_format))}
+
+
+def _export_entries(kb_data: Dict[str, Any], embedding_format: str):
+    """zip entries of an export bundle, the manifest goes last so it can carry the counts"""
+    kb_uuid = kb_data["uuid"]
+    counts: Dict[str, int] = {}
+    yield BUNDLE_KB_FILE, json_bytes(kb_data)
+    yield BUNDLE_DOCS_FILE, iter_ndjson(iter_docs(kb_uuid), counts, "documents")
+
+    files = {"kb": BUNDLE_KB_FILE, "documents": BUNDLE_DOCS_FILE}
+    embeddings_section: Dict[str, Any]
+    if embedding_format == "json":
+        yield BUNDLE_EMBEDDINGS_FILE, iter_ndjson(iter_doc_embeddings(kb_uuid), counts, "embeddings")
+        files["embeddings"] = BUNDLE_EMBEDDINGS_FILE
+        embeddings_section = {"encoding": "json", "file": BUNDLE_EMBEDDINGS_FILE}
+    else:
+        # the kb uuid is in kb.json, no need to repeat it on every row
+        writer = EmbeddingMatrixWriter(embedding_format)
+        rows = iter_doc_embeddings(
+            kb_uuid, source_includes=["uuid", "doc_uuid", "chunk", "embedding", "create_at"] + CHUNK_META_FIELDS
+        )
+        yield BUNDLE_EMBEDDINGS_BIN_FILE, writer.iter_matrix(rows)
+        yield BUNDLE_EMBEDDINGS_INDEX_FILE, writer.iter_index()
+        files["embeddings"] = BUNDLE_EMBEDDINGS_BIN_FILE
+        files["embeddings_index"] = BUNDLE_EMBEDDINGS_INDEX_FILE
+        counts["embeddings"] = writer.count
+        embeddings_section = writer.describe()
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "kb_uuid": kb_uuid,
         "exported_at": _now_ms(),
+        "files": files,
+        "counts": counts,
+        "embeddings": embeddings_section,
     }
+    yield BUNDLE_MANIFEST_FILE, json_bytes(manifest)
 
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("kb.json", json.dumps(kb_data, ensure_ascii=False, indent=2))
-        zf.writestr("docs.json", json.dumps(docs, ensure_ascii=False))
-        zf.writestr(
-            "embeddings.json",
-            json.dumps(embeddings, ensure_ascii=False),
+
+def restore_kb_service(owner_uuid: str, kb_uuid: str, fileobj, max_errors: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    Load an export bundle into a kb, reusing its embeddings (no OpenAI calls).
+    - same kb: docs keep their uuids and replace the existing ones
+    - other kb: every doc/vector gets a new uuid
+    docs keep source / section / content hash, so a later sync of their file diffs against them;
+    vectors of bundles written without chunk metadata get it computed here
+    """
+    if not _get_owned_kb(kb_uuid, owner_uuid):
+        return None
+
+    reader = BundleReader(fileobj)
+    declared_dims = reader.embedding_dims
+    if declared_dims is not None and declared_dims != EMBEDDING_DIMS:
+        raise ValueError(f"bundle embeddings have {declared_dims} dims, expected {EMBEDDING_DIMS}")
+
+    remap = reader.source_kb_uuid != kb_uuid
+    summary: Dict[str, Any] = {
+        "documents": 0,
+        "embeddings": 0,
+        "failed": 0,
+        "skipped_embeddings": 0,
+        "remapped": remap,
+        "errors": [],
+    }
+
+    def _record_error(message: str) -> None:
+        summary["failed"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append(message)
+
+    # bundle doc uuid -> uuid in the target kb, only for docs written successfully
+    doc_ids: Dict[str, str] = {}
+    # target doc uuid -> title, for vectors without a doc_title
+    doc_titles: Dict[str, str] = {}
+
+    def _flush_docs(batch: List[Dict[str, Any]], source_ids: List[str]) -> None:
+        if not remap:
+            delete_docs_by_uuid(kb_uuid, [doc["uuid"] for doc in batch], invalidate=False)
+        failed = {error["uuid"]: error["error"] for error in bulk_create_docs(batch, invalidate=False)}
+        for doc, source_id in zip(batch, source_ids):
+            if doc["uuid"] in failed:
+                _record_error(f"{doc['title'][:50]}: {failed[doc['uuid']]}")
+                continue
+            doc_ids[source_id] = doc["uuid"]
+            doc_titles[doc["uuid"]] = doc["title"]
+            summary["documents"] += 1
+
+    docs_batch: List[Dict[str, Any]] = []
+    source_ids: List[str] = []
+    for row in reader.iter_documents():
+        source_id = row.get("uuid")
+        content = (row.get("content") or "").strip()
+        if not source_id or not content:
+            _record_error(f"{(row.get('title') or 'Document')[:50]} has no uuid or content, skipped")
+            continue
+        now = _now_ms()
+        doc = KnowledgeDocument(
+            uuid=str(uuid.uuid4()) if remap else source_id,
+            kb_uuid=kb_uuid,
+            title=row.get("title") or "Restored document",
+            content=content,
+            source=row.get("source"),
+            section=row.get("section"),
+            content_hash=row.get("content_hash"),
+            create_at=row.get("create_at") or now,
+            update_at=row.get("update_at") or now,
         )
-        zf.writestr(
-            "bundle.json",
-            json.dumps(bundle, ensure_ascii=False),
+        docs_batch.append(doc.dict())
+        source_ids.append(source_id)
+        if len(docs_batch) >= RESTORE_BATCH:
+            _flush_docs(docs_batch, source_ids)
+            docs_batch, source_ids = [], []
+    if docs_batch:
+        _flush_docs(docs_batch, source_ids)
+
+    def _flush_vectors(chunks_by_doc: Dict[str, List[Dict[str, Any]]]) -> None:
+        errors = bulk_upsert_doc_embeddings(kb_uuid, chunks_by_doc, replace_existing=False, invalidate=False)
+        written = sum(len(items) for items in chunks_by_doc.values())
+        summary["embeddings"] += written - len(errors)
+        for error in errors:
+            _record_error(f"embedding {error['uuid']}: {error['error']}")
+
+    pending: Dict[str, List[Dict[str, Any]]] = {}
+    pending_count = 0
+    # vectors seen per doc, the position of rows exported before chunk metadata existed
+    doc_positions: Counter = Counter()
+    for row in reader.iter_embeddings():
+        doc_uuid = doc_ids.get(row.get("doc_uuid"))
+        embedding = row.get("embedding") or []
+        if not doc_uuid:
+            summary["skipped_embeddings"] += 1
+            continue
+        if len(embedding) != EMBEDDING_DIMS:
+            _record_error(f"embedding {row.get('uuid')} has {len(embedding)} dims, expected {EMBEDDING_DIMS}")
+            continue
+        chunk = row.get("chunk", "")
+        meta = {key: row[key] for key in CHUNK_META_FIELDS if row.get(key) is not None}
+        if len(meta) < len(CHUNK_META_FIELDS):
+            meta = {**_chunk_meta(doc_titles[doc_uuid], chunk, doc_positions[doc_uuid]), **meta}
+        doc_positions[doc_uuid] += 1
+        pending.setdefault(doc_uuid, []).append(
+            {
+                "uuid": str(uuid.uuid4()) if remap else row.get("uuid") or str(uuid.uuid4()),
+                "chunk": chunk,
+                "embedding": embedding,
+                **meta,
+                "create_at": row.get("create_at") or _now_ms(),
+            }
         )
+        pending_count += 1
+        if pending_count >= RESTORE_BATCH:
+            _flush_vectors(pending)
+            pending, pending_count = {}, 0
+    if pending:
+        _flush_vectors(pending)
+
+    # the writes above left the generation alone, the refresh bumps it once for the restore
+    refresh_kb_indices(kb_uuid)
+    return summary
 
-    memory_file.seek(0)
-    safe_name = re.sub(r"[^a-zA-Z0-9_-]", "-", kb_data.get("name", "kb"))
-    filename = f"{safe_name or 'kb'}-{kb_uuid[:8]}.zip"
-    return {"filename": filename, "content": memory_file.read()}
 
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp", ".gif"}
+# parsed while indexed (iter_docs_from_upload), pages of a scanned PDF can take minutes each
+STREAMED_SUFFIXES = {".pdf"}
+IMPORT_SUFFIXES = {".md", ".markdown", ".txt", "", ".csv", ".docx", ".pptx", ".pdf"} | IMAGE_SUFFIXES
 
-def _fetch_all_docs(kb_uuid: str, page_size: int = 200) -> List[Dict[str, Any]]:
-    docs: List[Dict[str, Any]] = []
-    page = 1
-    total = 0
-    while True:
-        batch = list_docs(kb_uuid, page, page_size)
-        items = batch.get("list", [])
-        total = batch.get("total", 0)
-        docs.extend(items)
-        if len(docs) >= total or not items:
-            break
-        page += 1
-    return docs
 
+def is_supported_upload(filename: str) -> bool:
+    return Path((filename or "")).suffix.lower() in IMPORT_SUFFIXES
 
-def _extract_docs_from_upload(filename: str, payload: bytes) -> List[Dict[str, str]]:
+
+def extract_docs_from_upload(filename: str, file_path: str) -> List[Dict[str, str]]:
+    """
+    parse an upload spooled to disk. csv, pdf, docx/pptx (zip) and images are read
+    from the file by their libraries, only text files are loaded whole.
+    OCR runs inline, in the parse worker (or archive process) that holds the parse slot:
+    tesseract processes are bounded by the OCR page pool (service/ocr.py), not by another queue.
+    """
     suffix = Path((filename or "")).suffix.lower()
     if suffix in {".md", ".markdown"}:
-        return _parse_markdown_documents(_decode_text(payload))
+        return _parse_markdown_documents(_decode_text(Path(file_path).read_bytes()))
     if suffix in {".txt", ""}:
-        return _parse_plain_text(_decode_text(payload), filename)
+        return _parse_plain_text(_decode_text(Path(file_path).read_bytes()), filename)
     if suffix == ".csv":
-        return _parse_csv_documents(payload, filename)
+        return _parse_csv_documents(file_path, filename)
     if suffix == ".docx":
-        return _parse_docx_documents(payload, filename)
+        return _parse_docx_documents(file_path, filename)
     if suffix == ".pptx":
-        return _parse_pptx_documents(payload, filename)
+        return _parse_pptx_documents(file_path, filename)
     if suffix == ".pdf":
-        return _parse_pdf_document(payload, filename)
-    if suffix in {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp", ".gif"}:
-        return _parse_image_with_ocr(payload, filename)
+        return _parse_pdf_document(file_path, filename)
+    if suffix in IMAGE_SUFFIXES:
+        return _parse_image_with_ocr(file_path, filename)
     raise ValueError("Unsupported file format. Use markdown/txt, csv, docx, pptx, pdf, or image files.")
 
 
+def is_streamed_upload(filename: str) -> bool:
+    """uploads iter_docs_from_upload parses page by page instead of whole"""
+    return Path((filename or "")).suffix.lower() in STREAMED_SUFFIXES
+
+
+def iter_docs_from_upload(filename: str, file_path: str) -> Iterator[Dict[str, str]]:
+    """
+    extract_docs_from_upload for the ingest worker: a PDF is parsed while its docs are indexed,
+    page by page, so indexing starts with the first page and OCR output never piles up.
+    other formats are parsed whole
+    """
+    if is_streamed_upload(filename):
+        return _iter_pdf_documents(file_path, filename)
+    return iter(extract_docs_from_upload(filename, file_path))
+
+
 def _decode_text(data: bytes) -> str:
     for encoding in ("utf-8-sig", "utf-8", "gbk"):
         try:
@@ -571,30 +1145,30 @@ def _parse_markdown_documents(text: str) -> List[Dict[str, str]]:
     return docs
 
 
-def _parse_csv_documents(data: bytes, filename: str) -> List[Dict[str, str]]:
-    df = pd.read_csv(io.BytesIO(data)).fillna("")
-    if df.empty:
-        return []
+def _parse_csv_documents(file_path: str, filename: str) -> List[Dict[str, str]]:
     docs: List[Dict[str, str]] = []
-    for idx, row in df.iterrows():
-        title = str(row.get("title") or row.get("name") or f"Row {idx + 1}").strip()
-        content = str(row.get("content") or row.get("text") or "").strip()
-        if not content:
-            extra_parts = []
-            for col in df.columns:
-                if col in {"title", "name", "content", "text"}:
-                    continue
-                value = str(row.get(col) or "").strip()
-                if value:
-                    extra_parts.append(f"{col}: {value}")
-            content = "\n".join(extra_parts)
-        if content:
-            docs.append({"title": title or f"Row {idx + 1}", "content": content})
+    # chunks keep a running row index, so row numbers match the whole file
+    for df in pd.read_csv(file_path, chunksize=CSV_CHUNK_ROWS):
+        df = df.fillna("")
+        for idx, row in df.iterrows():
+            title = str(row.get("title") or row.get("name") or f"Row {idx + 1}").strip()
+            content = str(row.get("content") or row.get("text") or "").strip()
+            if not content:
+                extra_parts = []
+                for col in df.columns:
+                    if col in {"title", "name", "content", "text"}:
+                        continue
+                    value = str(row.get(col) or "").strip()
+                    if value:
+                        extra_parts.append(f"{col}: {value}")
+                content = "\n".join(extra_parts)
+            if content:
+                docs.append({"title": title or f"Row {idx + 1}", "content": content})
     return docs
 
 
-def _parse_docx_documents(data: bytes, filename: str) -> List[Dict[str, str]]:
-    document = DocxDocument(io.BytesIO(data))
+def _parse_docx_documents(file_path: str, filename: str) -> List[Dict[str, str]]:
+    document = DocxDocument(file_path)
     paragraphs = [p.text.strip() for p in document.paragraphs if p.text.strip()]
     text = "\n\n".join(paragraphs)
     if not text:
@@ -603,8 +1177,8 @@ def _parse_docx_documents(data: bytes, filename: str) -> List[Dict[str, str]]:
     return [{"title": title, "content": text}]
 
 
-def _parse_pptx_documents(data: bytes, filename: str) -> List[Dict[str, str]]:
-    presentation = Presentation(io.BytesIO(data))
+def _parse_pptx_documents(file_path: str, filename: str) -> List[Dict[str, str]]:
+    presentation = Presentation(file_path)
     docs: List[Dict[str, str]] = []
     for idx, slide in enumerate(presentation.slides, start=1):
         texts: List[str] = []
@@ -627,45 +1201,72 @@ def _parse_pptx_documents(data: bytes, filename: str) -> List[Dict[str, str]]:
     return docs
 
 
-def _parse_pdf_document(data: bytes, filename: str) -> List[Dict[str, str]]:
-    raw_text = extract_pdf_text(io.BytesIO(data))
-    pages_raw = [page.strip() for page in raw_text.split("\f") if page.strip()]
-    
-    # Calculate total text length to determine if OCR is needed
-    total_text_len = sum(len(p) for p in pages_raw)
-    
-    # If very little text extracted, try OCR (likely a scanned PDF)
-    if total_text_len < 100 and OCR_AVAILABLE:
-        print(f"[INFO] PDF has little text ({total_text_len} chars), trying OCR...")
-        ocr_docs = _parse_pdf_with_ocr(data, filename)
-        if ocr_docs:
-            return ocr_docs
-    
-    if not pages_raw:
-        # Last resort: try OCR
-        if OCR_AVAILABLE:
-            return _parse_pdf_with_ocr(data, filename)
-        return []
+def _extract_pdf_page_texts(file_path: str) -> List[str]:
+    """text layer of every page, in page order (empty for scanned pages)"""
+    texts: List[str] = []
+    # pdfminer lays out one page at a time from the file
+    for page in extract_pages(file_path):
+        texts.append(
+            "".join(element.get_text() for element in page if isinstance(element, LTTextContainer)).strip()
+        )
+    return texts
 
-    page_lines: List[List[str]] = []
-    for page in pages_raw:
-        lines = [line.strip() for line in page.splitlines() if line.strip()]
-        if lines:
-            page_lines.append(lines)
 
-    if not page_lines:
-        return []
+def _parse_pdf_document(file_path: str, filename: str) -> List[Dict[str, str]]:
+    return list(_iter_pdf_documents(file_path, filename))
 
-    # detect repeating headers/footers (first/last line that appear on majority pages)
-    header_counter = Counter(lines[0] for lines in page_lines if lines)
-    footer_counter = Counter(lines[-1] for lines in page_lines if lines)
-    threshold = max(2, len(page_lines) // 2)
+
+def _iter_pdf_documents(file_path: str, filename: str) -> Iterator[Dict[str, str]]:
+    """
+    docs of a PDF in page order, yielded as each page is read: pages that need OCR are
+    OCR'd while the docs before them are indexed, and only one page of OCR text is held
+    """
+    try:
+        page_texts = _extract_pdf_page_texts(file_path)
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] pdfminer failed, trying OCR: {exc}")
+        yield from _iter_pdf_ocr_documents(file_path, filename)
+        return
+
+    # pages without a usable text layer (scans, image-only appendices) go to OCR, the rest is kept as is
+    sparse = [idx for idx, text in enumerate(page_texts, start=1) if len(text) < OCR_MIN_PAGE_CHARS]
+    ocr_pages: Iterator[tuple] = iter(())
+    if sparse and OCR_AVAILABLE:
+        print(f"[INFO] PDF has {len(sparse)} of {len(page_texts)} pages without text, OCR them")
+        # (page, text) in page order, pages that could not be rasterized are missing
+        ocr_pages = iter_pdf_ocr_pages(file_path, pages=sparse)
+    ocr_next = next(ocr_pages, None)
+
+    # detect repeating headers/footers (first/last line that appear on majority pages).
+    # counted on the text layer, known up front, OCR'd pages are filtered with the same sets
+    header_counter: Counter = Counter()
+    footer_counter: Counter = Counter()
+    text_pages = 0
+    for text in page_texts:
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if lines:
+            text_pages += 1
+            header_counter[lines[0]] += 1
+            footer_counter[lines[-1]] += 1
+    threshold = max(2, text_pages // 2)
     header_texts = {text for text, count in header_counter.items() if count >= threshold}
     footer_texts = {text for text, count in footer_counter.items() if count >= threshold}
 
-    docs: List[Dict[str, str]] = []
     base_title = Path(filename or "").stem or "PDF document"
-    for idx, lines in enumerate(page_lines, start=1):
+    yielded = False
+    # raw page text, kept only until the first doc: the fallback when every line was a header/footer
+    pages_raw: List[str] = []
+    for idx, text in enumerate(page_texts, start=1):
+        if ocr_next is not None and ocr_next[0] == idx:
+            if len(ocr_next[1]) > len(text):
+                text = ocr_next[1]
+            ocr_next = next(ocr_pages, None)
+        page_texts[idx - 1] = ""  # the docs of a page are all that is kept of it
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if not lines:
+            continue
+        if not yielded:
+            pages_raw.append(text)
         filtered: List[str] = []
         for i, line in enumerate(lines):
             if i == 0 and line in header_texts:
@@ -675,62 +1276,39 @@ def _parse_pdf_document(data: bytes, filename: str) -> List[Dict[str, str]]:
             filtered.append(line)
         chunks = _split_paragraphs("\n".join(filtered).strip())
         for chunk_idx, chunk in enumerate(chunks, start=1):
-            docs.append(
-                {
-                    "title": f"{base_title} - Page {idx} - Part {chunk_idx}",
-                    "content": chunk,
-                }
-            )
+            yielded = True
+            pages_raw = []
+            yield {
+                "title": f"{base_title} - Page {idx} - Part {chunk_idx}",
+                "content": chunk,
+            }
 
-    if not docs:
-        docs.append({"title": base_title, "content": "\n\n".join(pages_raw)})
-    return docs
+    if not yielded and pages_raw:
+        yield {"title": base_title, "content": "\n\n".join(pages_raw)}
 
 
-def _parse_pdf_with_ocr(data: bytes, filename: str) -> List[Dict[str, str]]:
+def _iter_pdf_ocr_documents(file_path: str, filename: str) -> Iterator[Dict[str, str]]:
     """
-    Use OCR to extract text from scanned PDF.
+    Use OCR to extract text from scanned PDF, see service/ocr.py for the page pipeline.
+    docs are yielded page by page as the OCR comes in.
     Requires: pytesseract, pdf2image, and system dependencies (tesseract, poppler)
     """
     if not OCR_AVAILABLE:
-        return []
-    
-    try:
-        # Convert PDF pages to images (200 DPI for good balance of speed/quality)
-        images = convert_from_bytes(data, dpi=200)
-    except Exception as exc:
-        print(f"[WARN] pdf2image failed: {exc}")
-        return []
-    
-    docs: List[Dict[str, str]] = []
+        return
+
     base_title = Path(filename or "").stem or "PDF document"
-    
-    for idx, img in enumerate(images, start=1):
-        try:
-            # OCR with Chinese + English support
-            # Change lang parameter based on your needs:
-            # - 'eng' for English only
-            # - 'chi_sim' for Simplified Chinese
-            # - 'chi_tra' for Traditional Chinese
-            # - 'chi_sim+eng' for both
-            text = pytesseract.image_to_string(img, lang='chi_sim+eng')
-            text = _clean_ocr_text(text)
-            
-            if text:
-                chunks = _split_paragraphs(text)
-                for chunk_idx, chunk in enumerate(chunks, start=1):
-                    docs.append({
-                        "title": f"{base_title} - Page {idx} - Part {chunk_idx}",
-                        "content": chunk,
-                    })
-        except Exception as exc:
-            print(f"[WARN] OCR failed for page {idx}: {exc}")
-            continue
-    
-    return docs
+    try:
+        for idx, text in iter_pdf_ocr_pages(file_path):
+            for chunk_idx, chunk in enumerate(_split_paragraphs(text) if text else [], start=1):
+                yield {
+                    "title": f"{base_title} - Page {idx} - Part {chunk_idx}",
+                    "content": chunk,
+                }
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] PDF OCR failed: {exc}")
 
 
-def _parse_image_with_ocr(data: bytes, filename: str) -> List[Dict[str, str]]:
+def _parse_image_with_ocr(file_path: str, filename: str) -> List[Dict[str, str]]:
     """
     Use OCR to extract text from image files.
     Supports: jpg, png, bmp, tiff, webp, gif
@@ -739,15 +1317,13 @@ def _parse_image_with_ocr(data: bytes, filename: str) -> List[Dict[str, str]]:
         raise ValueError("OCR not available. Install pytesseract and tesseract.")
     
     try:
-        img = Image.open(io.BytesIO(data))
+        img = Image.open(file_path)
         
         # Convert to RGB if necessary (for RGBA/P mode images)
         if img.mode in ('RGBA', 'P'):
             img = img.convert('RGB')
         
-        # OCR with Chinese + English
-        text = pytesseract.image_to_string(img, lang='chi_sim+eng')
-        text = _clean_ocr_text(text)
+        text = ocr_image(img)
         
         if not text:
             return []
@@ -760,50 +1336,9 @@ def _parse_image_with_ocr(data: bytes, filename: str) -> List[Dict[str, str]]:
         raise ValueError(f"Failed to process image: {exc}")
 
 
-def _clean_ocr_text(text: str) -> str:
-    """Clean up OCR output"""
-    if not text:
-        return ""
-    
-    # Remove excessive whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
-    
-    # Remove common OCR artifacts
-    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', text)
-    
-    # Remove lines that are just whitespace or single characters
-    lines = [line.strip() for line in text.splitlines()]
-    lines = [line for line in lines if len(line) > 1 or line.isalnum()]
-    
-    return '\n'.join(lines).strip()
-
-
-def _split_paragraphs(text: str, max_chars: int = 1200) -> List[str]:
+def _split_paragraphs(text: str, max_tokens: int = PARSE_PART_MAX_TOKENS) -> List[str]:
     """
-    Split text by blank line / sentence boundaries while enforcing max length.
+    Split a long page into doc sized parts along headings / paragraphs / sentences, see service/chunker.py.
     """
-    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
-    chunks: List[str] = []
-
-    for para in paragraphs:
-        if len(para) <= max_chars:
-            chunks.append(para)
-            continue
-        sentences = re.split(r"(?<=[。．.!?])\s+", para)
-        current = ""
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-            if len(current) + len(sentence) + 1 <= max_chars:
-                current = f"{current} {sentence}".strip()
-            else:
-                if current:
-                    chunks.append(current)
-                current = sentence
-        if current:
-            chunks.append(current)
-
-    return chunks or [text]
+    return get_chunker(max_tokens, 0).split(text) or [text]
 
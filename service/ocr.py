@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterator, List, Optional, Sequence, Tuple
+
+from define import OCR_DPI, OCR_LANG, OCR_PAGE_TIMEOUT, OCR_PAGE_WORKERS, OCR_PAGE_BATCH
+
+# OCR support (optional - graceful fallback if not installed)
+try:
+    import pytesseract
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+    print("[WARN] pytesseract/pdf2image not installed, OCR disabled")
+
+# pages already run in parallel, one thread per tesseract process avoids oversubscription
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+_page_pool: Optional[ThreadPoolExecutor] = None
+_page_pool_lock = threading.Lock()
+# set in archive parse processes, which share the cores with each other (see set_page_workers)
+_page_workers: Optional[int] = None
+
+
+def page_workers() -> int:
+    return _page_workers or OCR_PAGE_WORKERS or os.cpu_count() or 1
+
+
+def set_page_workers(workers: int) -> None:
+    """
+    cap the page pool of this process, called before any OCR runs:
+    N archive parse processes with a pool of one worker per core each would start N x cores tesseracts
+    """
+    global _page_workers
+    _page_workers = max(1, workers)
+
+
+def get_page_pool() -> ThreadPoolExecutor:
+    """
+    get the pool driving page OCR (singleton pattern).
+    each call runs tesseract in its own process, so threads are enough to use every core
+    and the page bitmaps do not have to be pickled to worker processes.
+    """
+    global _page_pool
+    if _page_pool is None:
+        with _page_pool_lock:
+            if _page_pool is None:
+                _page_pool = ThreadPoolExecutor(max_workers=page_workers(), thread_name_prefix="ocr-page")
+    return _page_pool
+
+
+def clean_ocr_text(text: str) -> str:
+    """Clean up OCR output"""
+    if not text:
+        return ""
+    
+    # Remove excessive whitespace
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r' {2,}', ' ', text)
+    
+    # Remove common OCR artifacts
+    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f]', '', text)
+    
+    # Remove lines that are just whitespace or single characters
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if len(line) > 1 or line.isalnum()]
+    
+    return '\n'.join(lines).strip()
+
+
+def ocr_image(image, lang: str = OCR_LANG, timeout: int = OCR_PAGE_TIMEOUT) -> str:
+    """OCR one image, tesseract is killed after timeout seconds (RuntimeError)"""
+    return clean_ocr_text(pytesseract.image_to_string(image, lang=lang, timeout=timeout))
+
+
+def iter_pdf_ocr_pages(
+    pdf_path: str,
+    dpi: int = OCR_DPI,
+    lang: str = OCR_LANG,
+    page_timeout: int = OCR_PAGE_TIMEOUT,
+    pages: Optional[Sequence[int]] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    OCR a PDF one page range at a time, yielding (page number, text) in page order.
+    - pages limits the OCR to these (1-based) page numbers, default is every page
+    - the next range is rasterized while the current one is OCRed, so at most
+      two ranges of page images are in memory
+    - pages that fail or time out yield an empty text
+    """
+    batch = OCR_PAGE_BATCH or page_workers()
+    if pages is None:
+        pages = range(1, int(pdfinfo_from_path(pdf_path)["Pages"]) + 1)
+    pool = get_page_pool()
+    pending: Deque[Tuple[int, Future]] = deque()
+    for first, last in _page_ranges(pages, batch):
+        try:
+            images = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last, grayscale=True)
+        except Exception as exc:  # pylint: disable=broad-except
+            print(f"[WARN] pdf2image failed for pages {first}-{last}: {exc}")
+            images = []
+        for offset, image in enumerate(images):
+            pending.append((first + offset, pool.submit(ocr_image, image, lang, page_timeout)))
+        del images
+        while len(pending) > batch:
+            yield _page_text(*pending.popleft())
+    while pending:
+        yield _page_text(*pending.popleft())
+
+
+def _page_ranges(pages: Sequence[int], batch: int) -> List[Tuple[int, int]]:
+    """(first, last) runs of consecutive pages, at most batch pages each"""
+    ranges: List[Tuple[int, int]] = []
+    for page in sorted(set(pages)):
+        if ranges and ranges[-1][1] == page - 1 and page - ranges[-1][0] < batch:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def _page_text(page: int, future: Future) -> Tuple[int, str]:
+    try:
+        return page, future.result()
+    except Exception as exc:  # pylint: disable=broad-except
+        print(f"[WARN] OCR failed for page {page}: {exc}")
+        return page, ""
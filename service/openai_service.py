@@ -1,8 +1,12 @@
-from openai import OpenAI
-from define import OPENAI_API_KEY
-from typing import Optional, List, Dict
+from openai import OpenAI, AsyncOpenAI
+from define import OPENAI_API_KEY, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_MAX_TOKENS
+from typing import Optional, List, Dict, Iterator, AsyncIterator, Tuple
+
+from service.chunker import count_tokens
+from service.embedding_cache import get_embedding_cache, make_cache_key
 
 _client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
 
 
 def get_openai_client() -> OpenAI:
@@ -15,6 +19,23 @@ def get_openai_client() -> OpenAI:
     return _client
 
 
+def get_async_openai_client() -> AsyncOpenAI:
+    """get AsyncOpenAI client for the request path (singleton pattern)"""
+    global _async_client
+    if _async_client is None:
+        if not OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY 未配置，请在 .env 文件中设置")
+        _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _async_client
+
+
+async def close_async_openai_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
 def chat_completion(messages: List[Dict[str, str]], model: str = "gpt-4o") -> str:
     """
     OpenAI chat completion interface
@@ -47,9 +68,32 @@ def stream_chat_completion(messages: List[Dict[str, str]], model: str = "gpt-4o"
             yield delta
 
 
-def create_embeddings(text: str, model: str = "text-embedding-ada-002") -> List[float]:
+async def achat_completion(messages: List[Dict[str, str]], model: str = "gpt-4o") -> str:
+    """async chat_completion, awaits the model without blocking the event loop"""
+    client = get_async_openai_client()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages
+    )
+    return response.choices[0].message.content
+
+
+async def astream_chat_completion(messages: List[Dict[str, str]], model: str = "gpt-4o") -> AsyncIterator[str]:
+    client = get_async_openai_client()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+    )
+    async for chunk in response:
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+async def acreate_embeddings(text: str, model: str = "text-embedding-ada-002") -> List[float]:
     """
-    create text embedding vector
+    create text embedding vector (served from the embedding cache when possible)
     
     Args:
         text: the text to embed
@@ -58,10 +102,140 @@ def create_embeddings(text: str, model: str = "text-embedding-ada-002") -> List[
     Returns:
         the list of embedding vectors
     """
+    return (await acreate_embeddings_batch([text], model=model))[0]
+
+
+def _iter_embedding_batches(
+    texts: List[str],
+    max_inputs: int,
+    max_tokens: int,
+) -> Iterator[List[int]]:
+    """
+    group text positions into request batches,
+    each batch stays under both the input count and the token budget
+    """
+    batch: List[int] = []
+    batch_tokens = 0
+    for idx, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_inputs or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(idx)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def create_embeddings_batch(
+    texts: List[str],
+    model: str = "text-embedding-ada-002",
+    max_inputs: int = EMBEDDING_BATCH_SIZE,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+) -> List[List[float]]:
+    """
+    create embedding vectors for many texts with as few requests as possible
+
+    Args:
+        texts: the texts to embed
+        model: the embedding model to use, default is text-embedding-ada-002
+        max_inputs: max number of inputs per request
+        max_tokens: max total tokens per request
+
+    Returns:
+        the embedding vectors, in the same order as texts
+    """
+    if not texts:
+        return []
+    keys, known, todo = _lookup_cached(texts, model)
+    if todo:
+        fresh = _request_embeddings(list(todo.values()), model, max_inputs, max_tokens)
+        _store_fresh(known, todo, fresh)
+    return [known[key] for key in keys]
+
+
+async def acreate_embeddings_batch(
+    texts: List[str],
+    model: str = "text-embedding-ada-002",
+    max_inputs: int = EMBEDDING_BATCH_SIZE,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+) -> List[List[float]]:
+    """async create_embeddings_batch, same cache and batching"""
+    if not texts:
+        return []
+    keys = [make_cache_key(model, text) for text in texts]
+    known = await get_embedding_cache().aget_many(list(dict.fromkeys(keys)))
+    todo = _missing_texts(keys, texts, known)
+    if todo:
+        fresh = await _arequest_embeddings(list(todo.values()), model, max_inputs, max_tokens)
+        fresh_by_key = dict(zip(todo.keys(), fresh))
+        await get_embedding_cache().aput_many(fresh_by_key)
+        known.update(fresh_by_key)
+    return [known[key] for key in keys]
+
+
+def _lookup_cached(texts: List[str], model: str) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+    """cache keys of texts, the cached vectors, and each distinct missing text once"""
+    keys = [make_cache_key(model, text) for text in texts]
+    known = get_embedding_cache().get_many(list(dict.fromkeys(keys)))
+    return keys, known, _missing_texts(keys, texts, known)
+
+
+def _missing_texts(keys: List[str], texts: List[str], known: Dict[str, List[float]]) -> Dict[str, str]:
+    """each distinct text without a cached vector once, by cache key"""
+    todo: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in known and key not in todo:
+            todo[key] = text
+    return todo
+
+
+def _store_fresh(known: Dict[str, List[float]], todo: Dict[str, str], fresh: List[List[float]]) -> None:
+    fresh_by_key = dict(zip(todo.keys(), fresh))
+    get_embedding_cache().put_many(fresh_by_key)
+    known.update(fresh_by_key)
+
+
+def _request_embeddings(
+    texts: List[str],
+    model: str,
+    max_inputs: int,
+    max_tokens: int,
+) -> List[List[float]]:
     client = get_openai_client()
-    response = client.embeddings.create(
-        model=model,
-        input=text
-    )
-    return response.data[0].embedding
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    for batch in _iter_embedding_batches(texts, max_inputs, max_tokens):
+        response = client.embeddings.create(
+            model=model,
+            input=[texts[idx] for idx in batch],
+        )
+        # response items carry the position of their input inside the request
+        for item in response.data:
+            vectors[batch[item.index]] = item.embedding
+    return _check_complete(vectors)
+
+
+async def _arequest_embeddings(
+    texts: List[str],
+    model: str,
+    max_inputs: int,
+    max_tokens: int,
+) -> List[List[float]]:
+    client = get_async_openai_client()
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    for batch in _iter_embedding_batches(texts, max_inputs, max_tokens):
+        response = await client.embeddings.create(
+            model=model,
+            input=[texts[idx] for idx in batch],
+        )
+        for item in response.data:
+            vectors[batch[item.index]] = item.embedding
+    return _check_complete(vectors)
+
 
+def _check_complete(vectors: List[Optional[List[float]]]) -> List[List[float]]:
+    missing = [idx for idx, vec in enumerate(vectors) if vec is None]
+    if missing:
+        raise ValueError(f"embedding response is missing {len(missing)} of {len(vectors)} inputs")
+    return vectors
@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from define import RRF_K
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[Dict[str, Any]]],
+    top_k: int,
+    k: int = RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    fuse ranked chunk lists (name -> results, best first) by reciprocal rank:
+    score = sum over lists of 1 / (k + rank). chunks are matched on uuid,
+    each result keeps the score it had in every list as "<name>_score"
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for name, results in rankings.items():
+        for rank, item in enumerate(results, start=1):
+            key = item.get("uuid") or f"{item.get('doc_uuid')}:{item.get('chunk')}"
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {**item, "score": 0.0}
+            entry["score"] += 1.0 / (k + rank)
+            entry[f"{name}_score"] = item.get("score", 0.0)
+    return sorted(fused.values(), key=lambda item: item["score"], reverse=True)[:top_k]
+
+
+@contextmanager
+def stage_timer(timings: Optional[Dict[str, float]], stage: str) -> Iterator[None]:
+    """record the wall time of a stage in timings[stage] (ms), no-op when timings is None"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = round((time.perf_counter() - started) * 1000, 2)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value of the recorded stages"""
+    return ", ".join(f"{stage};dur={duration}" for stage, duration in timings.items())
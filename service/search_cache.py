@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from dao.kb_dao import kb_generation
+from define import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_SETTLE
+from service.embedding_cache import normalize_text
+
+
+def kb_settled(kb: Dict[str, Any]) -> bool:
+    """false within SEARCH_CACHE_SETTLE seconds of a kb write, ES may not show that write yet"""
+    return time.time() * 1000 - kb_generation(kb)[1] >= SEARCH_CACHE_SETTLE * 1000
+
+
+def search_key(
+    kind: str,
+    kb: Dict[str, Any],
+    query: str,
+    top_k: int,
+    mode: str = "",
+) -> Tuple[Tuple[Any, ...], bool]:
+    """
+    cache key of a search in an owned kb (its doc as read for the owner check), and
+    whether its result may be cached (see kb_settled).
+    the key holds the kb generation, any later write to the kb makes it unreachable
+    """
+    generation, _ = kb_generation(kb)
+    key = (kind, kb["uuid"], generation, normalize_text(query), top_k, mode)
+    return key, kb_settled(kb)
+
+
+class SearchCache:
+    """
+    in-process LRU of search results, bounded by item count and entry age.
+    results of an old kb generation are never hit again and age out of the LRU
+    """
+
+    def __init__(self, max_items: int = SEARCH_CACHE_SIZE, ttl: int = SEARCH_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[Tuple[Any, ...], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_items > 0
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._items[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[Any, ...], value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._items[key] = (value, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """get search result cache (singleton pattern)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SearchCache()
+    return _cache
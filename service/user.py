@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 import bcrypt
+from fastapi.concurrency import run_in_threadpool
 from jose import jwt
 from starlette import status
 
@@ -15,6 +16,7 @@ from dao.user_basic_dao import (
 from models.user_basic import UserBasicDao
 from define import JWT_SECRET
 from service.admin.user import create_service as admin_create_service
+from service.executor import get_executor, PoolOverloadedError
 
 EMAIL_REGEX = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
@@ -28,7 +30,7 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
-def _verify_password(plain_password: str, hashed_password: str) -> bool:
+async def _verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     verify password (support both new and old storage methods):
     - new: bcrypt hash
@@ -38,11 +40,13 @@ def _verify_password(plain_password: str, hashed_password: str) -> bool:
     if not hashed_password.startswith("$2b$") and not hashed_password.startswith("$2a$"):
         return plain_password == hashed_password
 
-    # new data: bcrypt hash
+    # new data: bcrypt hash, checked in the bounded crypto pool
     try:
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), hashed_password.encode("utf-8")
+        return await get_executor("crypto").run(
+            bcrypt.checkpw, plain_password.encode("utf-8"), hashed_password.encode("utf-8")
         )
+    except PoolOverloadedError:
+        raise
     except Exception:
         return False
 
@@ -59,12 +63,12 @@ def _ensure_password_requirements(password: str) -> None:
         raise AuthError("Password must be at least 8 characters long")
 
 
-def _ensure_username_available(username: Optional[str]) -> str:
+async def _ensure_username_available(username: Optional[str]) -> str:
     base = (username or "").strip() or f"user-{uuid.uuid4().hex[:8]}"
     candidate = base
     suffix = 1
     while True:
-        response = search_user_by_username(candidate)
+        response = await run_in_threadpool(search_user_by_username, candidate)
         hits = response.get("hits", {}).get("total", {}).get("value", 0)
         if hits == 0:
             return candidate
@@ -72,7 +76,7 @@ def _ensure_username_available(username: Optional[str]) -> str:
         suffix += 1
 
 
-def login_service(username: str, password: str) -> str:
+async def login_service(username: str, password: str) -> str:
     """
     login service
     """
@@ -80,11 +84,11 @@ def login_service(username: str, password: str) -> str:
     if not identifier:
         raise AuthError("Username or email is required")
 
-    response = search_user_by_username(identifier)
+    response = await run_in_threadpool(search_user_by_username, identifier)
     hits = response.get("hits", {}).get("hits", [])
 
     if not hits and "@" in identifier:
-        response = search_user_by_email(identifier)
+        response = await run_in_threadpool(search_user_by_email, identifier)
         hits = response.get("hits", {}).get("hits", [])
     
     if not hits:
@@ -95,7 +99,7 @@ def login_service(username: str, password: str) -> str:
     user_source = hits[0]["_source"]
     user_basic = UserBasicDao(**user_source)
     
-    if not _verify_password(password, user_basic.password):
+    if not await _verify_password(password, user_basic.password):
         raise AuthError("Password is incorrect", status.HTTP_401_UNAUTHORIZED)
     
     exp = datetime.utcnow() + timedelta(days=1)
@@ -110,7 +114,7 @@ def login_service(username: str, password: str) -> str:
     return token
 
 
-def register_service(
+async def register_service(
     username: Optional[str], password: str, email: Optional[str]
 ) -> None:
     """
@@ -121,24 +125,24 @@ def register_service(
     normalized_email = _normalize_email(email)
     _ensure_password_requirements(password)
 
-    email_hits = search_user_by_email(normalized_email).get("hits", {}).get("hits", [])
+    email_hits = (await run_in_threadpool(search_user_by_email, normalized_email)).get("hits", {}).get("hits", [])
     if email_hits:
         raise AuthError("Email already registered", status.HTTP_409_CONFLICT)
 
-    target_username = _ensure_username_available(username or normalized_email.split("@")[0])
+    target_username = await _ensure_username_available(username or normalized_email.split("@")[0])
 
-    success, error = admin_create_service(target_username, password, normalized_email)
+    success, error = await admin_create_service(target_username, password, normalized_email)
     if not success:
         raise AuthError(error or "Register failed")
 
 
-def password_modify_service(user_uuid: str, username: str, old_password: str, new_password: str) -> None:
+async def password_modify_service(user_uuid: str, username: str, old_password: str, new_password: str) -> None:
     """
     modify password service
     返回: (success, error_message)
     """
     # 1. get user info
-    response = search_user_by_username(username)
+    response = await run_in_threadpool(search_user_by_username, username)
     
     hits = response.get("hits", {}).get("hits", [])
     if not hits:
@@ -153,20 +157,22 @@ def password_modify_service(user_uuid: str, username: str, old_password: str, ne
         raise AuthError("User info mismatch", status.HTTP_403_FORBIDDEN)
     
     # 3. verify old password (support both new and old storage methods)
-    if not _verify_password(old_password, user_basic.password):
+    if not await _verify_password(old_password, user_basic.password):
         raise AuthError("Old password is incorrect", status.HTTP_401_UNAUTHORIZED)
 
     _ensure_password_requirements(new_password)
     
     # 4. update password
     from datetime import datetime
-    update_user(
+    password_hash = await get_executor("crypto").run(
+        bcrypt.hashpw, new_password.encode("utf-8"), bcrypt.gensalt()
+    )
+    await run_in_threadpool(
+        update_user,
         user_id,
         {
             # new password一律以哈希存储
-            "password": bcrypt.hashpw(
-                new_password.encode("utf-8"), bcrypt.gensalt()
-            ).decode("utf-8"),
+            "password": password_hash.decode("utf-8"),
             "update_at": int(datetime.utcnow().timestamp() * 1000),
         },
     )
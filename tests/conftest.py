@@ -0,0 +1,230 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch.exceptions import ConflictError, NotFoundError
+from elasticsearch.serializer import JSONSerializer
+
+from dao import kb_dao, schema
+
+
+def _bump_generation(source, params):
+    source["generation"] = (source.get("generation") or 0) + 1
+    source["generation_at"] = params["now"]
+
+
+# painless scripts of the DAOs, run as python on the stored _source
+SCRIPTS = {kb_dao._BUMP_SCRIPT: _bump_generation}
+
+
+def _matches(query, source):
+    """the query subset the DAOs use: match_all, term, terms, bool filter/must"""
+    if not query or "match_all" in query:
+        return True
+    if "term" in query:
+        (field, value), = query["term"].items()
+        if isinstance(value, dict):
+            value = value["value"]
+        return source.get(field) == value
+    if "terms" in query:
+        (field, values), = query["terms"].items()
+        return source.get(field) in values
+    if "bool" in query:
+        clauses = query["bool"].get("filter", []) + query["bool"].get("must", [])
+        return all(_matches(clause, source) for clause in clauses)
+    raise NotImplementedError(f"query not supported by FakeES: {query}")
+
+
+class FakeIndices:
+    def __init__(self, client):
+        self.client = client
+        # index -> mapping body, as returned by get_mapping
+        self.mappings = {}
+
+    def exists(self, index):
+        return index in self.client.docs or index in self.mappings
+
+    def refresh(self, index=None, **kwargs):
+        self.client.refreshes += 1
+
+    def get_mapping(self, index):
+        return {index: {"mappings": self.mappings.get(index, {})}}
+
+    def put_mapping(self, index, body):
+        mapping = self.mappings.setdefault(index, {})
+        mapping.update(body)
+
+
+class FakeES:
+    """
+    in-memory stand-in for the sync Elasticsearch client: documents by index and _id with _seq_no,
+    and the part of the API the DAOs call. bulk takes the ndjson body elasticsearch.helpers sends,
+    so bulk_write runs unchanged. searches are recorded, search_response answers them when set
+    """
+
+    def __init__(self, version="7.17.12"):
+        self.version = version
+        self.docs = {}  # index -> _id -> (source, seq_no)
+        self.seq_no = 0
+        self.transport = SimpleNamespace(serializer=JSONSerializer())
+        self.indices = FakeIndices(self)
+        self.searches = []
+        self.search_response = None
+        self.bulk_requests = 0
+        self.refreshes = 0
+        # _id -> (status, error) of bulk items to fail
+        self.fail_ids = {}
+        self.on_mget = None
+
+    # ---- documents ----
+
+    def write(self, index, _id, source):
+        self.seq_no += 1
+        self.docs.setdefault(index, {})[_id] = (dict(source), self.seq_no)
+
+    def sources(self, index):
+        return {_id: source for _id, (source, _) in self.docs.get(index, {}).items()}
+
+    def _hit(self, index, _id):
+        source, seq_no = self.docs[index][_id]
+        return {"_index": index, "_id": _id, "_source": dict(source), "_seq_no": seq_no, "_primary_term": 1}
+
+    def _lookup(self, index, _id):
+        if _id not in self.docs.get(index, {}):
+            raise NotFoundError(404, "not_found", {"_index": index, "_id": _id})
+        return self.docs[index][_id]
+
+    # ---- API ----
+
+    def info(self):
+        return {"version": {"number": self.version}}
+
+    def get(self, index, id, **kwargs):
+        self._lookup(index, id)
+        return {**self._hit(index, id), "found": True}
+
+    def index(self, index, id, document=None, body=None, **kwargs):
+        self.write(index, id, document if document is not None else body)
+        return {"_id": id, "result": "created"}
+
+    def update(self, index, id, doc=None, body=None, **kwargs):
+        source, _ = self._lookup(index, id)
+        source = dict(source)
+        body = body or {}
+        if doc is not None or "doc" in body:
+            source.update(doc if doc is not None else body["doc"])
+        if "script" in body:
+            SCRIPTS[body["script"]["source"]](source, body["script"].get("params", {}))
+        self.write(index, id, source)
+        return {"_id": id, "result": "updated"}
+
+    def delete(self, index, id, **kwargs):
+        self._lookup(index, id)
+        del self.docs[index][id]
+        return {"_id": id, "result": "deleted"}
+
+    def mget(self, body, **kwargs):
+        docs = []
+        for ref in body["docs"]:
+            found = ref["_id"] in self.docs.get(ref["_index"], {})
+            doc = self._hit(ref["_index"], ref["_id"]) if found else {"_index": ref["_index"], "_id": ref["_id"]}
+            docs.append({**doc, "found": found})
+        if self.on_mget is not None:
+            self.on_mget(self)
+        return {"docs": docs}
+
+    def delete_by_query(self, index, body, **kwargs):
+        for name in [index] if isinstance(index, str) else index:
+            for _id, source in list(self.sources(name).items()):
+                if _matches(body["query"], source):
+                    del self.docs[name][_id]
+        return {}
+
+    def count(self, index, body=None, **kwargs):
+        query = (body or {}).get("query")
+        return {"count": sum(1 for source in self.sources(index).values() if _matches(query, source))}
+
+    def open_point_in_time(self, index, **kwargs):
+        return {"id": index}
+
+    def close_point_in_time(self, body=None, **kwargs):
+        return {}
+
+    def search(self, body=None, **kwargs):
+        request = {**kwargs, **(body or {})}
+        self.searches.append(request)
+        if self.search_response is not None:
+            if isinstance(self.search_response, Exception):
+                raise self.search_response
+            return self.search_response
+        index = request["pit"]["id"] if "pit" in request else request["index"]
+        start = request["search_after"][0] + 1 if "search_after" in request else 0
+        hits = []
+        for position, (_id, source) in enumerate(self.sources(index).items()):
+            if position < start or not _matches(request.get("query"), source):
+                continue
+            if "_source" in request:
+                source = {key: value for key, value in source.items() if key in request["_source"]}
+            hits.append({"_index": index, "_id": _id, "_source": source, "sort": [position]})
+        return {"hits": {"hits": hits[: request.get("size", 10)]}}
+
+    def bulk(self, body, **kwargs):
+        self.bulk_requests += 1
+        lines = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = []
+        while lines:
+            (op, meta), = lines.pop(0).items()
+            payload = lines.pop(0) if op != "delete" else None
+            items.append({op: self._bulk_item(op, meta, payload)})
+        return {"errors": any("error" in next(iter(item.values())) for item in items), "items": items}
+
+    def _bulk_item(self, op, meta, payload):
+        index, _id = meta["_index"], meta["_id"]
+        current = self.docs.get(index, {}).get(_id)
+        status, error = self.fail_ids.get(_id, (200, None))
+        if status == 200:
+            if op == "create" and current is not None:
+                status, error = 409, "version_conflict_engine_exception"
+            elif "if_seq_no" in meta and (current is None or current[1] != meta["if_seq_no"]):
+                status, error = 409, "version_conflict_engine_exception"
+            elif op in ("delete", "update") and current is None:
+                status, error = 404, "document_missing_exception"
+        if status != 200:
+            return {"_index": index, "_id": _id, "status": status, "error": {"type": error}}
+        if op == "delete":
+            del self.docs[index][_id]
+        elif op == "update":
+            self.write(index, _id, {**current[0], **payload["doc"]})
+        else:
+            self.write(index, _id, payload)
+        return {"_index": index, "_id": _id, "status": 201 if op == "create" else 200}
+
+
+class FakeAsyncES:
+    """AsyncElasticsearch over the same FakeES documents"""
+
+    def __init__(self, client):
+        self.client = client
+        self.transport = client.transport
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture
+def es(monkeypatch):
+    """a FakeES behind dao.kb_dao, with the per-process state of the DAOs reset"""
+    client = FakeES()
+    monkeypatch.setattr(kb_dao, "get_es_client", lambda: client)
+    monkeypatch.setattr(kb_dao, "get_async_es_client", lambda: FakeAsyncES(client))
+    monkeypatch.setattr(kb_dao, "_local_index", None)
+    monkeypatch.setattr(kb_dao, "_vector_backend", None)
+    monkeypatch.setattr(schema, "_cluster_version", None)
+    monkeypatch.setattr(schema, "_uuid_id_indices", set())
+    monkeypatch.setattr(schema, "_uuid_ids_checked_at", {})
+    return client
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from dao import kb_dao
+from models.kb import KB_INDEX
+from service import kb as kb_service
+from service.answer_cache import AnswerCache
+
+QUESTION_VECTORS = {
+    "q1": [1.0, 0.0, 0.0],
+    "q2": [0.0, 1.0, 0.0],
+}
+
+
+@pytest.fixture
+def qa(es, monkeypatch):
+    """qa_service against a kb doc in the fake ES, counting the LLM calls"""
+    es.write(KB_INDEX, "kb", {"uuid": "kb", "name": "kb", "owner_uuid": "owner", "create_at": 0, "update_at": 0})
+    llm_calls = []
+
+    async def acreate_embeddings(text):
+        return QUESTION_VECTORS[text]
+
+    async def acreate_embeddings_batch(texts):
+        return [[0.0, 0.0, 1.0] for _ in texts]
+
+    async def retrieve(*args, **kwargs):
+        return []
+
+    async def achat_completion(messages):
+        llm_calls.append(messages)
+        return f"answer {len(llm_calls)}"
+
+    cache = AnswerCache(max_items=10, ttl=60, similarity=0.95)
+    monkeypatch.setattr(kb_service, "get_answer_cache", lambda: cache)
+    monkeypatch.setattr(kb_service, "acreate_embeddings", acreate_embeddings)
+    monkeypatch.setattr(kb_service, "acreate_embeddings_batch", acreate_embeddings_batch)
+    monkeypatch.setattr(kb_service, "_retrieve_context_chunks", retrieve)
+    monkeypatch.setattr(kb_service, "achat_completion", achat_completion)
+
+    def ask(question, **kwargs):
+        return asyncio.run(kb_service.qa_service("owner", "kb", question, mode="vector", **kwargs))
+
+    def content_write():
+        # what every doc/vector write does, aged past the ES refresh window
+        kb_dao.bump_kb_generation("kb")
+        es.update(KB_INDEX, "kb", doc={"generation_at": es.sources(KB_INDEX)["kb"]["generation_at"] - 5000})
+
+    ask.llm_calls = llm_calls
+    ask.content_write = content_write
+    return ask
+
+
+def test_write_back_keeps_earlier_answers(qa):
+    first = qa("q1")
+    qa("q2")
+    again = qa("q1")
+
+    assert again.cached
+    assert again.answer == first.answer
+    assert len(qa.llm_calls) == 2
+
+
+def test_content_write_invalidates_answers(qa):
+    qa("q1")
+    qa.content_write()
+
+    reply = qa("q1")
+
+    assert not reply.cached
+    assert len(qa.llm_calls) == 2
+
+
+def test_bypass_cache_asks_again(qa):
+    qa("q1")
+
+    reply = qa("q1", bypass_cache=True)
+
+    assert not reply.cached
+    assert qa("q1").answer == reply.answer
+    assert len(qa.llm_calls) == 2
@@ -0,0 +1,116 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from service import archive, ingest
+
+
+def _zip(tmp_path, members):
+    path = str(tmp_path / "upload.zip")
+    with zipfile.ZipFile(path, "w") as out:
+        for name, data in members.items():
+            out.writestr(name, data)
+    return path
+
+
+def _unpack(path):
+    return list(archive.iter_archive_members(path, "upload.zip", path + ".d"))
+
+
+def test_members_are_unpacked_and_hashed(tmp_path):
+    path = _zip(tmp_path, {"docs/a.md": "# A\n\nalpha", "b.txt": "beta"})
+
+    members = _unpack(path)
+
+    assert [member["name"] for member in members] == ["docs/a.md", "b.txt"]
+    with open(members[0]["path"], encoding="utf-8") as unpacked:
+        assert unpacked.read() == "# A\n\nalpha"
+    assert members[0]["sha256"] != members[1]["sha256"]
+
+
+def test_hidden_members_are_dropped_and_unsupported_ones_skipped(tmp_path):
+    path = _zip(tmp_path, {"__MACOSX/._a.md": "fork", "docs/.DS_Store": "x", "tool.exe": "MZ", "a.md": "alpha"})
+
+    members = _unpack(path)
+
+    assert [(member["name"], member["error"]) for member in members] == [
+        ("tool.exe", "unsupported format, skipped"),
+        ("a.md", None),
+    ]
+    assert members[0]["path"] is None
+
+
+def test_too_large_members_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "UPLOAD_MAX_BYTES", 8)
+    path = _zip(tmp_path, {"big.txt": "x" * 9, "small.txt": "x" * 8})
+
+    members = _unpack(path)
+
+    assert [(member["name"], member["error"]) for member in members] == [
+        ("big.txt", "file too large, skipped"),
+        ("small.txt", None),
+    ]
+    assert sorted(os.listdir(path + ".d")) == ["2.txt"]
+
+
+@pytest.mark.parametrize(
+    "limit, value, message",
+    [("ARCHIVE_MAX_MEMBERS", 2, "more than 2 files"), ("ARCHIVE_MAX_UNPACKED_BYTES", 10, "unpacks to more than")],
+)
+def test_archive_limits_stop_the_unpack(tmp_path, monkeypatch, limit, value, message):
+    monkeypatch.setattr(archive, limit, value)
+    path = _zip(tmp_path, {f"{n}.txt": "x" * 6 for n in range(3)})
+
+    with pytest.raises(ValueError, match=message):
+        _unpack(path)
+
+
+@pytest.fixture
+def archive_job(tmp_path, monkeypatch):
+    """_run_archive_job with parses on threads and a recording ingest_documents"""
+    updates, ingested = [], []
+
+    def ingest_documents(kb_uuid, docs, summary=None, on_progress=None, source=None, **kwargs):
+        ingested.append((source, [doc["content"] for doc in docs]))
+        return {"total": len(docs), "processed": len(docs), "success": len(docs), "failed": 0, "errors": []}
+
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(ingest, "get_parse_processes", lambda: pool)
+    monkeypatch.setattr(ingest, "update_job", lambda job_uuid, fields: updates.append(fields))
+    monkeypatch.setattr(ingest, "ingest_documents", ingest_documents)
+
+    def run(members, files=None):
+        path = _zip(tmp_path, members)
+        job = {"uuid": "6f1f7a52-3c1e-4a57-9f0b-2d9b3f0c1a11", "kb_uuid": "kb", "filename": "upload.zip"}
+        ingest._run_archive_job({**job, "file_path": path, "files": files or []})
+        return updates[-1]
+
+    run.ingested = ingested
+    yield run
+    pool.shutdown()
+
+
+def test_archive_job_imports_identical_members_once(archive_job):
+    result = archive_job({"a.txt": "same text", "copy/a.txt": "same text", "b.txt": "other text"})
+
+    assert result["status"] == "succeeded"
+    assert [source for source, _ in archive_job.ingested] == ["a.txt", "b.txt"]
+    files = {entry["name"]: entry for entry in result["files"]}
+    assert {name: entry["status"] for name, entry in files.items()} == {
+        "a.txt": "done",
+        "copy/a.txt": "duplicate",
+        "b.txt": "done",
+    }
+    assert files["copy/a.txt"]["error"] == "same content as a.txt"
+    assert result["success"] == 2
+
+
+def test_resumed_archive_job_skips_finished_members(archive_job):
+    done = {"name": "a.txt", "sha256": "finished", "status": "done", "docs": 1, "processed": 1, "success": 1}
+
+    result = archive_job({"a.txt": "first", "b.txt": "second"}, files=[done])
+
+    assert [source for source, _ in archive_job.ingested] == ["b.txt"]
+    assert result["success"] == 2
@@ -0,0 +1,49 @@
+from dao import kb_dao
+from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX
+
+
+def _doc(n):
+    return {"uuid": f"doc-{n}", "kb_uuid": "kb", "title": f"Doc {n}", "content": "text"}
+
+
+def _vector(n):
+    return {"uuid": f"vec-{n}", "chunk": "text", "embedding": [1.0, 0.0], "create_at": 0}
+
+
+def test_bulk_create_docs_splits_requests_and_keys_docs_by_uuid(es):
+    errors = kb_dao.bulk_create_docs([_doc(n) for n in range(5)], chunk_size=2)
+
+    assert errors == []
+    assert es.bulk_requests == 3
+    assert set(es.sources(KB_DOC_INDEX)) == {f"doc-{n}" for n in range(5)}
+
+
+def test_bulk_write_reports_failed_items_and_keeps_the_rest(es):
+    es.fail_ids = {"doc-1": (429, "es_rejected_execution_exception")}
+
+    errors = kb_dao.bulk_create_docs([_doc(n) for n in range(3)])
+
+    assert [(error["uuid"], error["status"]) for error in errors] == [("doc-1", 429)]
+    assert set(es.sources(KB_DOC_INDEX)) == {"doc-0", "doc-2"}
+
+
+def test_bulk_upsert_replaces_the_vectors_of_its_docs(es):
+    es.write(KB_DOC_EMBED_INDEX, "old", {"uuid": "old", "kb_uuid": "kb", "doc_uuid": "doc-0"})
+    es.write(KB_DOC_EMBED_INDEX, "other", {"uuid": "other", "kb_uuid": "kb", "doc_uuid": "doc-9"})
+    es.fail_ids = {"vec-2": (400, "mapper_parsing_exception")}
+
+    errors = kb_dao.bulk_upsert_doc_embeddings("kb", {"doc-0": [_vector(1)], "doc-1": [_vector(2)]})
+
+    assert [(error["uuid"], error["doc_uuid"]) for error in errors] == [("vec-2", "doc-1")]
+    assert set(es.sources(KB_DOC_EMBED_INDEX)) == {"other", "vec-1"}
+    assert es.sources(KB_DOC_EMBED_INDEX)["vec-1"]["doc_uuid"] == "doc-0"
+
+
+def test_bulk_writes_leave_the_generation_to_the_caller(es):
+    es.write(KB_INDEX, "kb", {"uuid": "kb"})
+
+    kb_dao.bulk_create_docs([_doc(0)], invalidate=False)
+    assert "generation" not in es.sources(KB_INDEX)["kb"]
+
+    kb_dao.bulk_create_docs([_doc(1)])
+    assert es.sources(KB_INDEX)["kb"]["generation"] == 1
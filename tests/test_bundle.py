@@ -0,0 +1,122 @@
+import io
+
+import numpy as np
+import pytest
+
+from models.kb import KB_INDEX, KB_DOC_INDEX, KB_DOC_EMBED_INDEX, EMBEDDING_DIMS
+from service import kb as kb_service
+from service.bundle import BundleReader
+
+
+def _kb(es, kb_uuid):
+    kb = {"uuid": kb_uuid, "name": kb_uuid, "owner_uuid": "owner", "create_at": 0, "update_at": 0}
+    es.write(KB_INDEX, kb_uuid, kb)
+
+
+@pytest.fixture
+def source_kb(es):
+    """kb "src" with two docs of one imported file and a vector per chunk"""
+    _kb(es, "src")
+    rng = np.random.default_rng(0)
+    for n in range(2):
+        doc_uuid = f"doc-{n}"
+        es.write(
+            KB_DOC_INDEX,
+            doc_uuid,
+            {
+                "uuid": doc_uuid,
+                "kb_uuid": "src",
+                "title": f"Section {n}",
+                "content": f"content {n}",
+                "source": "guide.md",
+                "section": f"Section {n}",
+                "content_hash": f"hash-{n}",
+                "create_at": 1,
+                "update_at": 1,
+            },
+        )
+        for position in range(2):
+            vec_uuid = f"vec-{n}-{position}"
+            es.write(
+                KB_DOC_EMBED_INDEX,
+                vec_uuid,
+                {
+                    "uuid": vec_uuid,
+                    "kb_uuid": "src",
+                    "doc_uuid": doc_uuid,
+                    "chunk": f"chunk {n} {position}",
+                    "embedding": rng.standard_normal(EMBEDDING_DIMS).tolist(),
+                    "tokens": 3,
+                    "doc_title": f"Section {n}",
+                    "position": position,
+                    "create_at": 1,
+                },
+            )
+    return es
+
+
+def _export(kb_uuid, embedding_format):
+    bundle = kb_service.export_kb_service("owner", kb_uuid, embedding_format)
+    return io.BytesIO(b"".join(bundle["content"]))
+
+
+@pytest.mark.parametrize(
+    "embedding_format, tolerance", [("float32", 1e-6), ("float16", 1e-3), ("int8", 1e-2), ("json", 0)]
+)
+def test_export_reads_back_every_vector(source_kb, embedding_format, tolerance):
+    reader = BundleReader(_export("src", embedding_format))
+
+    assert reader.manifest["counts"] == {"documents": 2, "embeddings": 4}
+    assert {doc["uuid"] for doc in reader.iter_documents()} == {"doc-0", "doc-1"}
+    stored = source_kb.sources(KB_DOC_EMBED_INDEX)
+    rows = list(reader.iter_embeddings())
+    assert {row["uuid"] for row in rows} == set(stored)
+    for row in rows:
+        vector = stored[row["uuid"]]
+        expected = np.asarray(vector["embedding"])
+        assert np.abs(np.asarray(row["embedding"]) - expected).max() <= tolerance * np.abs(expected).max()
+        assert (row["doc_title"], row["position"]) == (vector["doc_title"], vector["position"])
+
+
+def test_restore_into_another_kb_keeps_doc_and_chunk_metadata(source_kb):
+    _kb(source_kb, "dst")
+
+    summary = kb_service.restore_kb_service("owner", "dst", _export("src", "int8"))
+
+    assert (summary["documents"], summary["embeddings"], summary["remapped"]) == (2, 4, True)
+    docs = {doc["section"]: doc for doc in source_kb.sources(KB_DOC_INDEX).values() if doc["kb_uuid"] == "dst"}
+    assert {section: (doc["source"], doc["content_hash"]) for section, doc in docs.items()} == {
+        "Section 0": ("guide.md", "hash-0"),
+        "Section 1": ("guide.md", "hash-1"),
+    }
+    vectors = [vec for vec in source_kb.sources(KB_DOC_EMBED_INDEX).values() if vec["kb_uuid"] == "dst"]
+    assert sorted((vec["doc_title"], vec["position"], vec["tokens"]) for vec in vectors) == [
+        ("Section 0", 0, 3),
+        ("Section 0", 1, 3),
+        ("Section 1", 0, 3),
+        ("Section 1", 1, 3),
+    ]
+    assert {vec["doc_uuid"] for vec in vectors} == {doc["uuid"] for doc in docs.values()}
+
+
+def test_restore_into_the_same_kb_replaces_its_docs(source_kb):
+    bundle = _export("src", "float32")
+    before = source_kb.sources(KB_DOC_EMBED_INDEX)
+
+    summary = kb_service.restore_kb_service("owner", "src", bundle)
+
+    assert (summary["documents"], summary["embeddings"], summary["remapped"]) == (2, 4, False)
+    assert set(source_kb.sources(KB_DOC_INDEX)) == {"doc-0", "doc-1"}
+    after = source_kb.sources(KB_DOC_EMBED_INDEX)
+    assert set(after) == set(before)
+    assert np.allclose(after["vec-1-1"]["embedding"], before["vec-1-1"]["embedding"])
+
+
+def test_restore_caps_the_error_list(source_kb):
+    bundle = _export("src", "float32")
+    source_kb.fail_ids = {key: (400, "mapper_parsing_exception") for key in source_kb.sources(KB_DOC_EMBED_INDEX)}
+
+    summary = kb_service.restore_kb_service("owner", "src", bundle, max_errors=2)
+
+    assert summary["failed"] == 4
+    assert len(summary["errors"]) == 2
@@ -0,0 +1,26 @@
+from service.chunker import FixedChunker, StructureChunker, count_tokens
+
+TEXT = "\n\n".join(
+    [
+        "# Errors",
+        " ".join(f"Code E{n} means the request was rejected by stage {n}." for n in range(12)),
+        "| code | meaning |\n|---|---|\n" + "\n".join(f"| E{n} | stage {n} failed |" for n in range(20)),
+        "```\n" + "\n".join(f"retry(stage={n}, backoff={n * 2})" for n in range(10)) + "\n```",
+        "错误代码说明。" * 30,
+        "x" * 500,
+    ]
+)
+
+
+def test_structure_chunks_stay_within_budget_with_separators():
+    for max_tokens, overlap_tokens in ((16, 8), (50, 10), (120, 40)):
+        chunks = StructureChunker(max_tokens, overlap_tokens).split(TEXT)
+
+        assert chunks
+        assert max(count_tokens(chunk) for chunk in chunks) <= max_tokens
+
+
+def test_fixed_chunker_slices_two_chars_per_token():
+    chunks = FixedChunker(200, 0).split("a" * 1000)
+
+    assert [len(chunk) for chunk in chunks] == [400, 400, 200]
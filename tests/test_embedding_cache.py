@@ -0,0 +1,25 @@
+import asyncio
+
+from service.embedding_cache import EmbeddingCache
+
+
+def test_async_path_reads_the_disk_tier(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(max_items=10, ttl=0, db_path=path).put_many({"a": [1.0], "b": [2.0]})
+    cache = EmbeddingCache(max_items=10, ttl=0, db_path=path)
+
+    found = asyncio.run(cache.aget_many(["a", "b", "c"]))
+
+    assert found == {"a": [1.0], "b": [2.0]}
+    stats = cache.stats()
+    assert (stats["db_hits"], stats["misses"], stats["size"]) == (2, 1, 2)
+
+
+def test_db_size_counts_new_rows_only(tmp_path):
+    cache = EmbeddingCache(max_items=10, ttl=0, db_path=str(tmp_path / "embeddings.db"))
+
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    asyncio.run(cache.aput_many({"b": [3.0], "c": [4.0]}))
+
+    assert cache.stats()["db_size"] == 3
+    assert cache.get_many(["b"]) == {"b": [3.0]}
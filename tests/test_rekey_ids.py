@@ -0,0 +1,63 @@
+from dao import kb_dao, migrations, schema
+from models.kb import KB_DOC_INDEX
+
+INDEX = KB_DOC_INDEX
+
+
+def _rekey(es, ids=None):
+    stats = {"scanned": 0, "rekeyed": 0, "failed": 0}
+    batch = [{"_index": INDEX, "_id": _id} for _id in ids or list(es.docs[INDEX])]
+    migrations._rekey_batch(es, INDEX, batch, stats)
+    return stats
+
+
+def _titles(es):
+    return {_id: source["title"] for _id, source in es.sources(INDEX).items()}
+
+
+def test_rekey_moves_documents_to_uuid_ids(es):
+    es.write(INDEX, "es-1", {"uuid": "a", "title": "one"})
+    es.write(INDEX, "es-2", {"uuid": "b", "title": "two"})
+
+    stats = _rekey(es)
+
+    assert stats["rekeyed"] == 2
+    assert _titles(es) == {"a": "one", "b": "two"}
+
+
+def test_rekey_keeps_a_write_made_during_the_copy(es):
+    es.write(INDEX, "es-1", {"uuid": "a", "title": "old"})
+
+    def app_write(fake):
+        # the application updates the old copy right after it was read
+        fake.on_mget = None
+        fake.write(INDEX, "es-1", {"uuid": "a", "title": "new"})
+
+    es.on_mget = app_write
+
+    stats = _rekey(es)
+
+    assert stats == {"scanned": 0, "rekeyed": 1, "failed": 0}
+    assert _titles(es) == {"a": "new"}
+
+
+def test_rekey_prefers_uuid_copy_written_by_the_application(es):
+    es.write(INDEX, "es-1", {"uuid": "a", "title": "old"})
+    es.write(INDEX, "a", {"uuid": "a", "title": "current"})
+
+    _rekey(es, ["es-1"])
+
+    assert _titles(es) == {"a": "current"}
+
+
+def test_lookups_stop_searching_by_uuid_once_rekeyed(es):
+    es.write(INDEX, "es-1", {"uuid": "a", "title": "old"})
+    assert kb_dao.get_doc("a")["title"] == "old"  # found by the search fallback
+
+    _rekey(es)
+    schema.mark_uuid_ids(es, INDEX)
+    searches = len(es.searches)
+
+    assert kb_dao.get_doc("a")["title"] == "old"
+    assert kb_dao.get_doc("missing") is None
+    assert len(es.searches) == searches
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from service import kb as kb_service
+from service.retrieval import reciprocal_rank_fusion
+
+
+def _chunk(name, score):
+    return {"uuid": name, "doc_uuid": "doc", "chunk": name, "score": score}
+
+
+def test_chunks_in_both_lists_outrank_single_list_chunks():
+    vector = [_chunk("a", 0.9), _chunk("b", 0.8)]
+    bm25 = [_chunk("c", 12.0), _chunk("b", 7.5)]
+
+    fused = reciprocal_rank_fusion({"vector": vector, "bm25": bm25}, top_k=3, k=60)
+
+    assert [item["uuid"] for item in fused] == ["b", "a", "c"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 62)
+    assert (fused[0]["vector_score"], fused[0]["bm25_score"]) == (0.8, 7.5)
+    assert "bm25_score" not in fused[1]
+
+
+def test_fusion_keeps_top_k():
+    ranked = [_chunk(str(n), 1.0 - n / 10) for n in range(5)]
+
+    fused = reciprocal_rank_fusion({"vector": ranked}, top_k=2)
+
+    assert [item["uuid"] for item in fused] == ["0", "1"]
+
+
+def test_chunks_without_uuid_are_matched_on_doc_and_text():
+    vector = [{"doc_uuid": "doc", "chunk": "text", "score": 0.5}]
+    bm25 = [{"doc_uuid": "doc", "chunk": "text", "score": 3.0}, {"doc_uuid": "other", "chunk": "text", "score": 2.0}]
+
+    fused = reciprocal_rank_fusion({"vector": vector, "bm25": bm25}, top_k=5)
+
+    assert [(item["doc_uuid"], item.get("vector_score")) for item in fused] == [("doc", 0.5), ("other", None)]
+
+
+def test_hybrid_retrieval_survives_a_failed_bm25_query(monkeypatch):
+    async def acreate_embeddings(text):
+        return [1.0]
+
+    async def avector_search(kb_uuid, query_vector, top_k, score_threshold=None):
+        return [_chunk("a", 0.9), _chunk("b", 0.8)]
+
+    async def asearch_chunks_fulltext(kb_uuid, query, size):
+        raise ConnectionError("es down")
+
+    monkeypatch.setattr(kb_service, "acreate_embeddings", acreate_embeddings)
+    monkeypatch.setattr(kb_service, "_avector_search", avector_search)
+    monkeypatch.setattr(kb_service, "asearch_chunks_fulltext", asearch_chunks_fulltext)
+    timings = {}
+
+    results = asyncio.run(kb_service._aretrieve("kb", "E1234", 1, mode="hybrid", timings=timings))
+
+    assert [item["uuid"] for item in results] == ["a"]
+    assert set(timings) == {"embed", "vector", "bm25", "fuse"}
@@ -0,0 +1,103 @@
+import uuid
+
+import pytest
+
+from models.kb import KB_DOC_INDEX, KB_DOC_EMBED_INDEX
+from service import kb as kb_service
+from service.chunker import chunk_uuids, get_chunker
+
+KB_UUID = str(uuid.uuid4())
+
+
+@pytest.fixture
+def store(es, monkeypatch):
+    """sync_documents against the docs and vectors of one kb in the fake ES"""
+    embedded = []
+    chunker = get_chunker(16, 0, "fixed")  # 32 char chunks
+
+    def import_doc(title, content, section, doc_uuid=None):
+        # what ingest_documents writes for a source-tagged import
+        doc_uuid = doc_uuid or str(uuid.uuid4())
+        es.write(
+            KB_DOC_INDEX,
+            doc_uuid,
+            {
+                "uuid": doc_uuid,
+                "kb_uuid": KB_UUID,
+                "title": title,
+                "content": content,
+                "source": "guide.md",
+                "section": section,
+                "content_hash": kb_service._content_hash(title, content),
+                "create_at": len(es.sources(KB_DOC_INDEX)) + 1,
+            },
+        )
+        chunks = chunker.split(content)
+        for position, chunk_uuid in enumerate(chunk_uuids(doc_uuid, chunks)):
+            vector = {"uuid": chunk_uuid, "kb_uuid": KB_UUID, "doc_uuid": doc_uuid}
+            es.write(KB_DOC_EMBED_INDEX, chunk_uuid, {**vector, "doc_title": title, "position": position})
+        return doc_uuid
+
+    def create_embeddings_batch(texts):
+        embedded.extend(texts)
+        return [[1.0] for _ in texts]
+
+    monkeypatch.setattr(kb_service, "_load_kb_chunker", lambda kb_uuid: chunker)
+    monkeypatch.setattr(kb_service, "create_embeddings_batch", create_embeddings_batch)
+
+    def sync(payloads):
+        return kb_service.sync_documents(KB_UUID, "guide.md", payloads)
+
+    sync.import_doc = import_doc
+    sync.docs = lambda: es.sources(KB_DOC_INDEX)
+    sync.vectors = lambda: es.sources(KB_DOC_EMBED_INDEX)
+    sync.embedded = embedded
+    return sync
+
+
+def test_first_sync_after_import_keeps_docs(store):
+    intro = store.import_doc("Intro", "hello world", "Intro")
+    usage = store.import_doc("Usage", "run it", "Usage")
+
+    summary = store([{"title": "Intro", "content": "hello world"}, {"title": "Usage", "content": "run it again"}])
+
+    assert set(store.docs()) == {intro, usage}
+    assert summary["unchanged"] == 1
+    assert summary["updated"] == 1
+    assert summary["deleted"] == 0
+    assert store.embedded == ["run it again"]
+
+
+def test_sync_drops_duplicate_imports_of_a_section(store):
+    first = store.import_doc("Intro", "hello world", "Intro")
+    store.import_doc("Intro", "hello world", "Intro")
+
+    summary = store([{"title": "Intro", "content": "hello world"}])
+
+    assert set(store.docs()) == {first}
+    assert summary["deleted"] == 1
+    assert not store.embedded
+
+
+def test_sync_refreshes_reused_chunk_meta(store):
+    doc_uuid = store.import_doc("Intro", "a" * 32 + "b" * 32, "Intro")
+
+    summary = store([{"title": "Intro", "content": "c" * 32 + "a" * 32 + "b" * 32}])
+
+    wanted = chunk_uuids(doc_uuid, ["c" * 32, "a" * 32, "b" * 32])
+    assert [store.vectors()[chunk_uuid]["position"] for chunk_uuid in wanted] == [0, 1, 2]
+    assert summary["chunks_reused"] == 2
+    assert store.embedded == ["c" * 32]
+
+
+def test_sync_reads_a_generator_group_by_group(store, monkeypatch):
+    monkeypatch.setattr(kb_service, "IMPORT_EMBED_DOC_GROUP", 2)
+
+    def pages():
+        for idx in range(5):
+            yield {"title": "Page", "content": f"page {idx}"}
+
+    summary = store(pages())
+
+    assert summary["total"] == summary["created"] == 5
+    assert sorted(doc["section"] for doc in store.docs().values()) == ["Page", "Page#2", "Page#3", "Page#4", "Page#5"]
@@ -0,0 +1,63 @@
+import pytest
+from elasticsearch.exceptions import RequestError
+
+from dao import kb_dao
+from models.kb import KB_DOC_EMBED_INDEX
+
+
+def _hits(score):
+    return {"hits": {"hits": [{"_source": {"kb_uuid": "kb", "doc_uuid": "doc", "chunk": "text"}, "_score": score}]}}
+
+
+@pytest.fixture
+def auto(es, monkeypatch):
+    monkeypatch.setattr(kb_dao, "VECTOR_SEARCH_BACKEND", "auto")
+    return es
+
+
+def _index_embedding(es, indexed):
+    es.indices.mappings[KB_DOC_EMBED_INDEX] = {"properties": {"embedding": {"type": "dense_vector", "index": indexed}}}
+
+
+def test_knn_on_a_cluster_with_an_indexed_embedding_field(auto):
+    auto.version = "8.11.0"
+    _index_embedding(auto, True)
+
+    assert kb_dao.get_vector_backend(auto).name == "knn"
+
+
+@pytest.mark.parametrize("version, indexed", [("7.17.12", True), ("8.11.0", False)])
+def test_script_score_otherwise(auto, version, indexed):
+    auto.version = version
+    _index_embedding(auto, indexed)
+
+    assert kb_dao.get_vector_backend(auto).name == "script_score"
+
+
+def test_both_backends_return_cosine_similarity(auto):
+    auto.search_response = _hits(1.5)
+    assert kb_dao.ScriptScoreBackend().search(auto, "kb", [1.0], 1)[0]["_score"] == pytest.approx(0.5)
+
+    # knn cosine scores are (1 + cosine) / 2
+    auto.search_response = _hits(0.75)
+    assert kb_dao.KnnBackend().search(auto, "kb", [1.0], 1)[0]["_score"] == pytest.approx(0.5)
+    knn = auto.searches[-1]["knn"]
+    assert (knn["k"], knn["num_candidates"], knn["filter"]) == (1, 100, {"term": {"kb_uuid": "kb"}})
+
+
+def test_rejected_knn_query_falls_back_to_script_score(auto, monkeypatch):
+    monkeypatch.setattr(kb_dao, "_vector_backend", kb_dao.KnnBackend())
+    calls = []
+
+    def search(body=None, **kwargs):
+        calls.append(body or kwargs)
+        if len(calls) == 1:
+            raise RequestError(400, "search_phase_execution_exception", {})
+        return _hits(1.5)
+
+    auto.search = search
+
+    results = kb_dao.search_doc_embeddings_by_vector("kb", [1.0], top_k=1)
+
+    assert "knn" in calls[0] and "script_score" in calls[1]["query"]
+    assert results[0]["score"] == pytest.approx(0.5)